@@ -1,12 +1,21 @@
 import os
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from deletions import NOT_DELETED
+from metrics import registry
 
 # Load environment variables
 load_dotenv()
@@ -19,6 +28,18 @@ REFRESH_TOKEN_EXPIRE_DAYS = 30
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt is deliberately slow, so hashing runs on a small dedicated pool instead of the event loop.
+# Requests beyond the queue limit are rejected with 503 rather than piling up behind the pool.
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get("PASSWORD_HASH_QUEUE_LIMIT", 32))
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending_hash_jobs = 0
+
+hash_queue_depth = registry.gauge("password_hash.queue_depth")
+hash_latency_ms = registry.histogram("password_hash.latency_ms")
+hash_wait_ms = registry.histogram("password_hash.wait_ms")
+hash_rejected = registry.counter("password_hash.rejected")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/users/token")
 
 class TokenData(BaseModel):
@@ -30,6 +51,42 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def _timed(func, queued_at, *args):
+    started_at = time.perf_counter()
+    hash_wait_ms.observe((started_at - queued_at) * 1000)
+    try:
+        return func(*args)
+    finally:
+        hash_latency_ms.observe((time.perf_counter() - started_at) * 1000)
+
+async def _run_hash_job(func, *args):
+    """Runs a bcrypt call on the hashing pool, shedding load once the queue limit is reached."""
+    global _pending_hash_jobs
+    if _pending_hash_jobs >= PASSWORD_HASH_QUEUE_LIMIT:
+        hash_rejected.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+    _pending_hash_jobs += 1
+    hash_queue_depth.set(_pending_hash_jobs)
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, _timed, func, time.perf_counter(), *args)
+    finally:
+        _pending_hash_jobs -= 1
+        hash_queue_depth.set(_pending_hash_jobs)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_hash_job(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_hash_job(get_password_hash, password)
+
+def shutdown_password_hasher():
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
+
 def create_access_token(data: dict):
     """Creates a short-lived access token."""
     to_encode = data.copy()
@@ -44,13 +101,27 @@ def create_refresh_token(data: dict):
     to_encode.update({"exp": expire, "scope": "refresh_token"})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
-    """Dependency to get the current user's ID from an access token."""
-    credentials_exception = HTTPException(
+# Cache of already-verified access tokens: sha256(token) -> [user_id, exp, active_until].
+# Repeat requests with the same token skip the signature check until the token expires.
+# `active_until` (monotonic time) caches the check that the user is not tombstoned: read requests
+# trust it for USER_STATE_TTL_SECONDS, write requests always check the users collection.
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", 4096))
+USER_STATE_TTL_SECONDS = float(os.environ.get("USER_STATE_TTL_SECONDS", 30))
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+_verified_tokens: "OrderedDict[bytes, list]" = OrderedDict()
+token_cache_hits = registry.counter("auth.token_cache.hits")
+token_cache_misses = registry.counter("auth.token_cache.misses")
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def verify_access_token(token: str) -> tuple:
+    """Fully decodes and verifies an access token, returning (user_id, exp)."""
+    credentials_exception = _credentials_exception()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         if payload.get("scope") != "access_token":
@@ -60,4 +131,64 @@ async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    return user_id, payload.get("exp")
+
+def verify_refresh_token(token: str) -> Optional[str]:
+    """Decodes a refresh token and returns its user_id, or None when it is invalid."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("scope") != "refresh_token":
+        return None
+    return payload.get("sub")
+
+def clear_token_cache():
+    _verified_tokens.clear()
+
+def forget_user(user_id: str):
+    """Drops the cached tokens of a user, so this process checks their state again on the next request."""
+    for digest in [digest for digest, entry in _verified_tokens.items() if entry[0] == user_id]:
+        del _verified_tokens[digest]
+
+def _token_entry(token: str) -> list:
+    """The cache entry of a valid access token, verifying the token on a cache miss."""
+    digest = hashlib.sha256(token.encode()).digest()
+    cached = _verified_tokens.get(digest)
+    if cached is not None:
+        if cached[1] > time.time():
+            _verified_tokens.move_to_end(digest)
+            token_cache_hits.inc()
+            return cached
+        # Expired since it was cached: drop it and let the full check reject it
+        del _verified_tokens[digest]
+
+    token_cache_misses.inc()
+    user_id, exp = verify_access_token(token)
+    entry = [user_id, exp, 0.0]
+    if isinstance(exp, (int, float)):
+        _verified_tokens[digest] = entry
+        if len(_verified_tokens) > TOKEN_CACHE_MAX_ENTRIES:
+            _verified_tokens.popitem(last=False)
+    return entry
+
+def user_id_from_token(token: str) -> str:
+    """The user ID of a valid access token, checked through the verified-token cache."""
+    return _token_entry(token)[0]
+
+async def get_current_user_id(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+) -> str:
+    """Dependency to get the current user's ID from an access token."""
+    entry = _token_entry(token)
+    user_id = entry[0]
+    # Tokens stay valid after their user is tombstoned; refuse them so nothing is written for a user
+    # whose data is being (or has been) deleted. Reads may rely on a recent check.
+    now = time.monotonic()
+    if request.method not in READ_METHODS or entry[2] <= now:
+        if not await db.users.find_one({"_id": user_id, **NOT_DELETED}, {"_id": 1}):
+            raise _credentials_exception()
+        entry[2] = now + USER_STATE_TTL_SECONDS
     return user_id
@@ -0,0 +1,109 @@
+from collections import defaultdict
+from typing import Iterable, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from native_types import AMOUNT_CENTS, CENTS, amount_cents_of
+
+# Each account document carries running totals of its transactions:
+#   transaction_net_cents = sum(income) - sum(expense), in integer cents
+#   transaction_count     = number of transactions
+# The live balance is the account's opening `balance` plus the net (see models.account.Account).
+# The write path keeps the totals up to date; migration 0004 sets them for the accounts whose
+# transactions were written before that. Until it has run, the account routes compute them instead.
+BALANCES_MIGRATION = "0004"
+
+
+def _signed_cents(doc: dict) -> int:
+    cents = amount_cents_of(doc)
+    return cents if doc.get("type") == "income" else -cents
+
+
+def _collect_deltas(added: Iterable[dict], removed: Iterable[dict]) -> dict:
+    deltas = defaultdict(lambda: [0, 0])
+    for doc in added:
+        if doc.get("account_id"):
+            delta = deltas[(doc["user_id"], doc["account_id"])]
+            delta[0] += _signed_cents(doc)
+            delta[1] += 1
+    for doc in removed:
+        if doc.get("account_id"):
+            delta = deltas[(doc["user_id"], doc["account_id"])]
+            delta[0] -= _signed_cents(doc)
+            delta[1] -= 1
+    return deltas
+
+
+async def apply_transaction_changes(
+    db: AsyncIOMotorDatabase,
+    added: Iterable[dict] = (),
+    removed: Iterable[dict] = (),
+):
+    """Atomically adjusts the running totals of every account touched by the written transactions."""
+    deltas = _collect_deltas(added, removed)
+    operations = [
+        UpdateOne(
+            {"id": account_id, "user_id": user_id},
+            {"$inc": {"transaction_net_cents": net_cents, "transaction_count": count}},
+        )
+        for (user_id, account_id), (net_cents, count) in deltas.items()
+        if count or net_cents
+    ]
+    if operations:
+        await db.accounts.bulk_write(operations, ordered=False)
+
+
+async def _transaction_totals(db: AsyncIOMotorDatabase, match_query: dict) -> dict:
+    """Recomputes {(user_id, account_id): {transaction_net_cents, transaction_count}} from the raw transactions."""
+    pipeline = [
+        {"$match": {**match_query, "account_id": {"$ne": None}}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "account_id": "$account_id"},
+            "transaction_net_cents": {"$sum": {"$cond": [{"$eq": ["$type", "income"]}, AMOUNT_CENTS, {"$multiply": [AMOUNT_CENTS, -1]}]}},
+            "transaction_count": {"$sum": 1},
+        }},
+    ]
+    totals = {}
+    async for result in db.transactions.aggregate(pipeline, allowDiskUse=True):
+        key = (result["_id"]["user_id"], result["_id"]["account_id"])
+        totals[key] = {"transaction_net_cents": result["transaction_net_cents"], "transaction_count": result["transaction_count"]}
+    return totals
+
+
+async def with_computed_totals(db: AsyncIOMotorDatabase, user_id: str, accounts: List[dict]) -> List[dict]:
+    """Overwrites the stored running totals of the user's account documents with recomputed ones."""
+    totals = await _transaction_totals(db, {"user_id": user_id})
+    for account in accounts:
+        account.update(totals.get((user_id, account["id"]), {"transaction_net_cents": 0, "transaction_count": 0}))
+    return accounts
+
+
+async def reconcile_balances(db: AsyncIOMotorDatabase, user_id: Optional[str] = None, repair: bool = False) -> List[dict]:
+    """
+    Recomputes every account's running totals from the raw transactions and returns the accounts
+    that drifted. With `repair`, the stored totals are overwritten with the recomputed ones.
+    """
+    match_query = {"user_id": user_id} if user_id else {}
+    expected = await _transaction_totals(db, match_query)
+
+    drifted, repairs = [], []
+    projection = {"_id": 0, "id": 1, "user_id": 1, "transaction_net_cents": 1, "transaction_count": 1}
+    async for account in db.accounts.find(match_query, projection):
+        raw = expected.get((account["user_id"], account["id"]), {})
+        net_cents = raw.get("transaction_net_cents", 0)
+        count = raw.get("transaction_count", 0)
+        stored_cents = account.get("transaction_net_cents", 0)
+        if count != account.get("transaction_count", 0) or net_cents != stored_cents:
+            drifted.append({
+                "user_id": account["user_id"],
+                "account_id": account["id"],
+                "stored": {"transaction_net": stored_cents / CENTS, "transaction_count": account.get("transaction_count", 0)},
+                "expected": {"transaction_net": net_cents / CENTS, "transaction_count": count},
+            })
+            repairs.append(UpdateOne(
+                {"id": account["id"], "user_id": account["user_id"]},
+                {"$set": {"transaction_net_cents": net_cents, "transaction_count": count}},
+            ))
+
+    if repair and repairs:
+        await db.accounts.bulk_write(repairs, ordered=False)
+    return drifted
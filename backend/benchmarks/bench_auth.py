@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for per-request authentication overhead.
+
+Times the whole get_current_user_id dependency (token check plus the check that the user is not
+tombstoned) against an in-memory database (mongomock-motor):
+
+- uncached: every request verifies the JWT and reads the user, as without the token cache
+- cached GET: read requests reuse the verified token and the cached user state
+- cached POST: write requests reuse the verified token but always read the user
+
+Usage (from the backend/ directory):
+    python benchmarks/bench_auth.py [--iterations 20000] [--tokens 20]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from starlette.requests import Request  # noqa: E402
+import auth  # noqa: E402
+
+try:
+    from mongomock_motor import AsyncMongoMockClient
+except ImportError:
+    sys.exit("mongomock-motor is not installed.")
+
+
+def make_request(method):
+    return Request({"type": "http", "method": method, "headers": []})
+
+
+async def time_calls(db, tokens, iterations, method, use_cache):
+    request = make_request(method)
+    auth.clear_token_cache()
+    started = time.perf_counter()
+    for i in range(iterations):
+        if not use_cache:
+            auth.clear_token_cache()
+        await auth.get_current_user_id(request, tokens[i % len(tokens)], db)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--tokens", type=int, default=20, help="Distinct users/tokens in the request mix")
+    args = parser.parse_args()
+
+    db = AsyncMongoMockClient()["bench_auth"]
+    users = [f"user{i}@example.com" for i in range(args.tokens)]
+    await db.users.insert_many([{"_id": user, "email": user, "deleted_at": None} for user in users])
+    tokens = [auth.create_access_token({"sub": user}) for user in users]
+
+    results = [
+        ("uncached", await time_calls(db, tokens, args.iterations, "GET", use_cache=False)),
+        ("cached GET", await time_calls(db, tokens, args.iterations, "GET", use_cache=True)),
+        ("cached POST", await time_calls(db, tokens, args.iterations, "POST", use_cache=True)),
+    ]
+
+    print(f"{'mode':<14}{'us/request':>12}")
+    for mode, us in results:
+        print(f"{mode:<14}{us:>12.2f}")
+    uncached = results[0][1]
+    print(f"speedup of cached GET: {uncached / results[1][1]:.1f}x over {args.iterations} requests with {args.tokens} distinct tokens")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
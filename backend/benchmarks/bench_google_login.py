@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark for Google ID token verification in /users/google-login.
+
+Serves a stand-in for Google's certs endpoint on localhost (with a Cache-Control max-age and an
+optional artificial delay standing in for the network round trip), signs ID tokens with a local
+key, and compares:
+
+  per-login fetch   the old path: id_token.verify_oauth2_token with a fresh transport, which
+                    downloads the certs on every login
+  cached            google_auth.verify_google_id_token, which reuses the cached certs
+
+The cache's correctness (bad tokens, key rotation, stale-cert fallback) is covered by
+tests/test_google_auth.py.
+
+Usage (from the backend/ directory):
+    python benchmarks/bench_google_login.py [--logins 200] [--fetch-delay-ms 50]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cryptography import x509  # noqa: E402
+from cryptography.hazmat.primitives import hashes, serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+from cryptography.x509.oid import NameOID  # noqa: E402
+from google.auth import crypt, jwt  # noqa: E402
+from google.auth.transport import requests as google_requests  # noqa: E402
+from google.oauth2 import id_token  # noqa: E402
+
+import google_auth  # noqa: E402
+
+AUDIENCE = "bench-client-id.apps.googleusercontent.com"
+
+
+def make_key(kid):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, kid)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    signer = crypt.RSASigner.from_string(key_pem, key_id=kid)
+    return signer, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def make_token(signer, email, audience=AUDIENCE):
+    now = int(time.time())
+    payload = {
+        "iss": "https://accounts.google.com",
+        "aud": audience,
+        "sub": email,
+        "email": email,
+        "email_verified": True,
+        "iat": now,
+        "exp": now + 3600,
+    }
+    return jwt.encode(signer, payload).decode()
+
+
+class CertsServer:
+    """Stand-in for https://www.googleapis.com/oauth2/v1/certs."""
+
+    def __init__(self, certs, max_age, delay_seconds):
+        self.certs = dict(certs)
+        self.requests = 0
+        outer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                outer.requests += 1
+                time.sleep(delay_seconds)
+                body = json.dumps(outer.certs).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", f"public, max-age={max_age}, must-revalidate")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/oauth2/v1/certs"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def verify_per_login_fetch(token, certs_url):
+    return id_token.verify_token(token, google_requests.Request(), AUDIENCE, certs_url=certs_url)
+
+
+async def time_logins(verify, tokens):
+    timings = []
+    for token in tokens:
+        started = time.perf_counter()
+        info = await verify(token)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert info["email"].endswith("@example.com")
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--fetch-delay-ms", type=float, default=50, help="Simulated round trip to the certs endpoint")
+    parser.add_argument("--max-age", type=int, default=21600, help="Cache-Control max-age served with the certs")
+    args = parser.parse_args()
+
+    signer, cert = make_key("bench-key-1")
+    server = CertsServer({"bench-key-1": cert}, args.max_age, args.fetch_delay_ms / 1000)
+    google_auth.google_certs.url = server.url
+    google_auth.google_certs.clear()
+    tokens = [make_token(signer, f"user{i}@example.com") for i in range(args.logins)]
+
+    try:
+        server.requests = 0
+        loop = asyncio.get_running_loop()
+        uncached = await time_logins(
+            lambda token: loop.run_in_executor(None, verify_per_login_fetch, token, server.url), tokens
+        )
+        uncached_fetches = server.requests
+
+        server.requests = 0
+        cached = await time_logins(lambda token: google_auth.verify_google_id_token(token, AUDIENCE), tokens)
+        cached_fetches = server.requests
+    finally:
+        server.stop()
+
+    print(f"{'mode':<18}{'p50 ms':>10}{'p99 ms':>10}{'cert fetches':>14}")
+    for label, timings, fetches in (
+        ("per-login fetch", uncached, uncached_fetches),
+        ("cached", cached, cached_fetches),
+    ):
+        p99 = statistics.quantiles(timings, n=100)[98] if len(timings) > 1 else timings[0]
+        print(f"{label:<18}{statistics.median(timings):>10.2f}{p99:>10.2f}{fetches:>14}")
+    print(f"{args.logins} logins, {args.fetch_delay_ms:.0f} ms simulated certs round trip")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
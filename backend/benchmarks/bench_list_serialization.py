@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for serializing list responses.
+
+For each list endpoint, compares the old path with the fast path on the same synthetic Mongo
+documents. The old path builds every model in Python from the full document and lets FastAPI
+validate the list against `response_model` and encode it with JSONResponse. The fast path runs
+serialization.ModelList on documents that carry only the projected fields. The benchmark checks
+that both produce the same JSON and reports rows/sec for each.
+
+Usage (from the backend/ directory):
+    python benchmarks/bench_list_serialization.py [--rows 1000] [--repeat 20]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from benchmarks.load_test import synthetic_transaction  # noqa: E402
+from models.account import Account  # noqa: E402
+from models.transaction import Transaction  # noqa: E402
+from routes.accounts import account_list  # noqa: E402
+from routes.stats import SplitSummary, split_list  # noqa: E402
+from routes.transactions import transaction_list  # noqa: E402
+
+
+def transaction_docs(rows, splits_only=False):
+    rng = random.Random(1)
+    docs = []
+    while len(docs) < rows:
+        doc = synthetic_transaction(rng, "bench@example.com", "account-1", date(2024, 1, 1) + timedelta(days=rng.randrange(365)))
+        if splits_only:
+            doc.update(type="expense", split_with=rng.sample(["Alice", "Bob", "Chitra"], 2))
+        doc["_id"] = doc["id"]
+        docs.append(doc)
+    return docs
+
+
+def account_docs(rows):
+    return [
+        {"_id": n, "id": f"account-{n}", "user_id": "bench@example.com", "name": f"Account {n}",
+         "balance": 100.0 * n, "created_at": "2024-01-01T00:00:00", "transaction_net_cents": 1250, "transaction_count": n}
+        for n in range(rows)
+    ]
+
+
+def project(docs, projection):
+    fields = [name for name, include in projection.items() if include]
+    return [{name: doc[name] for name in fields if name in doc} for doc in docs]
+
+
+async def old_path(model, docs):
+    field = create_response_field(name="bench", type_=List[model])
+    content = await serialize_response(field=field, response_content=[model(**doc) for doc in docs])
+    return JSONResponse(content).body
+
+
+def rows_per_second(func, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return rows / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    endpoints = [
+        ("GET /transactions", Transaction, transaction_list, transaction_docs(args.rows)),
+        ("GET /stats/splits", SplitSummary, split_list, transaction_docs(args.rows, splits_only=True)),
+        ("GET /accounts", Account, account_list, account_docs(args.rows)),
+    ]
+
+    loop = asyncio.new_event_loop()
+    print(f"{'endpoint':<20}{'old rows/s':>14}{'fast rows/s':>14}{'speedup':>10}")
+    for label, model, model_list, docs in endpoints:
+        projected = project(docs, model_list.projection)
+        old_body = loop.run_until_complete(old_path(model, docs))
+        fast_body = model_list.dump_json(projected)
+        assert json.loads(old_body) == json.loads(fast_body), f"{label}: fast path output differs"
+
+        old_rate = rows_per_second(lambda: loop.run_until_complete(old_path(model, docs)), args.rows, args.repeat)
+        fast_rate = rows_per_second(lambda: model_list.dump_json(project(docs, model_list.projection)), args.rows, args.repeat)
+        print(f"{label:<20}{old_rate:>14,.0f}{fast_rate:>14,.0f}{fast_rate / old_rate:>9.1f}x")
+    loop.close()
+    print(f"{args.rows} rows per response, best of {args.repeat}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+End-to-end check of the mail outbox: runs mailer.MailWorker against smtp_stub.StubSMTPServer on
+an in-memory database (mongomock-motor).
+
+- batch: --mails queued emails must all be delivered over a single SMTP session
+- retry: the stub refuses the first message with a temporary error; the worker must put it back
+  in the outbox and deliver it on its next attempt, over a new session
+
+Exits non-zero if either check fails.
+
+Usage (from the backend/ directory):
+    python benchmarks/bench_mail_queue.py [--mails 5] [--timeout 10]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import email_service  # noqa: E402
+import mailer  # noqa: E402
+from smtp_stub import StubSMTPServer  # noqa: E402
+
+try:
+    from mongomock_motor import AsyncMongoMockClient
+except ImportError:
+    sys.exit("mongomock-motor is not installed.")
+
+
+async def enqueue(db, count):
+    for i in range(count):
+        await mailer.enqueue_email(db, f"user{i}@example.com", f"Verify your email ({i})", "verification.html",
+                                   {"verification_url": f"https://example.com/verify/{i}"})
+
+
+async def drain(db, worker, count, timeout):
+    """Runs the worker until `count` emails were sent; returns the seconds it took."""
+    started = time.perf_counter()
+    worker.start(db)
+    try:
+        while await db.mail_outbox.count_documents({"status": "sent"}) < count:
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError(f"only {await db.mail_outbox.count_documents({'status': 'sent'})} of {count} emails sent after {timeout}s")
+            await asyncio.sleep(0.01)
+        return time.perf_counter() - started
+    finally:
+        await worker.stop()
+
+
+async def run_check(name, mails, timeout, fail_first=0):
+    stub = StubSMTPServer(port=0, fail_first=fail_first)
+    await stub.start()
+    email_service.MAIL_SERVER, email_service.MAIL_PORT = stub.host, stub.port
+    db = AsyncMongoMockClient()["bench_mail_queue"]
+    worker = mailer.MailWorker()
+    # enqueue_email wakes the module's worker
+    mailer.mail_worker = worker
+    try:
+        await enqueue(db, mails)
+        elapsed = await drain(db, worker, mails, timeout)
+    finally:
+        await stub.stop()
+
+    outbox = await db.mail_outbox.find({}, {"_id": 0, "to": 1, "status": 1, "attempts": 1}).to_list(length=None)
+    attempts = sum(mail["attempts"] for mail in outbox)
+    print(f"{name:<8}{mails:>7}{len(stub.messages):>11}{stub.sessions:>10}{attempts:>10}{elapsed * 1000:>10.1f}")
+    return stub, outbox
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mails", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=10, help="Seconds to wait for the outbox to drain")
+    args = parser.parse_args()
+
+    email_service.MAIL_STARTTLS = email_service.MAIL_SSL_TLS = False
+    email_service.MAIL_USERNAME, email_service.MAIL_FROM = None, "bench@example.com"
+    # Retry right away instead of after the production backoff
+    mailer.MAIL_RETRY_BASE_SECONDS = 0
+
+    failures = []
+    print(f"{'check':<8}{'queued':>7}{'delivered':>11}{'sessions':>10}{'attempts':>10}{'ms':>10}")
+
+    stub, outbox = await run_check("batch", args.mails, args.timeout)
+    if len(stub.messages) != args.mails:
+        failures.append(f"batch: {len(stub.messages)} of {args.mails} emails delivered")
+    if stub.sessions != 1:
+        failures.append(f"batch: {stub.sessions} SMTP sessions opened, expected 1")
+    if any(mail["attempts"] != 1 for mail in outbox):
+        failures.append("batch: an email needed more than one attempt")
+
+    stub, outbox = await run_check("retry", 1, args.timeout, fail_first=1)
+    if stub.refused != 1 or len(stub.messages) != 1:
+        failures.append(f"retry: {stub.refused} refused and {len(stub.messages)} delivered, expected 1 and 1")
+    if outbox[0]["attempts"] != 2:
+        failures.append(f"retry: delivered after {outbox[0]['attempts']} attempts, expected 2")
+    if stub.sessions != 2:
+        failures.append(f"retry: {stub.sessions} SMTP sessions opened, expected 2 (reconnect after the failure)")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the native-typed transaction fields (migration 0001).
+
+Seeds transactions the way they were stored before the migration (float `amount`, string `date`
+only) into a disposable database on a local mongod. Then it measures:
+
+  before   index sizes, and the stats pipelines in their dual-read form, which is what runs while the
+           migration is pending
+  migrate  the time to run migration 0001 with the regular batching
+  after    index sizes, and the same pipelines on the native `amount_cents` / `date_at` fields (amounts
+           keep their $ifNull fallback for rows the migration skipped)
+
+It also reports how far a float `$sum` of the amounts drifts from the exact total, which the
+integer-cents sums avoid. mongomock has no index statistics and lacks some of the operators
+involved, so this benchmark needs a real mongod.
+
+Usage (from the backend/ directory):
+    python benchmarks/bench_native_types.py --mongo-url mongodb://localhost:27017 [--transactions 100k]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+from pymongo.errors import OperationFailure  # noqa: E402
+
+import migrations  # noqa: E402
+from benchmarks.load_test import parse_volume, synthetic_transaction  # noqa: E402
+from routes.stats import RAW_AMOUNT, _category_stages, _dashboard_stages, _monthly_stages, _trend_stages  # noqa: E402
+
+BENCH_DB_NAME = "budget_planner_native_types_bench"
+USER_ID = "bench@example.com"
+
+
+def pipelines(native: bool, today: date):
+    """The raw-transaction pipelines of /stats/overview and /stats/trends_granular."""
+    match = {"$match": {"user_id": USER_ID}}
+    return {
+        "overview facet": [match, {"$facet": {
+            "dashboard": _dashboard_stages(**RAW_AMOUNT),
+            "monthly": _monthly_stages(**RAW_AMOUNT),
+            "expense_categories": [{"$match": {"type": "expense"}}, *_category_stages(**RAW_AMOUNT)],
+            "trends": _trend_stages("weekly", today - timedelta(days=365), today, native=native),
+        }}],
+        "trends daily 90d": [match, *_trend_stages("daily", today - timedelta(days=90), today, native=native)],
+        "trends monthly 2y": [match, *_trend_stages("monthly", today - timedelta(days=730), today, native=native)],
+    }
+
+
+async def time_pipelines(db, native, today, repeat):
+    timings = {}
+    for label, pipeline in pipelines(native, today).items():
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await db.transactions.aggregate(pipeline).to_list(length=None)
+            samples.append((time.perf_counter() - started) * 1000)
+        timings[label] = statistics.median(samples)
+    return timings
+
+
+async def index_sizes(db):
+    stats = await db.command("collStats", "transactions")
+    return stats["indexSizes"], stats["totalIndexSize"]
+
+
+async def seed_legacy(db, count, batch_size=5000):
+    rng = random.Random(1)
+    start = date.today() - timedelta(days=730)
+    exact = Decimal(0)
+    batch = []
+    for _ in range(count):
+        doc = synthetic_transaction(rng, USER_ID, "account-1", start + timedelta(days=rng.randrange(731)))
+        # Stored as before the migration
+        doc.pop("amount_cents")
+        doc.pop("date_at")
+        exact += Decimal(str(doc["amount"]))
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await db.transactions.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.transactions.insert_many(batch, ordered=False)
+    return exact
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.environ.get("BENCH_MONGO_URL"), required=not os.environ.get("BENCH_MONGO_URL"))
+    parser.add_argument("--transactions", type=parse_volume, default="100k", help="1k, 100k, 1M or a number")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per pipeline; the median is reported")
+    parser.add_argument("--batch-size", type=int, default=migrations.base.MIGRATION_BATCH_SIZE)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(args.mongo_url)
+    await client.drop_database(BENCH_DB_NAME)
+    db = client[BENCH_DB_NAME]
+    today = date.today()
+    try:
+        exact_total = await seed_legacy(db, args.transactions)
+        # The transaction indexes the API creates that these pipelines can use
+        await db.transactions.create_index([("user_id", 1), ("date", 1), ("id", 1)])
+        await db.transactions.create_index([("user_id", 1), ("date_at", 1)])
+
+        indexes_before, total_before = await index_sizes(db)
+        before = await time_pipelines(db, False, today, args.repeat)
+
+        started = time.perf_counter()
+        ran = await migrations.run_migrations(db, migrations.MIGRATIONS, batch_size=args.batch_size, pause_seconds=0)
+        migrate_seconds = time.perf_counter() - started
+        migrated = sum(count for _, count in ran)
+        try:
+            # Reclaim the space left behind by the in-place rewrites, so index sizes compare fairly
+            await db.command("compact", "transactions")
+        except OperationFailure:
+            pass
+
+        indexes_after, total_after = await index_sizes(db)
+        after = await time_pipelines(db, True, today, args.repeat)
+
+        float_sum = (await db.transactions.aggregate([{"$group": {"_id": None, "total": {"$sum": "$amount"}}}]).to_list(1))[0]["total"]
+        cents_sum = (await db.transactions.aggregate([{"$group": {"_id": None, "total": {"$sum": "$amount_cents"}}}]).to_list(1))[0]["total"]
+    finally:
+        await client.drop_database(BENCH_DB_NAME)
+        client.close()
+
+    print(f"{args.transactions:,} transactions; migration 0001 rewrote {migrated:,} in {migrate_seconds:.1f}s "
+          f"({migrated / migrate_seconds:,.0f} docs/s)\n")
+
+    print(f"{'index':<28}{'before KiB':>12}{'after KiB':>12}")
+    for name in sorted(set(indexes_before) | set(indexes_after)):
+        print(f"{name:<28}{indexes_before.get(name, 0) / 1024:>12,.0f}{indexes_after.get(name, 0) / 1024:>12,.0f}")
+    print(f"{'total':<28}{total_before / 1024:>12,.0f}{total_after / 1024:>12,.0f}\n")
+
+    print(f"{'pipeline':<22}{'dual-read ms':>14}{'native ms':>12}{'speedup':>10}")
+    for label in before:
+        print(f"{label:<22}{before[label]:>14.1f}{after[label]:>12.1f}{before[label] / after[label]:>9.2f}x")
+
+    print(f"\nexact total {exact_total}; float $sum {float_sum!r} (off by {abs(Decimal(repr(float_sum)) - exact_total)}); "
+          f"cents $sum {Decimal(cents_sum) / 100}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
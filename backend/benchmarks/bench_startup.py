@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark with a regression budget.
+
+Imports the app in fresh interpreters several times and fails (exit code 1) when the
+median import time exceeds the budget, or when a module that should load lazily
+(Google auth, the SMTP/template stack) is imported at startup.
+
+Usage (from the backend/ directory):
+    python benchmarks/bench_startup.py [--runs 7] [--budget-ms 1500]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Modules that must only be imported on first use
+LAZY_MODULES = ("google.oauth2", "google.auth.transport.requests", "requests", "aiosmtplib", "jinja2", "fastapi_mail")
+
+MEASURE = """
+import json, sys, time
+started = time.perf_counter()
+import server
+elapsed_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({"ms": elapsed_ms, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def measure_once() -> dict:
+    result = subprocess.run([sys.executable, "-c", MEASURE], cwd=BACKEND_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"Importing server failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("STARTUP_BUDGET_MS", 1500)))
+    args = parser.parse_args()
+
+    # The first run warms the OS file cache and writes .pyc files; it is not counted
+    measure_once()
+    samples = [measure_once() for _ in range(args.runs)]
+    times = sorted(sample["ms"] for sample in samples)
+    median = statistics.median(times)
+    eagerly_loaded = sorted({module for sample in samples for module in sample["loaded"]})
+
+    print(f"{'runs':<14}{args.runs:>10}")
+    print(f"{'min ms':<14}{times[0]:>10.1f}")
+    print(f"{'median ms':<14}{median:>10.1f}")
+    print(f"{'max ms':<14}{times[-1]:>10.1f}")
+    print(f"{'budget ms':<14}{args.budget_ms:>10.1f}")
+
+    failed = False
+    if median > args.budget_ms:
+        print(f"FAIL: median cold import {median:.1f} ms exceeds the {args.budget_ms:.1f} ms budget")
+        failed = True
+    if eagerly_loaded:
+        print(f"FAIL: lazily loaded modules were imported at startup: {', '.join(eagerly_loaded)}")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
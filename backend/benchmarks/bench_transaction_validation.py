@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Validation throughput benchmark for the transaction write models.
+
+Validates synthetic create and update payloads with the current models (Annotated validators and a
+precompiled date pattern, model_dump) and with the previous v1-style definitions (@validator,
+strptime per date, .dict()), which are reproduced below as the baseline. It also times the full
+create path, from validating the payload to dumping the document to store.
+
+Usage (from the backend/ directory):
+    python benchmarks/bench_transaction_validation.py [--payloads 100000]
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+import warnings
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import List, Literal, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pydantic import BaseModel, Field, validator  # noqa: E402
+
+from models.transaction import Transaction, TransactionBase, TransactionCreate, TransactionUpdate  # noqa: E402
+
+warnings.simplefilter("ignore")
+
+
+# --- The previous, v1-style models ---
+
+class LegacyTransactionCreate(TransactionBase):
+    @validator('amount')
+    def amount_must_be_positive(cls, v):
+        if v <= 0:
+            raise ValueError('Amount must be positive')
+        return v
+
+    @validator('category')
+    def category_must_not_be_empty(cls, v):
+        if not v or not v.strip():
+            raise ValueError('Category cannot be empty')
+        return v.strip()
+
+    @validator('date')
+    def validate_date_format(cls, v):
+        try:
+            datetime.strptime(v, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError('Date must be in YYYY-MM-DD format')
+        return v
+
+
+class LegacyTransactionUpdate(BaseModel):
+    type: Optional[Literal["income", "expense"]] = None
+    category: Optional[str] = None
+    amount: Optional[float] = None
+    description: Optional[str] = None
+    date: Optional[str] = None
+    person: Optional[str] = None
+    account_id: Optional[str] = None
+    group_name: Optional[str] = None
+    split_with: Optional[List[str]] = None
+
+    @validator('amount')
+    def amount_must_be_positive(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError('Amount must be positive')
+        return v
+
+    @validator('category')
+    def category_must_not_be_empty(cls, v):
+        if v is not None and (not v or not v.strip()):
+            raise ValueError('Category cannot be empty')
+        return v.strip() if v else v
+
+    @validator('date')
+    def validate_date_format(cls, v):
+        if v is not None:
+            try:
+                datetime.strptime(v, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError('Date must be in YYYY-MM-DD format')
+        return v
+
+
+class LegacyTransaction(TransactionBase):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    month: str
+    week: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    @classmethod
+    def from_create(cls, transaction_create, user_id):
+        year, week, _ = datetime.strptime(transaction_create.date, '%Y-%m-%d').isocalendar()
+        return cls(user_id=user_id, month=transaction_create.date[:7], week=f"{year}-W{week:02d}", **transaction_create.dict())
+
+
+# --- Payloads ---
+
+def create_payloads(count):
+    rng = random.Random(1)
+    start = date(2023, 1, 1)
+    return [
+        {
+            "type": rng.choice(["income", "expense"]),
+            "category": rng.choice(["Groceries", " Rent ", "Salary", "Travel"]),
+            "amount": round(rng.uniform(1, 500), 2),
+            "description": "synthetic payload",
+            "date": (start + timedelta(days=rng.randrange(700))).isoformat(),
+            "person": rng.choice([None, None, "Alice"]),
+            "account_id": "account-1",
+            "split_with": rng.choice([None, None, ["Bob", "Chitra"]]),
+        }
+        for _ in range(count)
+    ]
+
+
+def update_payloads(count):
+    rng = random.Random(2)
+    fields = list(create_payloads(1)[0])
+    return [{field: payload[field] for field in rng.sample(fields, 3)} for payload in create_payloads(count)]
+
+
+def timed(func, payloads):
+    started = time.perf_counter()
+    for payload in payloads:
+        func(payload)
+    elapsed = time.perf_counter() - started
+    return len(payloads) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", type=int, default=100_000)
+    args = parser.parse_args()
+
+    creates = create_payloads(args.payloads)
+    updates = update_payloads(args.payloads)
+
+    # Both definitions must accept the same payloads and produce the same values
+    for payload in creates[:1000]:
+        assert LegacyTransactionCreate(**payload).dict() == TransactionCreate(**payload).model_dump()
+    for payload in updates[:1000]:
+        assert LegacyTransactionUpdate(**payload).dict(exclude_unset=True) == TransactionUpdate(**payload).model_dump(exclude_unset=True)
+
+    cases = [
+        ("TransactionCreate", lambda p: LegacyTransactionCreate(**p), lambda p: TransactionCreate(**p), creates),
+        (
+            "TransactionUpdate",
+            lambda p: LegacyTransactionUpdate(**p).dict(exclude_unset=True),
+            lambda p: TransactionUpdate(**p).model_dump(exclude_unset=True),
+            updates,
+        ),
+        (
+            "create path",
+            lambda p: LegacyTransaction.from_create(LegacyTransactionCreate(**p), "u@example.com").dict(),
+            lambda p: Transaction.from_create(TransactionCreate(**p), "u@example.com").model_dump(),
+            creates,
+        ),
+    ]
+
+    print(f"{'model':<20}{'v1-style /s':>14}{'v2-native /s':>14}{'speedup':>10}")
+    for label, legacy, current, payloads in cases:
+        legacy_rate = timed(legacy, payloads)
+        current_rate = timed(current, payloads)
+        print(f"{label:<20}{legacy_rate:>14,.0f}{current_rate:>14,.0f}{current_rate / legacy_rate:>9.2f}x")
+    print(f"{args.payloads:,} synthetic payloads per case")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Import-time profile of the backend's cold start.
+
+Runs `python -X importtime -c "import server"` in a fresh interpreter and prints the
+slowest modules by cumulative and by self import time.
+
+Usage (from the backend/ directory):
+    python benchmarks/import_profile.py [--top 25] [--module server]
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def profile_imports(module: str) -> list:
+    """Returns (self_us, cumulative_us, depth, name) for every module imported by `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{result.stderr}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # One space follows the separator, then two per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def print_table(title: str, rows: list):
+    print(title)
+    print(f"{'module':<50}{'self ms':>10}{'cumulative ms':>15}")
+    for self_us, cumulative_us, _, name in rows:
+        print(f"{name:<50}{self_us / 1000:>10.1f}{cumulative_us / 1000:>15.1f}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=25, help="Rows per table")
+    parser.add_argument("--module", default="server", help="Module to import")
+    args = parser.parse_args()
+
+    rows = profile_imports(args.module)
+    direct = [row for row in rows if row[2] == 1]
+    total_ms = next(row[1] for row in rows if row[2] == 0 and row[3] == args.module) / 1000
+
+    print_table(f"Imports made directly by {args.module}, by cumulative time", sorted(direct, key=lambda row: -row[1])[:args.top])
+    print_table("Modules by self time", sorted(rows, key=lambda row: -row[0])[:args.top])
+    print(f"{len(rows)} modules imported, {total_ms:.1f} ms for `import {args.module}`")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Load test for the API, run in-process against a local database.
+
+Starts the FastAPI app (including its lifespan: indexes, job runner and mail worker) against a
+local mongod, or against mongomock-motor when no MongoDB URL is given. It seeds synthetic users,
+then drives each workload with concurrent clients for a fixed duration:
+
+  dashboard   overview, dashboard, monthly, categories, people and accounts reads
+  list        transaction pages with type/category filters, sort orders, cursors and search
+  writes      bursts of transaction creates and updates
+  settle      a direct transaction with a person followed by settling up with them
+  revalidate  dashboard reads repeated with the ETag of the previous response (If-None-Match)
+
+For every endpoint it reports p50/p95/p99 latency, requests per second and errors. With --save the
+results are written as a JSON baseline; --compare checks a run against such a baseline and exits
+with 1 when an endpoint regressed by more than --tolerance.
+
+The seeded database is dropped first, so point --mongo-url at a disposable database. mongomock is
+only practical for small volumes and does not support every aggregation operator: requests it
+cannot serve (MONGOMOCK_UNSUPPORTED) are left out of the run, and so out of any saved baseline.
+Use a mongod for anything beyond the 1k preset.
+
+Usage (from the backend/ directory):
+    python benchmarks/load_test.py --mongo-url mongodb://localhost:27017 --transactions 100k
+    python benchmarks/load_test.py --transactions 1k --save benchmarks/baseline.json
+    python benchmarks/load_test.py --transactions 1k --compare benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+import migrations  # noqa: E402
+import search  # noqa: E402
+import server  # noqa: E402
+from auth import create_access_token  # noqa: E402
+from database import db_manager  # noqa: E402
+from models.transaction import iso_week  # noqa: E402
+from native_types import native_fields  # noqa: E402
+
+BENCH_DB_NAME = "budget_planner_loadtest"
+VOLUME_PRESETS = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+WORKLOADS = ("dashboard", "list", "writes", "settle", "revalidate")
+# Requests mongomock fails on, with the aggregation operator it lacks; skipped on that backend
+MONGOMOCK_UNSUPPORTED = {"GET /transactions?search": "$setIntersection"}
+
+CATEGORIES = {
+    "expense": ["Groceries", "Rent", "Transport", "Dining", "Utilities", "Shopping", "Travel", "Health"],
+    "income": ["Salary", "Freelance", "Interest", "Refund"],
+}
+PEOPLE = ["Alice", "Bob", "Chitra", "Dev", "Emma", "Farhan", "Grace", "Hiro"]
+WORDS = ["weekly", "coffee", "market", "train", "dinner", "bill", "gift", "online", "store", "ticket"]
+
+
+def parse_volume(value: str) -> int:
+    if value in VOLUME_PRESETS:
+        return VOLUME_PRESETS[value]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected one of {', '.join(VOLUME_PRESETS)} or a number")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+# --- Seeding ---
+
+def synthetic_transaction(rng: random.Random, user_id: str, account_id: str, day: date) -> dict:
+    """A transaction document shaped like the ones the create route stores."""
+    type_ = "income" if rng.random() < 0.2 else "expense"
+    date_str = day.isoformat()
+    person = rng.choice(PEOPLE) if rng.random() < 0.1 else None
+    split_with = rng.sample(PEOPLE, rng.randint(1, 3)) if type_ == "expense" and rng.random() < 0.05 else None
+    now = datetime.utcnow()
+    doc = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "type": type_,
+        "category": rng.choice(CATEGORIES[type_]),
+        "amount": round(rng.uniform(1, 2000 if type_ == "income" else 300), 2),
+        "description": " ".join(rng.sample(WORDS, 2)),
+        "date": date_str,
+        "person": person,
+        "account_id": account_id,
+        "group_name": "Trip" if split_with else None,
+        "split_with": split_with,
+        "month": date_str[:7],
+        "week": iso_week(date_str),
+        "created_at": now,
+        "updated_at": now,
+    }
+    doc.update(search.search_fields(doc))
+    doc.update(native_fields(doc))
+    return doc
+
+
+async def seed(db, users: int, transactions: int, accounts_per_user: int, seed_value: int, batch_size: int = 5000):
+    """
+    Seeds users with accounts and transactions, then applies the migrations, which build the derived
+    data (rollups, running totals, ledgers) the write routes maintain.
+    """
+    rng = random.Random(seed_value)
+    fixtures = []
+    per_user = max(1, transactions // users)
+    start_day = date.today() - timedelta(days=730)
+    for n in range(users):
+        user_id = f"loadtest{n}@example.com"
+        await db.users.insert_one({
+            "_id": user_id, "email": user_id, "hashed_password": None,
+            "verified": True, "created_at": datetime.utcnow(),
+        })
+        account_ids = []
+        for a in range(accounts_per_user):
+            account_id = str(uuid.uuid4())
+            account_ids.append(account_id)
+            await db.accounts.insert_one({
+                "id": account_id, "user_id": user_id, "name": f"Account {a + 1}", "balance": 1000.0,
+                "created_at": datetime.utcnow(), "transaction_net_cents": 0, "transaction_count": 0,
+            })
+
+        sample_ids = []
+        batch = []
+        for i in range(per_user):
+            day = start_day + timedelta(days=rng.randrange(730))
+            doc = synthetic_transaction(rng, user_id, rng.choice(account_ids), day)
+            if i < 500:
+                sample_ids.append(doc["id"])
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                await db.transactions.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            await db.transactions.insert_many(batch, ordered=False)
+
+        fixtures.append({
+            "user_id": user_id,
+            "headers": {"Authorization": f"Bearer {create_access_token({'sub': user_id})}"},
+            "account_ids": account_ids,
+            "transaction_ids": sample_ids,
+        })
+    await migrations.run_migrations(db, migrations.MIGRATIONS, pause_seconds=0)
+    return fixtures
+
+
+# --- Workloads ---
+# Each operation is `async def op(client, user, rng, worker_id, iteration)` and records its own
+# requests through `timed`, so an operation may issue several requests under different labels.
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def timed(self, label, send, expected=(200, 201)):
+        started = time.perf_counter()
+        response = await send()
+        self.latencies[label].append((time.perf_counter() - started) * 1000)
+        if response.status_code not in expected:
+            self.errors[label] += 1
+        return response
+
+
+def _trend_params(rng):
+    end = date.today() - timedelta(days=rng.randrange(30))
+    return {"start_date": (end - timedelta(days=90)).isoformat(), "end_date": end.isoformat(), "period": "weekly"}
+
+
+def dashboard_ops(rec: Recorder, skipped):
+    async def overview(client, user, rng, worker_id, iteration):
+        await rec.timed("GET /stats/overview", lambda: client.get("/api/stats/overview", headers=user["headers"], params=_trend_params(rng)))
+
+    async def dashboard(client, user, rng, worker_id, iteration):
+        await rec.timed("GET /stats/dashboard", lambda: client.get("/api/stats/dashboard", headers=user["headers"]))
+        await rec.timed("GET /stats/monthly", lambda: client.get("/api/stats/monthly", headers=user["headers"]))
+        await rec.timed("GET /stats/categories", lambda: client.get("/api/stats/categories", headers=user["headers"], params={"type": "expense"}))
+
+    async def people(client, user, rng, worker_id, iteration):
+        await rec.timed("GET /stats/people", lambda: client.get("/api/stats/people", headers=user["headers"]))
+        await rec.timed("GET /people", lambda: client.get("/api/people/", headers=user["headers"]))
+
+    async def accounts(client, user, rng, worker_id, iteration):
+        await rec.timed("GET /accounts", lambda: client.get("/api/accounts/", headers=user["headers"]))
+
+    return [(overview, 2), (dashboard, 3), (people, 1), (accounts, 2)]
+
+
+def list_ops(rec: Recorder, skipped):
+    async def filtered_page(client, user, rng, worker_id, iteration):
+        type_ = rng.choice(["expense", "income"])
+        params = {
+            "limit": 100,
+            "type": type_,
+            "sort": rng.choice(["date_desc", "date_asc", "amount_desc", "category_asc"]),
+        }
+        if rng.random() < 0.5:
+            params["category"] = rng.choice(CATEGORIES[type_])
+        if rng.random() < 0.5:
+            params["account_id"] = rng.choice(user["account_ids"])
+        response = await rec.timed("GET /transactions", lambda: client.get("/api/transactions/", headers=user["headers"], params=params))
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if next_cursor:
+            await rec.timed(
+                "GET /transactions (next page)",
+                lambda: client.get("/api/transactions/", headers=user["headers"], params={**params, "cursor": next_cursor}),
+            )
+
+    async def search_page(client, user, rng, worker_id, iteration):
+        term = rng.choice(WORDS)[:rng.randint(2, 5)]
+        await rec.timed("GET /transactions?search", lambda: client.get("/api/transactions/", headers=user["headers"], params={"search": term, "limit": 50}))
+
+    ops = [(filtered_page, 4)]
+    if "GET /transactions?search" not in skipped:
+        ops.append((search_page, 1))
+    return ops
+
+
+def _transaction_payload(rng, user, **overrides):
+    type_ = rng.choice(["expense", "income"])
+    payload = {
+        "type": type_,
+        "category": rng.choice(CATEGORIES[type_]),
+        "amount": round(rng.uniform(1, 300), 2),
+        "description": " ".join(rng.sample(WORDS, 2)),
+        "date": (date.today() - timedelta(days=rng.randrange(60))).isoformat(),
+        "account_id": rng.choice(user["account_ids"]),
+    }
+    payload.update(overrides)
+    return payload
+
+
+def write_ops(rec: Recorder, skipped):
+    async def create(client, user, rng, worker_id, iteration):
+        payload = _transaction_payload(rng, user)
+        await rec.timed("POST /transactions", lambda: client.post("/api/transactions/", headers=user["headers"], json=payload))
+
+    async def update(client, user, rng, worker_id, iteration):
+        transaction_id = rng.choice(user["transaction_ids"])
+        payload = {"amount": round(rng.uniform(1, 300), 2), "description": " ".join(rng.sample(WORDS, 2))}
+        await rec.timed("PUT /transactions/{id}", lambda: client.put(f"/api/transactions/{transaction_id}", headers=user["headers"], json=payload))
+
+    return [(create, 1), (update, 1)]
+
+
+def settle_ops(rec: Recorder, skipped):
+    async def settle(client, user, rng, worker_id, iteration):
+        # Each worker settles with its own people, so concurrent workers never race on one balance
+        person = f"Friend {worker_id}-{iteration % 25}"
+        payload = _transaction_payload(rng, user, person=person)
+        await rec.timed("POST /transactions (person)", lambda: client.post("/api/transactions/", headers=user["headers"], json=payload))
+        await rec.timed(
+            "POST /people/{name}/settle",
+            lambda: client.post(f"/api/people/{person}/settle", headers=user["headers"], json={"account_id": payload["account_id"]}),
+        )
+
+    return [(settle, 1)]
+
+
+def revalidate_ops(rec: Recorder, skipped):
+    # The first read of each endpoint fetches the body; repeating it with the ETag should get a 304
+    # (no query, no body) for as long as the user's data does not change. Both are labelled with their
+    # status, so they are reported apart from the same endpoints in the dashboard and list workloads.
+    async def revalidate(label, send):
+        response = await rec.timed(f"{label} (200)", lambda: send({}))
+        etag = response.headers.get("ETag")
+        await rec.timed(f"{label} (304)", lambda: send({"If-None-Match": etag}), expected=(304,))
+
+    async def overview(client, user, rng, worker_id, iteration):
+        params = _trend_params(rng)
+        await revalidate("GET /stats/overview", lambda extra: client.get("/api/stats/overview", headers={**user["headers"], **extra}, params=params))
+
+    async def dashboard(client, user, rng, worker_id, iteration):
+        await revalidate("GET /stats/dashboard", lambda extra: client.get("/api/stats/dashboard", headers={**user["headers"], **extra}))
+
+    async def transactions(client, user, rng, worker_id, iteration):
+        await revalidate("GET /transactions", lambda extra: client.get("/api/transactions/", headers={**user["headers"], **extra}, params={"limit": 100}))
+
+    return [(overview, 2), (dashboard, 2), (transactions, 1)]
+
+
+WORKLOAD_BUILDERS = {"dashboard": dashboard_ops, "list": list_ops, "writes": write_ops, "settle": settle_ops, "revalidate": revalidate_ops}
+
+
+async def run_workload(client, fixtures, name, concurrency, duration, seed_value, skipped=()):
+    rec = Recorder()
+    ops = WORKLOAD_BUILDERS[name](rec, skipped)
+    functions = [op for op, _ in ops]
+    weights = [weight for _, weight in ops]
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id):
+        rng = random.Random(f"{seed_value}-{name}-{worker_id}")
+        iteration = 0
+        while time.perf_counter() < deadline:
+            op = rng.choices(functions, weights)[0]
+            await op(client, rng.choice(fixtures), rng, worker_id, iteration)
+            iteration += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for label, latencies in rec.latencies.items():
+        latencies.sort()
+        results[label] = {
+            "workload": name,
+            "requests": len(latencies),
+            "errors": rec.errors[label],
+            "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(statistics.fmean(latencies), 3),
+        }
+    return results
+
+
+# --- Reporting ---
+
+def print_report(results):
+    print(f"{'endpoint':<32}{'workload':<11}{'requests':>9}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, r in results.items():
+        print(f"{label:<32}{r['workload']:<11}{r['requests']:>9}{r['errors']:>8}{r['rps']:>10.1f}"
+              f"{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}")
+
+
+def compare(results, baseline, tolerance) -> int:
+    """Prints the change against a baseline; returns the number of regressed endpoints."""
+    regressions = 0
+    print(f"\n{'endpoint':<32}{'p95 base':>10}{'p95 now':>10}{'rps base':>10}{'rps now':>10}  verdict")
+    for label, r in results.items():
+        base = baseline["results"].get(label)
+        if not base:
+            print(f"{label:<32}{'-':>10}{r['p95_ms']:>10.2f}{'-':>10}{r['rps']:>10.1f}  new")
+            continue
+        slower = r["p95_ms"] > base["p95_ms"] * (1 + tolerance)
+        fewer = r["rps"] < base["rps"] * (1 - tolerance)
+        new_errors = r["errors"] > base["errors"]
+        verdict = "REGRESSED" if slower or fewer or new_errors else "ok"
+        regressions += verdict != "ok"
+        print(f"{label:<32}{base['p95_ms']:>10.2f}{r['p95_ms']:>10.2f}{base['rps']:>10.1f}{r['rps']:>10.1f}  {verdict}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Main ---
+
+def open_database(mongo_url):
+    if mongo_url:
+        client = AsyncIOMotorClient(mongo_url, **db_manager.client_options())
+        return client, "mongod"
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("No --mongo-url (or BENCH_MONGO_URL) given and mongomock-motor is not installed.")
+    return AsyncMongoMockClient(), "mongomock"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.environ.get("BENCH_MONGO_URL"), help="Local mongod to run against; mongomock-motor when omitted")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--transactions", type=parse_volume, default="1k", help="Total transactions across users: 1k, 100k, 1M or a number")
+    parser.add_argument("--accounts", type=int, default=3, help="Accounts per user")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help=f"Comma-separated subset of: {', '.join(WORKLOADS)}")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per workload")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", type=Path, help="Write the results to this JSON baseline")
+    parser.add_argument("--compare", type=Path, help="Compare the results against this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative p95/rps change before --compare fails")
+    args = parser.parse_args()
+
+    workloads = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = [name for name in workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"unknown workload(s): {', '.join(unknown)}")
+
+    client, backend = open_database(args.mongo_url)
+    skipped = MONGOMOCK_UNSUPPORTED if backend == "mongomock" else {}
+    for label, operator in skipped.items():
+        print(f"Skipping {label}: mongomock does not support {operator}")
+    await client.drop_database(BENCH_DB_NAME)
+    db_manager.client = client
+    db_manager.db = client[BENCH_DB_NAME]
+
+    # The database is already connected above; the lifespan only has to build indexes and start
+    # workers. Migrations run once the data is seeded instead (see seed).
+    async def already_connected():
+        pass
+    server.connect_to_database = already_connected
+    server.close_database_connection = already_connected
+    server.MIGRATE_ON_STARTUP = False
+
+    async with server.lifespan(server.app):
+        started = time.perf_counter()
+        fixtures = await seed(db_manager.db, args.users, args.transactions, args.accounts, args.seed)
+        print(f"Seeded {args.users} users with {args.transactions} transactions on {backend} in {time.perf_counter() - started:.1f}s")
+
+        results = {}
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as http:
+            for name in workloads:
+                workload_results = await run_workload(http, fixtures, name, args.concurrency, args.duration, args.seed, skipped)
+                # Labels key the report and the baseline comparison, so no workload may reuse another's
+                duplicates = results.keys() & workload_results.keys()
+                if duplicates:
+                    sys.exit(f"Workload {name} reuses the labels {', '.join(sorted(duplicates))}")
+                results.update(workload_results)
+
+    await client.drop_database(BENCH_DB_NAME)
+    if backend == "mongod":
+        client.close()
+
+    print_report(results)
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "commit": git_commit(),
+            "backend": backend,
+            "skipped": sorted(skipped),
+            "users": args.users,
+            "transactions": args.transactions,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if (baseline["meta"]["backend"], baseline["meta"]["transactions"]) != (backend, args.transactions):
+            print("\nWarning: the baseline was recorded with a different backend or volume")
+        regressions = compare(results, baseline, args.tolerance)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
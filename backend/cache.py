@@ -0,0 +1,211 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Hashable, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from change_feed import COUNTERS_COLLECTION
+from metrics import registry
+
+STATS_CACHE_MAX_ENTRIES = int(os.environ.get("STATS_CACHE_MAX_ENTRIES", 2048))
+STATS_CACHE_MAX_BYTES = int(os.environ.get("STATS_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+STATS_CACHE_TTL_SECONDS = float(os.environ.get("STATS_CACHE_TTL_SECONDS", 300))
+
+_MISSING = object()
+
+
+class TTLLRUCache:
+    """
+    A size-bounded LRU cache whose entries also expire after a fixed TTL.
+    Values are stored JSON-encoded-ready (or as serialized JSON bytes) and weighed by their serialized length.
+    """
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = registry.counter(f"{name}.hits")
+        self.misses = registry.counter(f"{name}.misses")
+        self.evictions = registry.counter(f"{name}.evictions")
+        self.entries_gauge = registry.gauge(f"{name}.entries")
+        self.bytes_gauge = registry.gauge(f"{name}.bytes")
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses.inc()
+            return _MISSING
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses.inc()
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits.inc()
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        size = len(value) if isinstance(value, bytes) else len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions.inc()
+        self._update_gauges()
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        self._update_gauges()
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        self._update_gauges()
+
+    def _update_gauges(self):
+        self.entries_gauge.set(len(self._entries))
+        self.bytes_gauge.set(self._bytes)
+
+
+stats_cache = TTLLRUCache("stats_cache", STATS_CACHE_MAX_ENTRIES, STATS_CACHE_MAX_BYTES, STATS_CACHE_TTL_SECONDS)
+
+# Per-user data version, kept in the user's counters document (see change_feed.py) so that every
+# API process sees the same value. Every write bumps it, which makes all of the user's cached
+# entries unreachable (they then age out through LRU/TTL eviction) and changes their ETags.
+
+# Mixed into every ETag; change it when a deploy changes how responses are rendered, so clients
+# holding bodies in the old format do not get a 304 for them
+ETAG_SALT = os.environ.get("ETAG_SALT", "")
+# Per-user data that clients may keep, but must revalidate (If-None-Match) before each use
+CACHE_CONTROL = "private, no-cache"
+
+not_modified = registry.counter("http.not_modified")
+
+
+# Counters documents already read by the current request (user_id -> document). Set up by
+# _conditional_route, so the ETag check, the route's hidden-account filter and singleflight share
+# one read; elsewhere every call reads the document.
+_request_counters: ContextVar[Optional[dict]] = ContextVar("request_counters", default=None)
+
+
+async def get_user_counters(db: AsyncIOMotorDatabase, user_id: str) -> dict:
+    """The user's data `version` and `hidden_accounts` (see deletions.py), from their counters document."""
+    memo = _request_counters.get()
+    if memo is not None and user_id in memo:
+        return memo[user_id]
+    counter = await db[COUNTERS_COLLECTION].find_one({"_id": user_id}, {"version": 1, "hidden_accounts": 1}) or {}
+    if memo is not None:
+        memo[user_id] = counter
+    return counter
+
+
+async def get_user_version(db: AsyncIOMotorDatabase, user_id: str) -> int:
+    return (await get_user_counters(db, user_id)).get("version", 0)
+
+
+async def bump_user_version(db: AsyncIOMotorDatabase, user_id: str, update: Optional[dict] = None):
+    """Bumps the user's data version, applying `update` (other operators) to the counters document too."""
+    await db[COUNTERS_COLLECTION].update_one({"_id": user_id}, {"$inc": {"version": 1}, **(update or {})}, upsert=True)
+    memo = _request_counters.get()
+    if memo is not None:
+        memo.pop(user_id, None)
+
+
+def etag_for(user_id: str, version: int, endpoint: str, params: tuple) -> str:
+    """A strong ETag: the same user, data version, endpoint and parameters always render the same body."""
+    raw = json.dumps([ETAG_SALT, user_id, version, endpoint, params], separators=(",", ":"))
+    return '"' + hashlib.sha256(raw.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison, so a W/ prefix added by a proxy still matches."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or (candidate[2:] if candidate.startswith("W/") else candidate) == etag:
+            return True
+    return False
+
+
+def _conditional_route(endpoint: str, cached: bool):
+    """
+    Wraps a per-user GET route with ETag handling (and with the stats cache when `cached`). The
+    If-None-Match check needs only the user's data version, a point read, so a client whose copy is
+    current gets a 304 before the route runs any query.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, etag_request: Request, etag_response: Response, **kwargs):
+            memo = _request_counters.set({})
+            try:
+                return await respond(*args, etag_request=etag_request, etag_response=etag_response, **kwargs)
+            finally:
+                _request_counters.reset(memo)
+
+        async def respond(*args, etag_request: Request, etag_response: Response, **kwargs):
+            user_id = kwargs["user_id"]
+            version = await get_user_version(kwargs["db"], user_id)
+            params = tuple(sorted((name, str(value)) for name, value in kwargs.items() if name not in ("user_id", "db")))
+            headers = {"ETag": etag_for(user_id, version, endpoint, params), "Cache-Control": CACHE_CONTROL}
+            if etag_matches(etag_request.headers.get("if-none-match"), headers["ETag"]):
+                not_modified.inc()
+                return Response(status_code=304, headers=headers)
+
+            if cached:
+                key = (user_id, version, endpoint, params)
+                value = stats_cache.get(key)
+                if value is _MISSING:
+                    result = await func(*args, **kwargs)
+                    # Routes on the fast serialization path return ready-made JSON; its bytes are cached as is
+                    value = result.body if isinstance(result, Response) else jsonable_encoder(result)
+                    stats_cache.set(key, value)
+                result = Response(content=value, media_type="application/json") if isinstance(value, bytes) else value
+            else:
+                result = await func(*args, **kwargs)
+
+            # A returned Response is sent as is; otherwise FastAPI copies these headers onto the one it builds
+            (result if isinstance(result, Response) else etag_response).headers.update(headers)
+            return result
+
+        # FastAPI injects the request and the response to add headers to through these extra parameters
+        signature = inspect.signature(func)
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter("etag_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+            inspect.Parameter("etag_response", inspect.Parameter.KEYWORD_ONLY, annotation=Response),
+        ])
+        return wrapper
+    return decorator
+
+
+def conditional_get(endpoint: str):
+    """
+    Adds a strong ETag, derived from the user's data version + endpoint + query parameters, to a
+    per-user GET route, and answers a matching If-None-Match with 304 without running the route.
+    The route must take `user_id` and `db` keyword arguments.
+    """
+    return _conditional_route(endpoint, cached=False)
+
+
+def cached_stats(endpoint: str):
+    """
+    Caches a stats route's response per user, keyed by endpoint + query parameters (including
+    account_id) + the user's data version, and handles conditional GETs like `conditional_get`.
+    The route must take `user_id` and `db` keyword arguments.
+    """
+    return _conditional_route(endpoint, cached=True)
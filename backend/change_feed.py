@@ -0,0 +1,105 @@
+import base64
+import binascii
+import json
+import os
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+# Every transaction write stamps the document with `seq`, taken from a per-user counter that only
+# ever grows; deleted transactions leave a tombstone {user_id, id, seq, deleted_at} instead. A client
+# that remembers the highest seq it has seen can then ask for just what changed since
+# (GET /transactions/changes). Transactions written before this existed get their seq from
+# migration 0002; the endpoint is unavailable until it has run.
+SYNC_MIGRATION = "0002"
+
+# Tombstones are removed by a TTL index after this long; a sync token older than that may have
+# missed deletions, so it is refused and the client starts over with a full sync
+TRANSACTION_TOMBSTONE_TTL_SECONDS = int(os.environ.get("TRANSACTION_TOMBSTONE_TTL_SECONDS", 30 * 24 * 3600))
+# A seq is taken just before the write it belongs to, so concurrent writes can become visible out
+# of seq order. Sync tokens therefore never move past changes younger than this; those are sent
+# again on the next sync (clients apply changes idempotently).
+SYNC_SETTLE_SECONDS = float(os.environ.get("SYNC_SETTLE_SECONDS", 2))
+
+# Per-user counter documents: {_id: user_id, seq, version, hidden_accounts}
+# (`version` and `hidden_accounts` are kept by cache.py and deletions.py)
+COUNTERS_COLLECTION = "counters"
+
+
+async def allocate_seqs(db: AsyncIOMotorDatabase, user_id: str, count: int = 1) -> int:
+    """Reserves `count` consecutive sequence numbers for the user and returns the first."""
+    counter = await db[COUNTERS_COLLECTION].find_one_and_update(
+        {"_id": user_id},
+        {"$inc": {"seq": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["seq"] - count + 1
+
+
+async def record_deletions(db: AsyncIOMotorDatabase, user_id: str, transaction_ids: Iterable[str]):
+    """Leaves a tombstone for each deleted transaction, so syncing clients learn about the deletion."""
+    transaction_ids = list(transaction_ids)
+    if not transaction_ids:
+        return
+    first = await allocate_seqs(db, user_id, len(transaction_ids))
+    now = datetime.utcnow()
+    await db.transaction_tombstones.insert_many([
+        {"user_id": user_id, "id": transaction_id, "seq": first + offset, "deleted_at": now}
+        for offset, transaction_id in enumerate(transaction_ids)
+    ], ordered=False)
+
+
+def encode_sync_token(seq: int, issued_at: Optional[float] = None) -> str:
+    raw = json.dumps([seq, int(issued_at if issued_at is not None else time.time())], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> Tuple[int, int]:
+    """Returns (seq, issued_at); raises ValueError for a malformed token."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        seq, issued_at = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError("Invalid sync token")
+    if not isinstance(seq, int) or not isinstance(issued_at, int):
+        raise ValueError("Invalid sync token")
+    return seq, issued_at
+
+
+def token_expired(issued_at: int) -> bool:
+    return issued_at < time.time() - TRANSACTION_TOMBSTONE_TTL_SECONDS
+
+
+async def changes_since(db: AsyncIOMotorDatabase, user_id: str, since: int, limit: int, projection: dict) -> Tuple[List[dict], List[dict], int, bool]:
+    """
+    The transactions written and the tombstones left after `since`, in seq order, at most `limit` of
+    them together. Returns (transactions, tombstones, next_seq, has_more).
+    """
+    query = {"user_id": user_id, "seq": {"$gt": since}}
+    written = await db.transactions.find(query, {**projection, "seq": 1}).sort("seq", 1).limit(limit + 1).to_list(length=limit + 1)
+    deleted = await db.transaction_tombstones.find(query, {"_id": 0, "id": 1, "seq": 1, "deleted_at": 1}).sort("seq", 1).limit(limit + 1).to_list(length=limit + 1)
+
+    merged = sorted([(doc["seq"], "written", doc) for doc in written] + [(doc["seq"], "deleted", doc) for doc in deleted], key=lambda item: item[0])
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+
+    # Advance past the changes that are old enough that no write with a lower seq can still be in flight
+    settled_before = datetime.utcfromtimestamp(time.time() - SYNC_SETTLE_SECONDS)
+    next_seq = since
+    for seq, kind, doc in merged:
+        changed_at = doc.get("updated_at") if kind == "written" else doc.get("deleted_at")
+        if changed_at is not None and changed_at > settled_before:
+            break
+        next_seq = seq
+    if next_seq == since:
+        # Nothing settled yet: the client should come back later rather than ask again right away
+        has_more = False
+    return (
+        [doc for _, kind, doc in merged if kind == "written"],
+        [doc for _, kind, doc in merged if kind == "deleted"],
+        next_seq,
+        has_more,
+    )
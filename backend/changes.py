@@ -0,0 +1,62 @@
+from typing import Iterable
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import balances
+import cache
+import people_balances
+import rollups
+
+# Every write route reports what it changed here, so the derived data (rollups, account
+# balances, person ledgers, caches) stays in step with the raw collections.
+
+
+async def transactions_changed(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    added: Iterable[dict] = (),
+    removed: Iterable[dict] = (),
+):
+    """Call after transactions were inserted (`added`), deleted (`removed`) or updated (both)."""
+    added, removed = list(added), list(removed)
+    await rollups.apply_transaction_changes(db, added=added, removed=removed)
+    await balances.apply_transaction_changes(db, added=added, removed=removed)
+    await people_balances.apply_transaction_changes(db, added=added, removed=removed)
+    await cache.bump_user_version(db, user_id)
+
+
+async def account_changed(db: AsyncIOMotorDatabase, user_id: str):
+    """Call after an account was created or edited."""
+    await cache.bump_user_version(db, user_id)
+
+
+async def account_tombstoned(db: AsyncIOMotorDatabase, user_id: str, account_id: str):
+    """
+    Call when an account was marked for deletion. Transaction reads leave it out from now on (see
+    deletions.accounts_being_deleted), and its rollups go right away so stats stop counting it.
+    """
+    await cache.bump_user_version(db, user_id, {"$addToSet": {"hidden_accounts": account_id}})
+    await db.monthly_rollups.delete_many({"account_id": account_id, "user_id": user_id})
+
+
+async def account_transactions_deleted(db: AsyncIOMotorDatabase, removed: Iterable[dict]):
+    """
+    Call for each batch of an account's transactions deleted by its deletion job. Rollups and the
+    account's balance go with the account, but ledgers are not kept per account, so the batch's
+    contributions are subtracted from them.
+    """
+    await people_balances.apply_transaction_changes(db, removed=removed)
+
+
+async def account_deleted(db: AsyncIOMotorDatabase, user_id: str, account_id: str):
+    """Call after an account and all of its transactions were deleted."""
+    await db.monthly_rollups.delete_many({"account_id": account_id, "user_id": user_id})
+    await cache.bump_user_version(db, user_id, {"$pull": {"hidden_accounts": account_id}})
+
+
+async def user_deleted(db: AsyncIOMotorDatabase, user_id: str):
+    """Call after all of a user's data was deleted."""
+    await db.monthly_rollups.delete_many({"user_id": user_id})
+    await db.person_ledgers.delete_many({"user_id": user_id})
+    await db.transaction_tombstones.delete_many({"user_id": user_id})
+    # The counters document stays: if the address signs up again, its seq and data version keep
+    # growing, so sync tokens and ETags handed out to the old account can never match the new one
+    await cache.bump_user_version(db, user_id, {"$unset": {"hidden_accounts": ""}})
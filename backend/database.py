@@ -1,8 +1,11 @@
 import os
+import time
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
 from dotenv import load_dotenv
 from pathlib import Path
 from typing import Optional
+from metrics import registry
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
@@ -11,17 +14,172 @@ load_dotenv(ROOT_DIR / '.env')
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME = os.environ.get("DB_NAME", "budget_planner")
 
+# Connection pool and driver settings
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 10000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 30000))
+# Comma-separated wire compressors in order of preference, e.g. "zstd,snappy,zlib".
+# zstd and snappy need the `zstandard` / `python-snappy` packages.
+MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS", "")
+MONGO_READ_PREFERENCE = os.environ.get("MONGO_READ_PREFERENCE", "primary")
+
+# A heartbeat older than this no longer counts as evidence that the database is reachable
+HEALTH_HEARTBEAT_MAX_AGE_SECONDS = 60
+
+pool_checked_out = registry.gauge("mongo.pool.checked_out")
+pool_open_connections = registry.gauge("mongo.pool.open_connections")
+pool_waiting = registry.gauge("mongo.pool.waiting")
+pool_count = registry.gauge("mongo.pool.pools")
+pool_checkout_failures = registry.counter("mongo.pool.checkout_failures")
+pool_checkout_wait_ms = registry.histogram("mongo.pool.checkout_wait_ms")
+command_latency_ms = registry.histogram("mongo.command.latency_ms")
+command_failures = registry.counter("mongo.command.failures")
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Feeds connection pool events into the metrics registry."""
+
+    def __init__(self):
+        self._checkout_started = {}
+
+    def pool_created(self, event):
+        pool_count.inc()
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pool_count.dec()
+
+    def connection_created(self, event):
+        pool_open_connections.inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pool_open_connections.dec()
+
+    def connection_check_out_started(self, event):
+        pool_waiting.inc()
+
+    def connection_check_out_failed(self, event):
+        pool_waiting.dec()
+        pool_checkout_failures.inc()
+
+    def connection_checked_out(self, event):
+        pool_waiting.dec()
+        pool_checked_out.inc()
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            pool_checkout_wait_ms.observe(duration * 1000)
+
+    def connection_checked_in(self, event):
+        pool_checked_out.dec()
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Records the latency of every database command."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        command_latency_ms.observe(event.duration_micros / 1000)
+
+    def failed(self, event):
+        command_latency_ms.observe(event.duration_micros / 1000)
+        command_failures.inc()
+
+
+class HeartbeatListener(monitoring.ServerHeartbeatListener):
+    """Remembers the outcome of the driver's own server heartbeats, so health checks need no ping."""
+
+    def __init__(self):
+        self.last_success_at: Optional[float] = None
+        self.last_failure_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.last_success_at = time.monotonic()
+
+    def failed(self, event):
+        self.last_failure_at = time.monotonic()
+        self.last_error = str(event.reply)
+
+
 class DBManager:
     """Manages the lifecycle of the MongoDB client and database connection."""
     client: Optional[AsyncIOMotorClient] = None
     db: Optional[AsyncIOMotorDatabase] = None
 
+    def __init__(
+        self,
+        max_pool_size: int = MONGO_MAX_POOL_SIZE,
+        min_pool_size: int = MONGO_MIN_POOL_SIZE,
+        wait_queue_timeout_ms: int = MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        compressors: str = MONGO_COMPRESSORS,
+        read_preference: str = MONGO_READ_PREFERENCE,
+    ):
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.wait_queue_timeout_ms = wait_queue_timeout_ms
+        self.compressors = compressors
+        self.read_preference = read_preference
+        self.heartbeats = HeartbeatListener()
+
+    def client_options(self) -> dict:
+        options = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+            "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+            "readPreference": self.read_preference,
+            "event_listeners": [PoolMetricsListener(), CommandMetricsListener(), self.heartbeats],
+        }
+        if self.compressors:
+            options["compressors"] = self.compressors
+        return options
+
+    def pool_stats(self) -> dict:
+        pools = max(1, pool_count.value)
+        return {
+            "max_pool_size": self.max_pool_size,
+            "open_connections": pool_open_connections.value,
+            "checked_out": pool_checked_out.value,
+            "waiting": pool_waiting.value,
+            "utilisation": round(pool_checked_out.value / (self.max_pool_size * pools), 3) if self.max_pool_size else None,
+        }
+
+    def is_reachable(self) -> Optional[bool]:
+        """True/False from the latest driver heartbeat, or None when there is no recent heartbeat."""
+        heartbeats = self.heartbeats
+        now = time.monotonic()
+        if heartbeats.last_success_at is None and heartbeats.last_failure_at is None:
+            return None
+        last_success = heartbeats.last_success_at or 0.0
+        last_failure = heartbeats.last_failure_at or 0.0
+        if max(last_success, last_failure) < now - HEALTH_HEARTBEAT_MAX_AGE_SECONDS:
+            return None
+        return last_success >= last_failure
+
 db_manager = DBManager()
 
 async def connect_to_database():
     """Initializes the database connection and client."""
     print("Connecting to MongoDB...")
-    db_manager.client = AsyncIOMotorClient(MONGO_URL)
+    db_manager.client = AsyncIOMotorClient(MONGO_URL, **db_manager.client_options())
     db_manager.db = db_manager.client[DB_NAME]
     print("MongoDB connection successful.")
 
@@ -35,4 +193,4 @@ def get_database() -> AsyncIOMotorDatabase:
     """Dependency function to get the database instance for a request."""
     if db_manager.db is None:
         raise Exception("Database connection is not available.")
-    return db_manager.db
\ No newline at end of file
+    return db_manager.db
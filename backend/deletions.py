@@ -0,0 +1,115 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import cache
+import changes
+import change_feed
+from jobs import enqueue_job, job_handler
+from people_balances import LEDGER_SOURCE_FIELDS
+
+# Documents removed per delete_many, and the pause between batches, so a large cascade does not
+# monopolise the primary
+DELETE_BATCH_SIZE = int(os.environ.get("DELETE_BATCH_SIZE", 500))
+DELETE_BATCH_PAUSE_SECONDS = float(os.environ.get("DELETE_BATCH_PAUSE_SECONDS", 0.05))
+
+# Accounts and users being deleted carry a `deleted_at` tombstone until their deletion job is done.
+# Reads and writes add this filter so they no longer see them.
+NOT_DELETED = {"deleted_at": None}
+
+
+async def accounts_being_deleted(db: AsyncIOMotorDatabase, user_id: str) -> List[str]:
+    """
+    Ids of the user's tombstoned accounts. Their transactions stay in the collection until the
+    deletion job has removed them, so every transaction read leaves them out (see hide_accounts).
+    The list is kept on the user's counters document, which conditional GETs read anyway for the
+    data version.
+    """
+    return (await cache.get_user_counters(db, user_id)).get("hidden_accounts", [])
+
+
+def hide_accounts(query: dict, account_ids: List[str]) -> dict:
+    """Adds a condition to a transaction query that leaves out the transactions of `account_ids`."""
+    if account_ids:
+        query.setdefault("$and", []).append({"account_id": {"$nin": list(account_ids)}})
+    return query
+
+
+async def _delete_in_batches(
+    collection, query: dict, progress, progress_field: str, before_delete=None, after_delete=None, fields=("id",),
+) -> int:
+    """
+    Deletes matching documents in throttled batches of _ids, reporting each batch to the job.
+    `before_delete` and `after_delete`, if given, are awaited with each batch (documents with _id and
+    `fields`) before and after it is removed.
+    """
+    deleted = 0
+    projection = {"_id": 1, **{field: 1 for field in fields}} if before_delete or after_delete else {"_id": 1}
+    while True:
+        docs = await collection.find(query, projection).limit(DELETE_BATCH_SIZE).to_list(length=DELETE_BATCH_SIZE)
+        if not docs:
+            return deleted
+        if before_delete:
+            await before_delete(docs)
+        ids = [doc["_id"] for doc in docs]
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        deleted += result.deleted_count
+        if after_delete:
+            await after_delete(docs)
+        await progress({progress_field: result.deleted_count})
+        await asyncio.sleep(DELETE_BATCH_PAUSE_SECONDS)
+
+
+async def start_account_deletion(db: AsyncIOMotorDatabase, user_id: str, account_id: str) -> Optional[dict]:
+    """Tombstones the account and queues the deletion of its transactions. None if there is no such account."""
+    account_filter = {"id": account_id, "user_id": user_id, **NOT_DELETED}
+    if not await db.accounts.find_one(account_filter, {"_id": 1}):
+        return None
+    # Queued before tombstoning, so a crash in between can never leave a tombstone without a job
+    job = await enqueue_job(db, "delete_account", user_id, {"account_id": account_id})
+    await db.accounts.update_one(account_filter, {"$set": {"deleted_at": datetime.utcnow()}})
+    await changes.account_tombstoned(db, user_id, account_id)
+    return job
+
+
+async def start_user_deletion(db: AsyncIOMotorDatabase, user_id: str) -> Optional[dict]:
+    """Tombstones the user and queues the deletion of all their data. None if there is no such user."""
+    user_filter = {"_id": user_id, **NOT_DELETED}
+    if not await db.users.find_one(user_filter, {"_id": 1}):
+        return None
+    job = await enqueue_job(db, "delete_user", user_id)
+    await db.users.update_one(user_filter, {"$set": {"deleted_at": datetime.utcnow()}})
+    return job
+
+
+@job_handler("delete_account")
+async def delete_account_job(db: AsyncIOMotorDatabase, job: dict, progress):
+    user_id, account_id = job["user_id"], job["params"]["account_id"]
+
+    async def record_deletions(docs):
+        # Tombstoned first, so a job that dies between the two steps cannot lose a deletion
+        await change_feed.record_deletions(db, user_id, [doc["id"] for doc in docs])
+
+    async def subtract_from_ledgers(docs):
+        # Only once the batch is gone, so a job that is run again never subtracts a transaction twice
+        await changes.account_transactions_deleted(db, docs)
+
+    await _delete_in_batches(
+        db.transactions, {"user_id": user_id, "account_id": account_id}, progress, "transactions",
+        record_deletions, subtract_from_ledgers, fields=("id", *LEDGER_SOURCE_FIELDS),
+    )
+    await db.accounts.delete_one({"id": account_id, "user_id": user_id})
+    await changes.account_deleted(db, user_id, account_id)
+
+
+@job_handler("delete_user")
+async def delete_user_job(db: AsyncIOMotorDatabase, job: dict, progress):
+    user_id = job["user_id"]
+    await _delete_in_batches(db.transactions, {"user_id": user_id}, progress, "transactions")
+    await db.accounts.delete_many({"user_id": user_id})
+    await db.groups.delete_many({"user_id": user_id})
+    # Emails still queued for (or already sent to) the address go too; the user ID is the address
+    await db.mail_outbox.delete_many({"to": user_id})
+    await changes.user_deleted(db, user_id)
+    await db.users.delete_one({"_id": user_id})
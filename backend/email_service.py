@@ -1,5 +1,4 @@
 import os
-from fastapi_mail import ConnectionConfig
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -7,16 +6,13 @@ from pathlib import Path
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-conf = ConnectionConfig(
-    MAIL_USERNAME = os.environ.get("MAIL_USERNAME"),
-    MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD"), # Use the App Password here
-    MAIL_FROM = os.environ.get("MAIL_FROM"),
-    MAIL_PORT = int(os.environ.get("MAIL_PORT", 587)),
-    MAIL_SERVER = os.environ.get("MAIL_SERVER", "smtp.gmail.com"),
-    MAIL_STARTTLS = True,
-    MAIL_SSL_TLS = False,
-    USE_CREDENTIALS = True,
-    VALIDATE_CERTS = True,
-    # ✨ FIX: Tell fastapi-mail where to find the templates directory ✨
-    TEMPLATE_FOLDER = ROOT_DIR / 'templates'
-)
\ No newline at end of file
+# Outbound SMTP settings used by the mail queue worker (see mailer.py)
+MAIL_USERNAME = os.environ.get("MAIL_USERNAME")
+MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD") # Use the App Password here
+MAIL_FROM = os.environ.get("MAIL_FROM")
+MAIL_PORT = int(os.environ.get("MAIL_PORT", 587))
+MAIL_SERVER = os.environ.get("MAIL_SERVER", "smtp.gmail.com")
+MAIL_STARTTLS = os.environ.get("MAIL_STARTTLS", "true").lower() == "true"
+MAIL_SSL_TLS = os.environ.get("MAIL_SSL_TLS", "false").lower() == "true"
+VALIDATE_CERTS = os.environ.get("MAIL_VALIDATE_CERTS", "true").lower() == "true"
+TEMPLATE_FOLDER = ROOT_DIR / 'templates'
@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator
+
+# Fields written for each exported transaction, in CSV column order
+EXPORT_FIELDS = (
+    "id", "date", "month", "type", "category", "amount", "description",
+    "person", "account_id", "group_name", "split_with", "created_at", "updated_at",
+)
+EXPORT_PROJECTION = {"_id": 0, **{field: 1 for field in EXPORT_FIELDS}}
+# Documents fetched per round trip from the Motor cursor
+EXPORT_BATCH_SIZE = 1000
+# Output is flushed to the client whenever this many characters are buffered
+EXPORT_CHUNK_SIZE = 64 * 1024
+# Same list separator as the CSV importer, so exports can be re-imported
+CSV_LIST_SEPARATOR = ";"
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return CSV_LIST_SEPARATOR.join(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def stream_transactions(cursor, fmt: str) -> AsyncIterator[str]:
+    """
+    Encodes documents from a Motor cursor as NDJSON or CSV, yielding ~64KB chunks as the
+    cursor advances so memory use does not depend on the number of rows.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+
+    async for doc in cursor:
+        if writer:
+            writer.writerow([_csv_value(doc.get(field)) for field in EXPORT_FIELDS])
+        else:
+            buffer.write(json.dumps({field: doc.get(field) for field in EXPORT_FIELDS}, default=_json_default))
+            buffer.write("\n")
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from types import SimpleNamespace
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Google's ID token signing certs (PEM x509 format, as google.oauth2.id_token expects)
+GOOGLE_CERTS_URL = os.environ.get("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+# Used when the certs response carries no Cache-Control max-age
+GOOGLE_CERTS_DEFAULT_MAX_AGE_SECONDS = float(os.environ.get("GOOGLE_CERTS_DEFAULT_MAX_AGE_SECONDS", 3600))
+# Within this long of expiry, logins are served from the cache while it refreshes in the background
+GOOGLE_CERTS_REFRESH_MARGIN_SECONDS = float(os.environ.get("GOOGLE_CERTS_REFRESH_MARGIN_SECONDS", 300))
+# A token signed with an unknown key refetches the certs at most this often
+GOOGLE_CERTS_MIN_REFETCH_SECONDS = float(os.environ.get("GOOGLE_CERTS_MIN_REFETCH_SECONDS", 60))
+GOOGLE_CERTS_TIMEOUT_SECONDS = float(os.environ.get("GOOGLE_CERTS_TIMEOUT_SECONDS", 10))
+
+certs_fetches = registry.counter("google_certs.fetches")
+certs_fetch_failures = registry.counter("google_certs.fetch_failures")
+verify_ms = registry.histogram("google_login.verify_ms")
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+def max_age_seconds(cache_control: Optional[str], age: Optional[str]) -> float:
+    """How long a response stays fresh, from its Cache-Control max-age minus the Age it already had."""
+    match = _MAX_AGE.search(cache_control or "")
+    if not match:
+        return GOOGLE_CERTS_DEFAULT_MAX_AGE_SECONDS
+    try:
+        already_aged = int(age) if age else 0
+    except ValueError:
+        already_aged = 0
+    return max(0.0, int(match.group(1)) - already_aged)
+
+
+class GoogleCertsCache:
+    """
+    Keeps Google's signing certs in memory for as long as their Cache-Control allows. Only one fetch
+    runs at a time; logins arriving near expiry keep using the cached certs while a background task
+    refreshes them, so a login only waits for the network when nothing usable is cached.
+    """
+
+    def __init__(self, url: str = GOOGLE_CERTS_URL):
+        self.url = url
+        self._body: Optional[bytes] = None
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._fetch_task: Optional[asyncio.Task] = None
+
+    async def get(self) -> bytes:
+        now = time.monotonic()
+        if self._body is not None and now < self._expires_at:
+            if now >= self._expires_at - GOOGLE_CERTS_REFRESH_MARGIN_SECONDS:
+                self._refresh_in_background()
+            return self._body
+        try:
+            return await self.refresh()
+        except Exception:
+            if self._body is None:
+                raise
+            # Google publishes new keys well before retiring old ones, so stale certs beat failing the login
+            logger.warning("Could not refresh Google certs, using the expired copy", exc_info=True)
+            return self._body
+
+    async def refresh(self) -> bytes:
+        """Fetches the certs now, joining a fetch that is already running."""
+        if self._fetch_task is None:
+            self._fetch_task = asyncio.ensure_future(self._fetch())
+        return await asyncio.shield(self._fetch_task)
+
+    async def refresh_for_unknown_key(self) -> Optional[bytes]:
+        """Refetches for a token signed with a key we do not have, unless the certs are very recent."""
+        if time.monotonic() - self._fetched_at < GOOGLE_CERTS_MIN_REFETCH_SECONDS:
+            return None
+        return await self.refresh()
+
+    def clear(self):
+        self._body = None
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+
+    def _refresh_in_background(self):
+        if self._fetch_task is not None:
+            return
+        self._fetch_task = asyncio.ensure_future(self._fetch())
+        self._fetch_task.add_done_callback(_log_background_failure)
+
+    async def _fetch(self) -> bytes:
+        try:
+            body, cache_control, age = await run_in_threadpool(self._download)
+        except Exception:
+            certs_fetch_failures.inc()
+            raise
+        finally:
+            self._fetch_task = None
+        certs_fetches.inc()
+        now = time.monotonic()
+        self._body = body
+        self._fetched_at = now
+        self._expires_at = now + max_age_seconds(cache_control, age)
+        return body
+
+    def _download(self):
+        import requests
+        response = requests.get(self.url, timeout=GOOGLE_CERTS_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return response.content, response.headers.get("Cache-Control"), response.headers.get("Age")
+
+
+def _log_background_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background refresh of Google certs failed: %s", task.exception())
+
+
+google_certs = GoogleCertsCache()
+
+
+def _verify_with_certs(token: str, certs: bytes, audience: Optional[str]) -> dict:
+    # The Google auth stack is slow to import and only Google login needs it
+    from google.oauth2 import id_token
+
+    def cached_certs_request(url, method="GET", **kwargs):
+        # Stands in for the transport id_token would fetch the certs with
+        return SimpleNamespace(status=200, headers={}, data=certs)
+
+    return id_token.verify_oauth2_token(token, cached_certs_request, audience)
+
+
+async def verify_google_id_token(token: str, audience: Optional[str] = None) -> dict:
+    """
+    Verifies a Google ID token against the cached certs, in the threadpool so the RSA check does not
+    block the event loop. Raises ValueError for any token that is invalid, expired or not for us.
+    """
+    from google.auth.exceptions import GoogleAuthError
+
+    if audience is None:
+        audience = os.environ.get("GOOGLE_CLIENT_ID")
+    started = time.perf_counter()
+    try:
+        certs = await google_certs.get()
+        try:
+            return await run_in_threadpool(_verify_with_certs, token, certs, audience)
+        except ValueError as e:
+            # Google rotated its keys since our copy was fetched
+            if "Certificate for key id" not in str(e):
+                raise
+            certs = await google_certs.refresh_for_unknown_key()
+            if certs is None:
+                raise
+            return await run_in_threadpool(_verify_with_certs, token, certs, audience)
+    except GoogleAuthError as e:
+        if isinstance(e, ValueError):
+            raise
+        raise ValueError(str(e)) from e
+    finally:
+        verify_ms.observe((time.perf_counter() - started) * 1000)
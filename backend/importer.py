@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+from itertools import islice
+from typing import IO, Iterator, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from models.transaction import Transaction, TransactionCreate, ImportReport, ImportRowError
+import changes
+import change_feed
+import search as transaction_search
+from native_types import native_fields
+from deletions import NOT_DELETED
+
+IMPORT_BATCH_SIZE = 500
+# Only the first errors are reported so the response stays small for badly broken files
+MAX_REPORTED_ERRORS = 1000
+# CSV columns holding lists use this separator, e.g. "Alice;Bob"
+CSV_LIST_SEPARATOR = ";"
+CSV_OPTIONAL_FIELDS = ("person", "group_name")
+
+ParsedRow = Tuple[int, Optional[dict], Optional[str]]
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    name = (filename or "").lower()
+    if name.endswith(".csv") or content_type == "text/csv":
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")) or content_type in ("application/x-ndjson", "application/jsonl"):
+        return "ndjson"
+    return None
+
+
+def _normalize_csv_row(row: dict) -> dict:
+    data = {key.strip(): value for key, value in row.items() if key}
+    for field in CSV_OPTIONAL_FIELDS:
+        if not data.get(field):
+            data.pop(field, None)
+    split_with = data.pop("split_with", None)
+    if split_with:
+        data["split_with"] = [name.strip() for name in split_with.split(CSV_LIST_SEPARATOR) if name.strip()]
+    return data
+
+
+def _iter_csv(stream: IO[str]) -> Iterator[ParsedRow]:
+    reader = csv.DictReader(stream)
+    for row in reader:
+        # Rows are reported by the file line they end on (the header is line 1)
+        row_number = reader.line_num
+        if None in row:
+            yield row_number, None, "Row has more columns than the header"
+            continue
+        yield row_number, _normalize_csv_row(row), None
+
+
+def _iter_ndjson(stream: IO[str]) -> Iterator[ParsedRow]:
+    for row_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, None, f"Invalid JSON: {e.msg}"
+            continue
+        if not isinstance(data, dict):
+            yield row_number, None, "Each line must be a JSON object"
+            continue
+        yield row_number, data, None
+
+
+def iter_rows(binary_file: IO[bytes], fmt: str) -> Iterator[ParsedRow]:
+    """Lazily parses an uploaded file, yielding (row_number, data, error) one row at a time."""
+    stream = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    return _iter_csv(stream) if fmt == "csv" else _iter_ndjson(stream)
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}" for err in error.errors()
+    )
+
+
+class _ImportState:
+    def __init__(self):
+        self.report = ImportReport()
+        self.owned_accounts = set()
+        self.missing_accounts = set()
+
+    def fail(self, row_number: int, message: str):
+        self.report.failed += 1
+        if len(self.report.errors) < MAX_REPORTED_ERRORS:
+            self.report.errors.append(ImportRowError(row=row_number, error=message))
+        else:
+            self.report.errors_truncated = True
+
+
+async def _import_batch(db: AsyncIOMotorDatabase, user_id: str, batch: List[ParsedRow], state: _ImportState):
+    validated = []
+    for row_number, data, error in batch:
+        if error:
+            state.fail(row_number, error)
+            continue
+        try:
+            validated.append((row_number, TransactionCreate(**data)))
+        except ValidationError as e:
+            state.fail(row_number, _format_validation_error(e))
+
+    # Resolve account ownership once for every account referenced in the batch
+    unresolved = {tx.account_id for _, tx in validated} - state.owned_accounts - state.missing_accounts
+    if unresolved:
+        owned = await db.accounts.distinct("id", {"id": {"$in": list(unresolved)}, "user_id": user_id, **NOT_DELETED})
+        state.owned_accounts.update(owned)
+        state.missing_accounts.update(unresolved - set(owned))
+
+    rows, docs = [], []
+    for row_number, tx in validated:
+        if tx.account_id not in state.owned_accounts:
+            state.fail(row_number, "account_id: Account not found for this user")
+            continue
+        doc = Transaction.from_create(tx, user_id).model_dump()
+        doc.update(transaction_search.search_fields(doc))
+        doc.update(native_fields(doc))
+        rows.append(row_number)
+        docs.append(doc)
+    if not docs:
+        return
+    first_seq = await change_feed.allocate_seqs(db, user_id, len(docs))
+    for offset, doc in enumerate(docs):
+        doc["seq"] = first_seq + offset
+
+    failed_indexes = set()
+    try:
+        await db.transactions.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for write_error in e.details.get("writeErrors", []):
+            failed_indexes.add(write_error["index"])
+            state.fail(rows[write_error["index"]], write_error.get("errmsg", "Insert failed"))
+
+    inserted = [doc for index, doc in enumerate(docs) if index not in failed_indexes]
+    state.report.inserted += len(inserted)
+    await changes.transactions_changed(db, user_id, added=inserted)
+
+
+async def import_transactions(db: AsyncIOMotorDatabase, user_id: str, binary_file: IO[bytes], fmt: str) -> ImportReport:
+    """
+    Validates and inserts the rows of an uploaded CSV/NDJSON file in fixed-size batches.
+    Only one batch is held in memory at a time, whatever the size of the file.
+    """
+    rows = iter_rows(binary_file, fmt)
+    state = _ImportState()
+    last_row = 0
+    while True:
+        try:
+            # Parsing touches the (possibly disk-backed) upload, so it runs off the event loop
+            batch = await run_in_threadpool(lambda: list(islice(rows, IMPORT_BATCH_SIZE)))
+        except (UnicodeDecodeError, csv.Error) as e:
+            state.fail(last_row + 1, f"Could not parse the rest of the file: {e}")
+            break
+        if not batch:
+            break
+        last_row = batch[-1][0]
+        await _import_batch(db, user_id, batch, state)
+    return state.report
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 1))
+# How long a worker sleeps when there is no work and nothing woke it up
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 5))
+# A running job whose lease was not renewed for this long is picked up again, e.g. after a restart
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+# A failed attempt is retried after this delay times the number of attempts so far
+JOB_RETRY_DELAY_SECONDS = float(os.environ.get("JOB_RETRY_DELAY_SECONDS", 10))
+
+jobs_completed = registry.counter("jobs.completed")
+jobs_failed = registry.counter("jobs.failed")
+jobs_retried = registry.counter("jobs.retried")
+
+# A handler receives the job document and a `progress` callback, which adds the given counts to
+# the job's progress and renews its lease. Handlers must be idempotent: a job may run again after
+# a crash or a failed attempt.
+JobHandler = Callable[[AsyncIOMotorDatabase, dict, Callable[[Dict[str, int]], Awaitable[None]]], Awaitable[None]]
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(job_type: str):
+    """Registers the decorated coroutine as the handler for `job_type` jobs."""
+    def decorator(func: JobHandler) -> JobHandler:
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+
+async def enqueue_job(db: AsyncIOMotorDatabase, job_type: str, user_id: str, params: Optional[dict] = None) -> dict:
+    """Stores a new pending job and wakes an idle worker."""
+    now = datetime.utcnow()
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": job_type,
+        "user_id": user_id,
+        "params": params or {},
+        "status": "pending",
+        "progress": {},
+        "attempts": 0,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+        "available_at": now,
+        "finished_at": None,
+        "lease_expires_at": None,
+    }
+    await db.jobs.insert_one(job)
+    job.pop("_id", None)
+    job_runner.wake()
+    return job
+
+
+class JobRunner:
+    """Runs queued jobs on a few asyncio worker tasks started from the app lifespan."""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(), name=f"job-worker-{n}") for n in range(self.workers)]
+
+    async def stop(self):
+        """Cancels the workers. An interrupted job is resumed once its lease expires."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _work(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.warning(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _claim(self) -> Optional[dict]:
+        """Atomically takes the oldest due pending job, or a running one whose worker went away."""
+        now = datetime.utcnow()
+        return await self._db.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "available_at": {"$lte": now}},
+                {"status": "running", "lease_expires_at": {"$lt": now}},
+            ]},
+            {
+                "$set": {"status": "running", "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS), "updated_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _run(self, job: dict):
+        job_filter = {"id": job["id"]}
+        handler = _handlers.get(job["type"])
+        if handler is None:
+            await self._finish(job_filter, "failed", error=f"Unknown job type '{job['type']}'")
+            return
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            await self._finish(job_filter, "failed", error=job.get("error") or "Too many attempts")
+            return
+
+        async def progress(counts: Dict[str, int]):
+            now = datetime.utcnow()
+            await self._db.jobs.update_one(job_filter, {
+                "$inc": {f"progress.{name}": count for name, count in counts.items()},
+                "$set": {"lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS), "updated_at": now},
+            })
+
+        try:
+            await handler(self._db, job, progress)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job['id']} ({job['type']}) failed on attempt {job['attempts']}")
+            if job["attempts"] < JOB_MAX_ATTEMPTS:
+                jobs_retried.inc()
+                now = datetime.utcnow()
+                await self._db.jobs.update_one(job_filter, {"$set": {
+                    "status": "pending",
+                    "error": str(e),
+                    "lease_expires_at": None,
+                    "available_at": now + timedelta(seconds=JOB_RETRY_DELAY_SECONDS * job["attempts"]),
+                    "updated_at": now,
+                }})
+            else:
+                await self._finish(job_filter, "failed", error=str(e))
+            return
+        await self._finish(job_filter, "completed")
+
+    async def _finish(self, job_filter: dict, status: str, error: Optional[str] = None):
+        now = datetime.utcnow()
+        update = {"status": status, "finished_at": now, "updated_at": now, "lease_expires_at": None}
+        if error is not None:
+            update["error"] = error
+        await self._db.jobs.update_one(job_filter, {"$set": update})
+        (jobs_completed if status == "completed" else jobs_failed).inc()
+
+
+job_runner = JobRunner()
@@ -0,0 +1,244 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import TYPE_CHECKING, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+import email_service
+from metrics import registry
+
+if TYPE_CHECKING:
+    import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+# Messages sent over one SMTP session before the worker looks for more work
+MAIL_BATCH_SIZE = int(os.environ.get("MAIL_BATCH_SIZE", 20))
+MAIL_POLL_SECONDS = float(os.environ.get("MAIL_POLL_SECONDS", 5))
+# The pooled SMTP connection is closed after being idle this long
+MAIL_IDLE_SECONDS = float(os.environ.get("MAIL_IDLE_SECONDS", 30))
+MAIL_TIMEOUT_SECONDS = float(os.environ.get("MAIL_TIMEOUT_SECONDS", 30))
+MAIL_MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", 6))
+# Retry delays grow exponentially from the base, up to the cap
+MAIL_RETRY_BASE_SECONDS = float(os.environ.get("MAIL_RETRY_BASE_SECONDS", 30))
+MAIL_RETRY_MAX_SECONDS = float(os.environ.get("MAIL_RETRY_MAX_SECONDS", 3600))
+# A message claimed by a worker that went away is sent again after this long
+MAIL_LEASE_SECONDS = float(os.environ.get("MAIL_LEASE_SECONDS", 120))
+# Sent messages are removed from the outbox by a TTL index on `sent_at` after this long
+MAIL_OUTBOX_TTL_SECONDS = int(os.environ.get("MAIL_OUTBOX_TTL_SECONDS", 7 * 24 * 3600))
+
+mail_sent = registry.counter("mail.sent")
+mail_failed = registry.counter("mail.failed")
+mail_retried = registry.counter("mail.retried")
+mail_connections_opened = registry.counter("mail.connections_opened")
+mail_send_ms = registry.histogram("mail.send_ms")
+
+# The SMTP and template stacks are imported when the first email is sent, not at startup.
+
+def _aiosmtplib():
+    import aiosmtplib
+    return aiosmtplib
+
+
+@functools.lru_cache(maxsize=None)
+def _templates():
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    # Compiled templates are cached by the environment; auto_reload is off, so rendering never
+    # touches the filesystem after a template's first use.
+    return Environment(
+        loader=FileSystemLoader(email_service.TEMPLATE_FOLDER),
+        autoescape=select_autoescape(["html"]),
+        auto_reload=False,
+    )
+
+
+def render_template(template_name: str, context: dict) -> str:
+    return _templates().get_template(template_name).render(**context)
+
+
+def retry_delay(attempts: int) -> float:
+    return min(MAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), MAIL_RETRY_MAX_SECONDS)
+
+
+async def enqueue_email(db: AsyncIOMotorDatabase, to: str, subject: str, template_name: str, context: dict) -> dict:
+    """Stores an email in the outbox; the mail worker renders and delivers it."""
+    now = datetime.utcnow()
+    message = {
+        "id": str(uuid.uuid4()),
+        "to": to,
+        "subject": subject,
+        "template": template_name,
+        "context": context,
+        "status": "pending",
+        "attempts": 0,
+        "error": None,
+        "created_at": now,
+        "available_at": now,
+        "lease_expires_at": None,
+        "sent_at": None,
+    }
+    await db.mail_outbox.insert_one(message)
+    message.pop("_id", None)
+    mail_worker.wake()
+    return message
+
+
+class PooledSMTP:
+    """A single long-lived SMTP session, (re)connected on demand and closed when idle."""
+
+    def __init__(self):
+        self._client: Optional["aiosmtplib.SMTP"] = None
+        self.last_used = 0.0
+
+    async def send(self, message: EmailMessage):
+        try:
+            await (await self._connection()).send_message(message)
+        except _aiosmtplib().SMTPServerDisconnected:
+            # The server dropped the idle session: reconnect once and resend
+            await self.close()
+            await (await self._connection()).send_message(message)
+        self.last_used = time.monotonic()
+
+    async def _connection(self) -> "aiosmtplib.SMTP":
+        if self._client is None or not self._client.is_connected:
+            client = _aiosmtplib().SMTP(
+                hostname=email_service.MAIL_SERVER,
+                port=email_service.MAIL_PORT,
+                use_tls=email_service.MAIL_SSL_TLS,
+                start_tls=email_service.MAIL_STARTTLS,
+                validate_certs=email_service.VALIDATE_CERTS,
+                timeout=MAIL_TIMEOUT_SECONDS,
+            )
+            await client.connect()
+            if email_service.MAIL_USERNAME:
+                await client.login(email_service.MAIL_USERNAME, email_service.MAIL_PASSWORD or "")
+            mail_connections_opened.inc()
+            self._client = client
+        return self._client
+
+    async def close_if_idle(self):
+        if self._client is not None and time.monotonic() - self.last_used > MAIL_IDLE_SECONDS:
+            await self.close()
+
+    async def close(self):
+        client, self._client = self._client, None
+        if client is not None and client.is_connected:
+            try:
+                await client.quit()
+            except _aiosmtplib().SMTPException:
+                client.close()
+
+
+def _build_message(mail: dict) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = email_service.MAIL_FROM
+    message["To"] = mail["to"]
+    message["Subject"] = mail["subject"]
+    message.set_content(render_template(mail["template"], mail["context"]), subtype="html")
+    return message
+
+
+class MailWorker:
+    """Drains the mail outbox over a pooled SMTP connection, started from the app lifespan."""
+
+    def __init__(self):
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.smtp = PooledSMTP()
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._work(), name="mail-worker")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.smtp.close()
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _work(self):
+        while True:
+            try:
+                batch = await self._claim_batch()
+                if batch:
+                    await self._send_batch(batch)
+                    continue
+                await self.smtp.close_if_idle()
+            except Exception as e:
+                logger.warning(f"Mail worker error: {e}")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), MAIL_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim_batch(self) -> List[dict]:
+        batch = []
+        while len(batch) < MAIL_BATCH_SIZE:
+            now = datetime.utcnow()
+            mail = await self._db.mail_outbox.find_one_and_update(
+                {"$or": [
+                    {"status": "pending", "available_at": {"$lte": now}},
+                    {"status": "sending", "lease_expires_at": {"$lt": now}},
+                ]},
+                {
+                    "$set": {"status": "sending", "lease_expires_at": now + timedelta(seconds=MAIL_LEASE_SECONDS)},
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("available_at", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if mail is None:
+                break
+            batch.append(mail)
+        return batch
+
+    async def _send_batch(self, batch: List[dict]):
+        for mail in batch:
+            started = time.perf_counter()
+            try:
+                await self.smtp.send(_build_message(mail))
+            except Exception as e:
+                if isinstance(e, (_aiosmtplib().SMTPException, OSError)):
+                    await self.smtp.close()
+                await self._failed(mail, e)
+                continue
+            mail_send_ms.observe((time.perf_counter() - started) * 1000)
+            mail_sent.inc()
+            await self._db.mail_outbox.update_one({"_id": mail["_id"]}, {"$set": {
+                "status": "sent", "sent_at": datetime.utcnow(), "lease_expires_at": None, "error": None,
+            }})
+
+    async def _failed(self, mail: dict, error: Exception):
+        # Rejected recipients will not be accepted on a retry either
+        smtp = _aiosmtplib()
+        permanent = isinstance(error, (smtp.SMTPRecipientsRefused, smtp.SMTPRecipientRefused))
+        if permanent or mail["attempts"] >= MAIL_MAX_ATTEMPTS:
+            logger.error(f"Giving up on email {mail['id']} to {mail['to']}: {error}")
+            mail_failed.inc()
+            update = {"status": "failed", "error": str(error), "lease_expires_at": None}
+        else:
+            logger.warning(f"Email {mail['id']} failed on attempt {mail['attempts']}, retrying: {error}")
+            mail_retried.inc()
+            update = {
+                "status": "pending",
+                "error": str(error),
+                "lease_expires_at": None,
+                "available_at": datetime.utcnow() + timedelta(seconds=retry_delay(mail["attempts"])),
+            }
+        await self._db.mail_outbox.update_one({"_id": mail["_id"]}, {"$set": update})
+
+
+mail_worker = MailWorker()
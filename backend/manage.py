@@ -0,0 +1,143 @@
+"""
+Maintenance commands for the Budget Planner backend.
+
+Usage (from the backend/ directory):
+    python manage.py rebuild-rollups [--user EMAIL]
+    python manage.py check-rollups [--user EMAIL]
+    python manage.py rebuild-ledgers [--user EMAIL]
+    python manage.py reconcile-balances [--user EMAIL] [--repair]
+    python manage.py smtp-stub [--host HOST] [--port PORT]
+    python manage.py migrate [--to VERSION] [--batch-size N] [--pause SECONDS]
+    python manage.py migration-status
+"""
+import argparse
+import asyncio
+import sys
+from database import connect_to_database, close_database_connection, get_database
+import balances
+import migrations
+import people_balances
+import rollups
+import smtp_stub
+
+
+async def rebuild_rollups_command(args) -> int:
+    db = get_database()
+    written = await rollups.rebuild_rollups(db, user_id=args.user)
+    print(f"Rebuilt {written} rollup buckets.")
+    return await check_rollups_command(args)
+
+
+async def check_rollups_command(args) -> int:
+    db = get_database()
+    mismatches = await rollups.check_rollups(db, user_id=args.user)
+    for mismatch in mismatches:
+        print(f"Mismatch for {mismatch['key']}: stored={mismatch['stored']} expected={mismatch['expected']}")
+    print(f"Rollup check finished with {len(mismatches)} mismatch(es).")
+    return 1 if mismatches else 0
+
+
+async def rebuild_ledgers_command(args) -> int:
+    db = get_database()
+    written = await people_balances.rebuild_person_ledgers(db, user_id=args.user)
+    print(f"Rebuilt {written} person ledger(s).")
+    return 0
+
+
+async def reconcile_balances_command(args) -> int:
+    db = get_database()
+    drifted = await balances.reconcile_balances(db, user_id=args.user, repair=args.repair)
+    for item in drifted:
+        print(f"Account {item['account_id']} ({item['user_id']}): stored={item['stored']} expected={item['expected']}")
+    action = "Repaired" if args.repair else "Found"
+    print(f"{action} {len(drifted)} drifted account balance(s).")
+    return 1 if drifted and not args.repair else 0
+
+
+async def smtp_stub_command(args) -> int:
+    await smtp_stub.StubSMTPServer(args.host, args.port, verbose=True).serve_forever()
+    return 0
+
+
+async def migrate_command(args) -> int:
+    db = get_database()
+    try:
+        ran = await migrations.run_migrations(
+            db, migrations.MIGRATIONS, target=args.to, batch_size=args.batch_size, pause_seconds=args.pause
+        )
+    except migrations.MigrationLocked as e:
+        print(e)
+        return 1
+    for migration, migrated in ran:
+        print(f"Applied {migration.version} ({migration.name}): {migrated} document(s) migrated.")
+    if not ran:
+        print("No pending migrations.")
+    return 0
+
+
+async def migration_status_command(args) -> int:
+    db = get_database()
+    for status in await migrations.migration_status(db, migrations.MIGRATIONS):
+        applied_at = f" at {status['applied_at']:%Y-%m-%d %H:%M}" if status["applied_at"] else ""
+        skipped = f", {status['skipped']} skipped" if status["skipped"] else ""
+        print(f"{status['version']} {status['name']}: {status['status']}{applied_at} ({status['migrated']} document(s) migrated{skipped})")
+    return 0
+
+
+COMMANDS = {
+    "rebuild-rollups": rebuild_rollups_command,
+    "check-rollups": check_rollups_command,
+    "rebuild-ledgers": rebuild_ledgers_command,
+    "reconcile-balances": reconcile_balances_command,
+    "smtp-stub": smtp_stub_command,
+    "migrate": migrate_command,
+    "migration-status": migration_status_command,
+}
+# Commands that do not talk to MongoDB
+STANDALONE_COMMANDS = {"smtp-stub"}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Budget Planner maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-rollups", help="Recompute monthly rollups from raw transactions and verify them")
+    rebuild.add_argument("--user", help="Only rebuild rollups for this user id (email)")
+
+    check = subparsers.add_parser("check-rollups", help="Verify monthly rollups against raw transactions")
+    check.add_argument("--user", help="Only check rollups for this user id (email)")
+
+
+    ledgers = subparsers.add_parser("rebuild-ledgers", help="Recompute the person ledgers from the raw transactions")
+    ledgers.add_argument("--user", help="Only rebuild this user's ledgers")
+
+    reconcile = subparsers.add_parser("reconcile-balances", help="Detect (and optionally repair) account balance drift")
+    reconcile.add_argument("--user", help="Only reconcile this user's accounts")
+    reconcile.add_argument("--repair", action="store_true", help="Overwrite drifted totals with the recomputed values")
+
+    stub = subparsers.add_parser("smtp-stub", help="Run a local SMTP server that captures outgoing mail")
+    stub.add_argument("--host", default="127.0.0.1")
+    stub.add_argument("--port", type=int, default=1025)
+
+    migrate = subparsers.add_parser("migrate", help="Apply the pending schema migrations, next to the running API")
+    migrate.add_argument("--to", help="Stop after this migration version")
+    migrate.add_argument("--batch-size", type=int, default=migrations.base.MIGRATION_BATCH_SIZE)
+    migrate.add_argument("--pause", type=float, default=migrations.base.MIGRATION_BATCH_PAUSE_SECONDS, help="Seconds to sleep between batches")
+
+    subparsers.add_parser("migration-status", help="List the schema migrations and whether they were applied")
+    return parser
+
+
+async def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command in STANDALONE_COMMANDS:
+        return await COMMANDS[args.command](args)
+    await connect_to_database()
+    try:
+        return await COMMANDS[args.command](args)
+    finally:
+        await close_database_connection()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
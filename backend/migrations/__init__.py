@@ -0,0 +1,38 @@
+"""
+Versioned, online schema migrations.
+
+Each migration has a version ("0001", "0002", ...) and runs at most once per database; the
+`schema_migrations` collection records its progress and whether it was applied. Migrations run
+next to the live API, started by the API itself (MIGRATE_ON_STARTUP) or by `python manage.py
+migrate`: the write routes already store the new schema, and reads accept both shapes until the
+migration is applied (see `applied_migrations`).
+
+To add one, create `mNNNN_<name>.py` with a Migration subclass and list it in MIGRATIONS.
+"""
+from migrations.base import (
+    Migration,
+    DocumentMigration,
+    PerUserMigration,
+    MigrationLocked,
+    applied_migrations,
+    migration_status,
+    run_migrations,
+    run_migrations_on_startup,
+)
+from migrations.m0001_transaction_native_types import TransactionNativeTypes
+from migrations.m0002_transaction_seq import TransactionSeq
+from migrations.m0003_monthly_rollups import MonthlyRollups
+from migrations.m0004_account_running_totals import AccountRunningTotals
+from migrations.m0005_transaction_week import TransactionWeek
+from migrations.m0006_person_ledgers import PersonLedgers
+from migrations.m0007_transaction_search_fields import TransactionSearchFields
+
+MIGRATIONS = [
+    TransactionNativeTypes(),
+    TransactionSeq(),
+    MonthlyRollups(),
+    AccountRunningTotals(),
+    TransactionWeek(),
+    PersonLedgers(),
+    TransactionSearchFields(),
+]
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Documents rewritten per bulk write, and the pause between batches, so a migration running next to
+# live traffic does not monopolise the primary
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", 500))
+MIGRATION_BATCH_PAUSE_SECONDS = float(os.environ.get("MIGRATION_BATCH_PAUSE_SECONDS", 0.05))
+# A run that has not checkpointed for this long is considered dead and may be taken over
+MIGRATION_LOCK_SECONDS = float(os.environ.get("MIGRATION_LOCK_SECONDS", 300))
+# How long the API trusts a "not applied yet" answer before asking the database again
+MIGRATION_STATE_TTL_SECONDS = float(os.environ.get("MIGRATION_STATE_TTL_SECONDS", 60))
+# Documents a migration could not convert are skipped; this many of the latest are kept on its state document
+MIGRATION_MAX_RECORDED_SKIPS = 100
+
+# One schema_migrations document per migration that was started:
+# {_id: version, name, status: "running" | "applied", checkpoint, migrated, skipped, skipped_docs,
+#  started_at, heartbeat_at, applied_at}
+STATE_COLLECTION = "schema_migrations"
+
+
+class MigrationLocked(Exception):
+    """Another process is running the migration."""
+
+
+class Migration:
+    """A versioned schema change. Subclasses set `version` and `name` and implement `run`."""
+    version: str = ""
+    name: str = ""
+
+    async def run(self, db: AsyncIOMotorDatabase, state: "MigrationState"):
+        raise NotImplementedError
+
+
+class DocumentMigration(Migration):
+    """
+    Rewrites every document of `collection` that matches `query`, in batches ordered by _id. Progress
+    is checkpointed after each batch, so an interrupted run resumes where it stopped. Each update is
+    conditional on the document still matching `query` and on the `source_fields` still holding the
+    values that were read, so a document that the API changed in the meantime is left alone (the write
+    path already stores the new fields). A document that `migrate_document` cannot convert (it raises
+    ValueError or TypeError) is recorded on the migration's state and skipped, so one bad row does not
+    stop the run.
+    """
+    collection: str = ""
+    query: dict = {}
+    source_fields: Tuple[str, ...] = ()
+
+    def migrate_document(self, doc: dict) -> Optional[dict]:
+        """Returns the fields to $set on `doc`, or None to leave it unchanged."""
+        raise NotImplementedError
+
+    async def migrate_batch(self, db: AsyncIOMotorDatabase, docs: List[dict], state: "MigrationState") -> List[Tuple[dict, dict]]:
+        """Returns (doc, fields to $set) for the documents of a batch that change; override to work on a whole batch at once."""
+        changed, skipped = [], []
+        for doc in docs:
+            try:
+                fields = self.migrate_document(doc)
+            except (ValueError, TypeError) as e:
+                skipped.append((doc["_id"], str(e)))
+                continue
+            if fields:
+                changed.append((doc, fields))
+        await state.record_skipped(skipped)
+        return changed
+
+    async def run(self, db: AsyncIOMotorDatabase, state: "MigrationState"):
+        collection = db[self.collection]
+        projection = {field: 1 for field in self.source_fields}
+        while True:
+            query = dict(self.query)
+            if state.checkpoint is not None:
+                query["_id"] = {"$gt": state.checkpoint}
+            docs = await collection.find(query, projection).sort("_id", 1).limit(state.batch_size).to_list(length=state.batch_size)
+            if not docs:
+                return
+            operations = []
+            for doc, fields in await self.migrate_batch(db, docs, state):
+                unchanged = {field: doc.get(field) for field in self.source_fields}
+                operations.append(UpdateOne({**self.query, "_id": doc["_id"], **unchanged}, {"$set": fields}))
+            migrated = 0
+            if operations:
+                result = await collection.bulk_write(operations, ordered=False)
+                migrated = result.modified_count
+            await state.save_checkpoint(docs[-1]["_id"], migrated)
+            await asyncio.sleep(state.pause_seconds)
+
+
+class PerUserMigration(Migration):
+    """
+    Runs `migrate_user` for every user, in _id order, checkpointing after each one so an interrupted
+    run resumes with the next user. Used to build derived collections (rollups, ledgers, running
+    totals) for the data written before they were maintained by the write path.
+    """
+
+    async def migrate_user(self, db: AsyncIOMotorDatabase, user_id: str) -> int:
+        """Returns how many documents were written for the user."""
+        raise NotImplementedError
+
+    async def run(self, db: AsyncIOMotorDatabase, state: "MigrationState"):
+        while True:
+            query = {} if state.checkpoint is None else {"_id": {"$gt": state.checkpoint}}
+            users = await db.users.find(query, {"_id": 1}).sort("_id", 1).limit(state.batch_size).to_list(length=state.batch_size)
+            if not users:
+                return
+            for user in users:
+                written = await self.migrate_user(db, user["_id"])
+                await state.save_checkpoint(user["_id"], written)
+                await asyncio.sleep(state.pause_seconds)
+
+
+class MigrationState:
+    """The persisted progress of one migration run, which also acts as its lock."""
+
+    def __init__(self, db: AsyncIOMotorDatabase, migration: Migration, batch_size: int, pause_seconds: float):
+        self.db = db
+        self.migration = migration
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.checkpoint = None
+        self.migrated = 0
+        self.skipped = 0
+
+    async def acquire(self):
+        """Marks the migration as running, resuming from the checkpoint of an earlier, interrupted run."""
+        collection = self.db[STATE_COLLECTION]
+        now = datetime.utcnow()
+        try:
+            await collection.insert_one({
+                "_id": self.migration.version, "name": self.migration.name, "status": "running",
+                "checkpoint": None, "migrated": 0, "skipped": 0, "skipped_docs": [], "started_at": now, "heartbeat_at": now, "applied_at": None,
+            })
+            return
+        except DuplicateKeyError:
+            pass
+        # Take over a run whose process went away without finishing
+        stale = now - timedelta(seconds=MIGRATION_LOCK_SECONDS)
+        doc = await collection.find_one_and_update(
+            {"_id": self.migration.version, "status": "running", "heartbeat_at": {"$lt": stale}},
+            {"$set": {"heartbeat_at": now}},
+        )
+        if doc is None:
+            raise MigrationLocked(f"Migration {self.migration.version} is running in another process (or was just applied)")
+        self.checkpoint = doc.get("checkpoint")
+        self.migrated = doc.get("migrated", 0)
+        self.skipped = doc.get("skipped", 0)
+
+    async def save_checkpoint(self, checkpoint, migrated: int):
+        self.checkpoint = checkpoint
+        self.migrated += migrated
+        await self.db[STATE_COLLECTION].update_one(
+            {"_id": self.migration.version},
+            {"$set": {"checkpoint": checkpoint, "heartbeat_at": datetime.utcnow()}, "$inc": {"migrated": migrated}},
+        )
+
+    async def record_skipped(self, skipped: List[Tuple[object, str]]):
+        """Records documents left unconverted, as (_id, reason)."""
+        if not skipped:
+            return
+        for doc_id, reason in skipped:
+            logger.warning("Migration %s skipped document %s: %s", self.migration.version, doc_id, reason)
+        self.skipped += len(skipped)
+        await self.db[STATE_COLLECTION].update_one(
+            {"_id": self.migration.version},
+            {
+                "$inc": {"skipped": len(skipped)},
+                "$push": {"skipped_docs": {
+                    "$each": [{"_id": doc_id, "reason": reason} for doc_id, reason in skipped],
+                    "$slice": -MIGRATION_MAX_RECORDED_SKIPS,
+                }},
+            },
+        )
+
+    async def release(self):
+        """Lets another process take over an interrupted run right away instead of after MIGRATION_LOCK_SECONDS."""
+        await self.db[STATE_COLLECTION].update_one(
+            {"_id": self.migration.version, "status": "running"},
+            {"$set": {"heartbeat_at": datetime.min}},
+        )
+
+    async def mark_applied(self):
+        await self.db[STATE_COLLECTION].update_one(
+            {"_id": self.migration.version},
+            {"$set": {"status": "applied", "applied_at": datetime.utcnow(), "heartbeat_at": None}},
+        )
+
+
+async def run_migrations(
+    db: AsyncIOMotorDatabase,
+    migrations: List[Migration],
+    target: Optional[str] = None,
+    batch_size: int = MIGRATION_BATCH_SIZE,
+    pause_seconds: float = MIGRATION_BATCH_PAUSE_SECONDS,
+) -> List[Tuple[Migration, int]]:
+    """Runs the pending migrations in version order, up to and including `target`. Returns (migration, documents migrated)."""
+    applied = await applied_versions(db)
+    ran = []
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if target is not None and migration.version > target:
+            break
+        if migration.version in applied:
+            continue
+        state = MigrationState(db, migration, batch_size, pause_seconds)
+        await state.acquire()
+        logger.info("Running migration %s (%s)", migration.version, migration.name)
+        try:
+            await migration.run(db, state)
+        except asyncio.CancelledError:
+            await state.release()
+            raise
+        await state.mark_applied()
+        applied_migrations.forget()
+        ran.append((migration, state.migrated))
+    return ran
+
+
+async def run_migrations_on_startup(db: AsyncIOMotorDatabase, migrations: List[Migration]):
+    """
+    Applies the pending migrations from the API's startup, next to live traffic, so a deploy needs no
+    manual `manage.py migrate`. When another process is already running one, it is left to finish them.
+    """
+    try:
+        for migration, migrated in await run_migrations(db, migrations):
+            logger.info("Applied migration %s (%s): %s document(s) migrated", migration.version, migration.name, migrated)
+    except MigrationLocked as e:
+        logger.info("%s; leaving the pending migrations to it", e)
+    except Exception:
+        logger.exception("Migrations failed; they are retried on the next start or with `manage.py migrate`")
+
+
+async def applied_versions(db: AsyncIOMotorDatabase) -> set:
+    cursor = db[STATE_COLLECTION].find({"status": "applied"}, {"_id": 1})
+    return {doc["_id"] async for doc in cursor}
+
+
+async def migration_status(db: AsyncIOMotorDatabase, migrations: List[Migration]) -> List[dict]:
+    states = {doc["_id"]: doc async for doc in db[STATE_COLLECTION].find({})}
+    return [
+        {
+            "version": migration.version,
+            "name": migration.name,
+            "status": states.get(migration.version, {}).get("status", "pending"),
+            "migrated": states.get(migration.version, {}).get("migrated", 0),
+            "skipped": states.get(migration.version, {}).get("skipped", 0),
+            "applied_at": states.get(migration.version, {}).get("applied_at"),
+        }
+        for migration in sorted(migrations, key=lambda m: m.version)
+    ]
+
+
+class AppliedMigrations:
+    """
+    Lets request handlers ask whether a migration has been applied, so they can switch from the
+    dual-read form of a query to the native one. A migration never becomes unapplied, so positive
+    answers are kept for good; negative ones are re-checked after MIGRATION_STATE_TTL_SECONDS.
+    """
+
+    def __init__(self, ttl_seconds: float = MIGRATION_STATE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._applied: set = set()
+        self._checked_at: Dict[str, float] = {}
+
+    async def contains(self, db: AsyncIOMotorDatabase, version: str) -> bool:
+        if version in self._applied:
+            return True
+        now = time.monotonic()
+        if now - self._checked_at.get(version, float("-inf")) < self.ttl_seconds:
+            return False
+        self._checked_at[version] = now
+        if await db[STATE_COLLECTION].find_one({"_id": version, "status": "applied"}, {"_id": 1}):
+            self._applied.add(version)
+            return True
+        return False
+
+    def forget(self):
+        self._checked_at.clear()
+
+
+applied_migrations = AppliedMigrations()
@@ -0,0 +1,27 @@
+from typing import Optional
+from migrations.base import DocumentMigration
+from models.transaction import iso_week, parse_stored_date
+from native_types import NATIVE_TYPES_MIGRATION, native_fields
+
+
+class TransactionNativeTypes(DocumentMigration):
+    """
+    Adds `amount_cents` and `date_at` (see native_types.py) to transactions written before they existed.
+    Legacy unpadded dates ("2024-1-5") are stored padded on the way, with `month` and `week` derived
+    again; the rollups and person ledgers keyed on the old values are rebuilt for everyone by
+    migrations 0003 and 0006.
+    """
+    version = NATIVE_TYPES_MIGRATION
+    name = "transaction_native_types"
+    collection = "transactions"
+    query = {"$or": [{"amount_cents": {"$exists": False}}, {"date_at": {"$exists": False}}]}
+    source_fields = ("user_id", "amount", "date")
+
+    def migrate_document(self, doc: dict) -> Optional[dict]:
+        fields = {}
+        if isinstance(doc.get("date"), str):
+            normalized = parse_stored_date(doc["date"]).isoformat()
+            if normalized != doc["date"]:
+                fields.update(date=normalized, month=normalized[:7], week=iso_week(normalized))
+        fields.update(native_fields({**doc, **fields}))
+        return fields or None
@@ -0,0 +1,25 @@
+from collections import defaultdict
+from typing import List, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from migrations.base import DocumentMigration, MigrationState
+from change_feed import SYNC_MIGRATION, allocate_seqs
+
+
+class TransactionSeq(DocumentMigration):
+    """Gives transactions written before the change feed existed a `seq` (see change_feed.py)."""
+    version = SYNC_MIGRATION
+    name = "transaction_seq"
+    collection = "transactions"
+    query = {"seq": {"$exists": False}}
+    source_fields = ("user_id",)
+
+    async def migrate_batch(self, db: AsyncIOMotorDatabase, docs: List[dict], state: MigrationState) -> List[Tuple[dict, dict]]:
+        # One counter increment per user in the batch rather than one per document
+        by_user = defaultdict(list)
+        for doc in docs:
+            by_user[doc["user_id"]].append(doc)
+        changed = []
+        for user_id, user_docs in by_user.items():
+            first = await allocate_seqs(db, user_id, len(user_docs))
+            changed.extend((doc, {"seq": first + offset}) for offset, doc in enumerate(user_docs))
+        return changed
@@ -0,0 +1,16 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from migrations.base import PerUserMigration
+import rollups
+
+
+class MonthlyRollups(PerUserMigration):
+    """
+    Builds the monthly rollups (see rollups.py) of every user from their transactions. The write path
+    only keeps existing rollups up to date, so until this has run the stats routes that read them
+    aggregate the raw transactions instead.
+    """
+    version = rollups.ROLLUPS_MIGRATION
+    name = "monthly_rollups"
+
+    async def migrate_user(self, db: AsyncIOMotorDatabase, user_id: str) -> int:
+        return await rollups.rebuild_rollups(db, user_id=user_id)
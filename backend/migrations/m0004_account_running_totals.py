@@ -0,0 +1,15 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from migrations.base import PerUserMigration
+import balances
+
+
+class AccountRunningTotals(PerUserMigration):
+    """
+    Sets the running totals (see balances.py) of every user's accounts from their transactions. The
+    write path only adjusts the stored totals, so until this has run the account routes compute them.
+    """
+    version = balances.BALANCES_MIGRATION
+    name = "account_running_totals"
+
+    async def migrate_user(self, db: AsyncIOMotorDatabase, user_id: str) -> int:
+        return len(await balances.reconcile_balances(db, user_id=user_id, repair=True))
@@ -0,0 +1,16 @@
+from typing import Optional
+from migrations.base import DocumentMigration
+from models.transaction import iso_week
+from trends import WEEK_MIGRATION
+
+
+class TransactionWeek(DocumentMigration):
+    """Adds the ISO `week` field (see trends.py) to transactions written before it existed."""
+    version = WEEK_MIGRATION
+    name = "transaction_week"
+    collection = "transactions"
+    query = {"week": {"$exists": False}}
+    source_fields = ("date",)
+
+    def migrate_document(self, doc: dict) -> Optional[dict]:
+        return {"week": iso_week(doc["date"])}
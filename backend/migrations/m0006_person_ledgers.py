@@ -0,0 +1,16 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from migrations.base import PerUserMigration
+import people_balances
+
+
+class PersonLedgers(PerUserMigration):
+    """
+    Builds the person ledgers (see people_balances.py) of every user from their transactions. The
+    write path only keeps existing ledgers up to date, so until this has run the people routes
+    aggregate the raw transactions instead.
+    """
+    version = people_balances.LEDGERS_MIGRATION
+    name = "person_ledgers"
+
+    async def migrate_user(self, db: AsyncIOMotorDatabase, user_id: str) -> int:
+        return await people_balances.rebuild_person_ledgers(db, user_id=user_id)
@@ -0,0 +1,15 @@
+from typing import Optional
+from migrations.base import DocumentMigration
+from search import SEARCH_FIELDS, SEARCH_MIGRATION, search_fields
+
+
+class TransactionSearchFields(DocumentMigration):
+    """Adds the normalized search fields (see search.py) to transactions written before they existed."""
+    version = SEARCH_MIGRATION
+    name = "transaction_search_fields"
+    collection = "transactions"
+    query = {"search_words": {"$exists": False}}
+    source_fields = SEARCH_FIELDS
+
+    def migrate_document(self, doc: dict) -> Optional[dict]:
+        return search_fields(doc)
@@ -1,10 +1,12 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, computed_field
 from typing import Optional
 import uuid
 from datetime import datetime
+from native_types import CENTS
 
 class AccountBase(BaseModel):
     name: str
+    # Opening balance set by the user; transactions are added on top of it
     balance: Optional[float] = 0.0
 
 class AccountCreate(AccountBase):
@@ -18,3 +20,17 @@ class Account(AccountBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Running totals maintained by every transaction write (see balances.py); the net is kept in
+    # integer cents and returned in the currency unit
+    transaction_net_cents: int = Field(default=0, exclude=True)
+    transaction_count: int = 0
+
+    @computed_field
+    @property
+    def transaction_net(self) -> float:
+        return self.transaction_net_cents / CENTS
+
+    @computed_field
+    @property
+    def current_balance(self) -> float:
+        return (self.balance or 0.0) + self.transaction_net
@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import Dict, Literal, Optional
+from datetime import datetime
+
+class Job(BaseModel):
+    id: str
+    type: str
+    status: Literal["pending", "running", "completed", "failed"]
+    # Per-collection counts of documents processed so far
+    progress: Dict[str, int] = {}
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
@@ -1,8 +1,52 @@
-from pydantic import BaseModel, Field, validator
-from typing import Optional, Literal, List
-from datetime import datetime
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, Optional, Literal, List
+from datetime import date, datetime
+import re
 import uuid
 
+# Dates are stored as zero-padded YYYY-MM-DD strings; `month` and `week` are derived from them
+DATE_PATTERN = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+
+def parse_stored_date(date_str: str) -> date:
+    """
+    Parses a stored date. Documents written before input dates were strictly validated can hold
+    unpadded dates such as '2024-1-5', which date.fromisoformat rejects but strptime accepts.
+    """
+    try:
+        return date.fromisoformat(date_str)
+    except ValueError:
+        return datetime.strptime(date_str, "%Y-%m-%d").date()
+
+def iso_week(date_str: str) -> str:
+    """ISO-8601 week of a YYYY-MM-DD date, e.g. '2024-W01'. Sorts chronologically as a string."""
+    year, week, _ = parse_stored_date(date_str).isocalendar()
+    return f"{year}-W{week:02d}"
+
+def _check_amount(v: float) -> float:
+    if v <= 0:
+        raise ValueError('Amount must be positive')
+    return v
+
+def _check_category(v: str) -> str:
+    v = v.strip()
+    if not v:
+        raise ValueError('Category cannot be empty')
+    return v
+
+def _check_date(v: str) -> str:
+    # The pattern checks the shape, the date constructor rejects impossible days such as 2024-02-30
+    if DATE_PATTERN.fullmatch(v):
+        try:
+            date(int(v[:4]), int(v[5:7]), int(v[8:10]))
+            return v
+        except ValueError:
+            pass
+    raise ValueError('Date must be in YYYY-MM-DD format')
+
+PositiveAmount = Annotated[float, AfterValidator(_check_amount)]
+Category = Annotated[str, AfterValidator(_check_category)]
+DateString = Annotated[str, AfterValidator(_check_date)]
+
 class TransactionBase(BaseModel):
     type: Literal["income", "expense"]
     category: str
@@ -16,63 +60,28 @@ class TransactionBase(BaseModel):
     split_with: Optional[List[str]] = None
 
 class TransactionCreate(TransactionBase):
-    @validator('amount')
-    def amount_must_be_positive(cls, v):
-        if v <= 0:
-            raise ValueError('Amount must be positive')
-        return v
-    
-    @validator('category')
-    def category_must_not_be_empty(cls, v):
-        if not v or not v.strip():
-            raise ValueError('Category cannot be empty')
-        return v.strip()
-    
-    @validator('date')
-    def validate_date_format(cls, v):
-        try:
-            datetime.strptime(v, '%Y-%m-%d')
-        except ValueError:
-            raise ValueError('Date must be in YYYY-MM-DD format')
-        return v
+    category: Category
+    amount: PositiveAmount
+    date: DateString
 
 class TransactionUpdate(BaseModel):
     type: Optional[Literal["income", "expense"]] = None
-    category: Optional[str] = None
-    amount: Optional[float] = None
+    category: Optional[Category] = None
+    amount: Optional[PositiveAmount] = None
     description: Optional[str] = None
-    date: Optional[str] = None
+    date: Optional[DateString] = None
     person: Optional[str] = None
     account_id: Optional[str] = None
     # NEW FIELDS for splitting
     group_name: Optional[str] = None
     split_with: Optional[List[str]] = None
-    
-    @validator('amount')
-    def amount_must_be_positive(cls, v):
-        if v is not None and v <= 0:
-            raise ValueError('Amount must be positive')
-        return v
-
-    @validator('category')
-    def category_must_not_be_empty(cls, v):
-        if v is not None and (not v or not v.strip()):
-            raise ValueError('Category cannot be empty')
-        return v.strip() if v else v
-    
-    @validator('date')
-    def validate_date_format(cls, v):
-        if v is not None:
-            try:
-                datetime.strptime(v, '%Y-%m-%d')
-            except ValueError:
-                raise ValueError('Date must be in YYYY-MM-DD format')
-        return v
 
 class Transaction(TransactionBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     month: str
+    # Precomputed at write time so weekly trends can group without date conversion
+    week: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
@@ -82,7 +91,8 @@ class Transaction(TransactionBase):
         return cls(
             user_id=user_id,
             month=month,
-            **transaction_create.dict()
+            week=iso_week(transaction_create.date),
+            **transaction_create.model_dump()
         )
 
 # ... (rest of the file remains the same)
@@ -94,6 +104,12 @@ class MonthlyStats(BaseModel):
     expense: float = 0.0
     net: float = 0.0
 
+class DashboardStats(BaseModel):
+    total_income: float = 0.0
+    total_expenses: float = 0.0
+    balance: float = 0.0
+    transaction_count: int = 0
+
 class CategoryStats(BaseModel):
     name: str
     value: float
@@ -114,6 +130,27 @@ class SettleUpPayload(BaseModel):
     """Defines the data required to settle a balance with a person."""
     account_id: str
 
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    """Outcome of a bulk import; `errors` lists the first failing rows by their line number."""
+    inserted: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
+
+class TransactionChanges(BaseModel):
+    """
+    One page of the change feed: transactions created or updated and ids of transactions deleted since
+    the sync token. `next` is the token for the following request; `has_more` means ask again right away.
+    """
+    changes: List[Transaction] = []
+    deleted: List[str] = []
+    next: str
+    has_more: bool = False
+
 class GranularTrendStats(BaseModel):
     date: str
     income: float = 0.0
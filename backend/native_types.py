@@ -0,0 +1,46 @@
+import math
+from datetime import datetime, time
+from models.transaction import parse_stored_date
+
+# Besides the API-facing `amount` (float) and `date` (YYYY-MM-DD string), every transaction stores:
+# - `amount_cents`: the amount in integer minor units, so sums are exact
+# - `date_at`: the date as a BSON Date (UTC midnight), so date ranges and date operators need no
+#   per-row conversion
+# Transactions written before these fields existed get them from migration 0001. Until it has
+# run, pipelines read them through the dual-read expressions below. Amounts are always read through
+# AMOUNT_CENTS, even once it has run: rows the migration could not convert are skipped and still
+# lack `amount_cents`, and must count with their real amount like they do in the rollups.
+NATIVE_TYPES_MIGRATION = "0001"
+
+# Aggregation results in cents are divided by this before being returned
+CENTS = 100
+
+# Amounts are always positive, so adding one half and flooring rounds to the nearest cent (as to_cents does)
+AMOUNT_CENTS = {"$ifNull": ["$amount_cents", {"$toLong": {"$floor": {"$add": [{"$multiply": ["$amount", CENTS]}, 0.5]}}}]}
+DATE_AT = {"$ifNull": ["$date_at", {"$toDate": "$date"}]}
+
+
+def to_cents(amount: float) -> int:
+    return math.floor(amount * CENTS + 0.5)
+
+
+def date_at(date_str: str) -> datetime:
+    return datetime.combine(parse_stored_date(date_str), time.min)
+
+
+def amount_cents_of(doc: dict) -> int:
+    """A transaction's amount in cents; documents from before migration 0001 only have `amount`."""
+    cents = doc.get("amount_cents")
+    return cents if cents is not None else to_cents(doc["amount"])
+
+
+def native_fields(doc: dict) -> dict:
+    """The native-typed fields for a transaction document, or for the fields set by an update."""
+    fields = {}
+    if doc.get("amount") is not None:
+        fields["amount_cents"] = to_cents(doc["amount"])
+    if doc.get("date") is not None:
+        fields["date_at"] = date_at(doc["date"])
+    return fields
+
+
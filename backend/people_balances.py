@@ -0,0 +1,251 @@
+import math
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from models.transaction import PersonStats
+from singleflight import aggregate
+from native_types import AMOUNT_CENTS, CENTS, amount_cents_of
+from rollups import replace_derived_documents
+
+# Each person_ledgers document holds a user's running totals with one person:
+# {user_id, person, given_cents, received_cents, split_owed_cents, direct_count, split_count, last_activity, updated_at}
+# `given_cents`/`received_cents` come from direct transactions, `split_owed_cents` from the person's
+# shares of split expenses, so  net_balance = received + split_owed - given  as in people_balance_stages.
+# Amounts are integer cents, so incremental updates never drift from a rebuild.
+# The write path keeps the ledgers up to date; migration 0006 builds them for the transactions
+# written before that. Until it has run, balances are aggregated from the raw transactions.
+LEDGERS_MIGRATION = "0006"
+LEDGER_AMOUNT_FIELDS = ("given_cents", "received_cents", "split_owed_cents", "direct_count", "split_count")
+# The transaction fields the ledger entries are computed from
+LEDGER_SOURCE_FIELDS = ("user_id", "type", "amount", "amount_cents", "date", "person", "split_with")
+
+# Transactions store explicit nulls for `person` and `split_with`, so a sparse index would still
+# cover every document. The people indexes are partial on these filters instead, and queries
+# include them so the planner can use those indexes.
+HAS_PERSON = {"person": {"$type": "string"}}
+HAS_SPLIT = {"split_with": {"$type": "string"}}
+
+
+def people_match(person: Optional[str] = None) -> dict:
+    """Matches the transactions that involve `person`, or any person at all."""
+    if person is None:
+        return {"$or": [HAS_PERSON, HAS_SPLIT]}
+    return {"$or": [
+        {"person": {**HAS_PERSON["person"], "$eq": person}},
+        {"split_with": {**HAS_SPLIT["split_with"], "$eq": person}},
+    ]}
+
+
+def split_share_cents(amount_cents: int, participants: int) -> int:
+    """Each participant's share of a split, in cents, rounded as people_balance_stages rounds it."""
+    return math.floor(amount_cents / (participants + 1) + 0.5)
+
+
+def people_balance_stages(person: Optional[str] = None, amount=AMOUNT_CENTS) -> List[dict]:
+    """
+    Per-person balances in a single pass over the matched transactions. Each transaction emits one
+    entry for its direct `person` (income = received, expense = given) plus one per split participant,
+    whose share of the split counts as money to be received from them. Contains no $facet, so it can
+    also run as a sub-pipeline of the overview facet. Sums integer cents (`amount`, see
+    native_types.AMOUNT_CENTS) and converts them to the currency unit at the end.
+    """
+    direct_entry = {
+        "name": "$person",
+        "received": {"$cond": [{"$eq": ["$type", "income"]}, amount, 0]},
+        "given": {"$cond": [{"$eq": ["$type", "expense"]}, amount, 0]},
+    }
+    split_entries = {"$map": {
+        "input": "$split_with",
+        "as": "participant",
+        "in": {
+            "name": "$$participant",
+            "received": {"$floor": {"$add": [{"$divide": [amount, {"$add": [{"$size": "$split_with"}, 1]}]}, 0.5]}},
+            "given": 0,
+        },
+    }}
+    stages = [
+        {"$project": {"_id": 0, "entries": {"$concatArrays": [
+            {"$cond": [{"$eq": [{"$type": "$person"}, "string"]}, [direct_entry], []]},
+            {"$cond": [{"$isArray": "$split_with"}, split_entries, []]},
+        ]}}},
+        {"$unwind": "$entries"},
+    ]
+    if person is not None:
+        stages.append({"$match": {"entries.name": person}})
+    stages += [
+        {"$group": {
+            "_id": "$entries.name",
+            "total_received": {"$sum": "$entries.received"},
+            "total_given": {"$sum": "$entries.given"},
+            "transaction_count": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "name": "$_id",
+            "total_given": {"$divide": ["$total_given", CENTS]},
+            "total_received": {"$divide": ["$total_received", CENTS]},
+            "net_balance": {"$divide": [{"$subtract": ["$total_received", "$total_given"]}, CENTS]},
+            "transaction_count": "$transaction_count",
+        }},
+        {"$sort": {"name": 1}},
+    ]
+    return stages
+
+
+def _ledger_entries(doc: dict) -> Iterator[Tuple[str, dict]]:
+    """The ledger amounts one transaction contributes, per person (mirrors people_balance_stages)."""
+    amount_cents = amount_cents_of(doc)
+    person = doc.get("person")
+    if isinstance(person, str):
+        yield person, {
+            "given_cents": amount_cents if doc.get("type") == "expense" else 0,
+            "received_cents": amount_cents if doc.get("type") == "income" else 0,
+            "direct_count": 1,
+        }
+    split_with = doc.get("split_with")
+    if isinstance(split_with, list) and split_with:
+        share = split_share_cents(amount_cents, len(split_with))
+        for participant in split_with:
+            yield participant, {"split_owed_cents": share, "split_count": 1}
+
+
+def _collect_ledger_deltas(added: Iterable[dict], removed: Iterable[dict]) -> Tuple[dict, dict]:
+    deltas = defaultdict(lambda: dict.fromkeys(LEDGER_AMOUNT_FIELDS, 0))
+    last_activity = {}
+    for sign, docs in ((1, added), (-1, removed)):
+        for doc in docs:
+            for person, entry in _ledger_entries(doc):
+                key = (doc["user_id"], person)
+                for field, value in entry.items():
+                    deltas[key][field] += sign * value
+                if sign > 0:
+                    last_activity[key] = max(last_activity.get(key, doc["date"]), doc["date"])
+    return deltas, last_activity
+
+
+async def apply_transaction_changes(
+    db: AsyncIOMotorDatabase,
+    added: Iterable[dict] = (),
+    removed: Iterable[dict] = (),
+):
+    """Incrementally updates the person ledgers for transactions that were written."""
+    deltas, last_activity = _collect_ledger_deltas(added, removed)
+    now = datetime.utcnow()
+    operations = []
+    for (user_id, person), delta in deltas.items():
+        if not any(delta.values()) and (user_id, person) not in last_activity:
+            continue
+        update = {"$inc": delta, "$set": {"updated_at": now}}
+        if (user_id, person) in last_activity:
+            # Only ever moves forward; deleting the latest transaction leaves it as is
+            update["$max"] = {"last_activity": last_activity[(user_id, person)]}
+        operations.append(UpdateOne({"user_id": user_id, "person": person}, update, upsert=True))
+    if not operations:
+        return
+    await db.person_ledgers.bulk_write(operations, ordered=False)
+
+    # Drop ledgers of people that no longer appear in any transaction
+    emptied_users = {user_id for (user_id, _), delta in deltas.items() if delta["direct_count"] < 0 or delta["split_count"] < 0}
+    for user_id in emptied_users:
+        await db.person_ledgers.delete_many({"user_id": user_id, "direct_count": {"$lte": 0}, "split_count": {"$lte": 0}})
+
+
+def _ledger_pipelines(match_query: dict) -> List[List[dict]]:
+    """Aggregates the ledger fields per (user_id, person): one pipeline for direct transactions, one for split shares."""
+    key = {"user_id": "$user_id", "person": "$person"}
+    direct = [
+        {"$match": {**match_query, **HAS_PERSON}},
+        {"$group": {
+            "_id": key,
+            "given_cents": {"$sum": {"$cond": [{"$eq": ["$type", "expense"]}, AMOUNT_CENTS, 0]}},
+            "received_cents": {"$sum": {"$cond": [{"$eq": ["$type", "income"]}, AMOUNT_CENTS, 0]}},
+            "direct_count": {"$sum": 1},
+            "last_activity": {"$max": "$date"},
+        }},
+    ]
+    splits = [
+        {"$match": {**match_query, **HAS_SPLIT}},
+        {"$project": {
+            "user_id": 1,
+            "date": 1,
+            "person": "$split_with",
+            "share": {"$floor": {"$add": [{"$divide": [AMOUNT_CENTS, {"$add": [{"$size": "$split_with"}, 1]}]}, 0.5]}},
+        }},
+        {"$unwind": "$person"},
+        {"$group": {
+            "_id": key,
+            "split_owed_cents": {"$sum": "$share"},
+            "split_count": {"$sum": 1},
+            "last_activity": {"$max": "$date"},
+        }},
+    ]
+    return [direct, splits]
+
+
+async def rebuild_person_ledgers(db: AsyncIOMotorDatabase, user_id: Optional[str] = None, batch_size: int = 1000) -> int:
+    """
+    Recomputes the person ledgers from the raw transactions, for one user or for everyone. The
+    transactions are aggregated server-side; only one result per (user, person) reaches the app.
+    """
+    match_query = {"user_id": user_id} if user_id else {}
+    started_at = datetime.utcnow()
+    ledgers = {}
+    for pipeline in _ledger_pipelines(match_query):
+        async for result in db.transactions.aggregate(pipeline, allowDiskUse=True):
+            key = (result["_id"]["user_id"], result["_id"]["person"])
+            ledger = ledgers.setdefault(key, {
+                "user_id": key[0], "person": key[1], **dict.fromkeys(LEDGER_AMOUNT_FIELDS, 0), "last_activity": None,
+            })
+            for field in LEDGER_AMOUNT_FIELDS:
+                ledger[field] += int(result.get(field, 0))
+            ledger["last_activity"] = max(filter(None, (ledger["last_activity"], result["last_activity"])), default=None)
+
+    async def docs():
+        for ledger in ledgers.values():
+            yield ledger
+
+    return await replace_derived_documents(db.person_ledgers, match_query, docs(), ("user_id", "person"), started_at, batch_size)
+
+
+def ledger_to_stats(ledger: dict) -> PersonStats:
+    received_cents = ledger.get("received_cents", 0) + ledger.get("split_owed_cents", 0)
+    given_cents = ledger.get("given_cents", 0)
+    return PersonStats(
+        name=ledger["person"],
+        total_given=given_cents / CENTS,
+        total_received=received_cents / CENTS,
+        net_balance=(received_cents - given_cents) / CENTS,
+        transaction_count=ledger.get("direct_count", 0) + ledger.get("split_count", 0),
+    )
+
+
+async def get_people_balances(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    account_id: Optional[str] = None,
+    person: Optional[str] = None,
+    hidden_accounts: List[str] = (),
+    ledgers: bool = True,
+) -> List[PersonStats]:
+    """
+    Balances with every person (or just `person`), shared by /stats/people and settle-up. Served
+    from the person ledgers; only per-account balances need to aggregate the raw transactions, and
+    so do all balances while `hidden_accounts` (accounts being deleted, which the ledgers still
+    count) are left out, or while the ledgers are not built yet (`ledgers` is False).
+    """
+    if ledgers and not account_id and not hidden_accounts:
+        ledger_query = {"user_id": user_id}
+        if person is not None:
+            ledger_query["person"] = person
+        cursor = db.person_ledgers.find(ledger_query, {"_id": 0}).sort("person", 1)
+        return [ledger_to_stats(ledger) for ledger in await cursor.to_list(length=None)]
+
+    match_query = {"user_id": user_id, **people_match(person)}
+    if account_id:
+        match_query["account_id"] = account_id
+    if hidden_accounts:
+        match_query["$and"] = [{"account_id": {"$nin": list(hidden_accounts)}}]
+    pipeline = [{"$match": match_query}, *people_balance_stages(person)]
+    return [PersonStats(**r) for r in await aggregate(db.transactions, pipeline, user_id)]
@@ -0,0 +1,145 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import AsyncIterable, Iterable, List, Optional, Sequence
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import ReplaceOne, UpdateOne
+from native_types import AMOUNT_CENTS, amount_cents_of
+
+# Each rollup document aggregates a user's transactions for one bucket:
+# {user_id, account_id, month, type, category, total_cents, count, updated_at}
+# `updated_at` is set by every write, incremental or rebuild (see replace_derived_documents).
+ROLLUP_KEY_FIELDS = ("user_id", "account_id", "month", "type", "category")
+
+# The write path keeps the rollups up to date; migration 0003 builds them for the transactions
+# written before that. Until it has run, the stats routes read the raw transactions.
+ROLLUPS_MIGRATION = "0003"
+
+
+def _rollup_key(doc: dict) -> tuple:
+    return tuple(doc.get(field) for field in ROLLUP_KEY_FIELDS)
+
+
+def _collect_deltas(added: Iterable[dict], removed: Iterable[dict]) -> dict:
+    """Folds added/removed transaction documents into per-bucket (total_cents, count) deltas."""
+    deltas = defaultdict(lambda: [0, 0])
+    for doc in added:
+        delta = deltas[_rollup_key(doc)]
+        delta[0] += amount_cents_of(doc)
+        delta[1] += 1
+    for doc in removed:
+        delta = deltas[_rollup_key(doc)]
+        delta[0] -= amount_cents_of(doc)
+        delta[1] -= 1
+    return deltas
+
+
+async def apply_transaction_changes(
+    db: AsyncIOMotorDatabase,
+    added: Iterable[dict] = (),
+    removed: Iterable[dict] = (),
+):
+    """
+    Incrementally updates the monthly rollups for transactions that were written.
+    An update is expressed as removing the old document and adding the new one.
+    """
+    deltas = _collect_deltas(added, removed)
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            dict(zip(ROLLUP_KEY_FIELDS, key)),
+            {"$inc": {"total_cents": total_cents, "count": count}, "$set": {"updated_at": now}},
+            upsert=True,
+        )
+        for key, (total_cents, count) in deltas.items()
+        if count or total_cents
+    ]
+    if not operations:
+        return
+    await db.monthly_rollups.bulk_write(operations, ordered=False)
+
+    # Drop buckets that no longer hold any transactions
+    emptied_users = {key[0] for key, (_, count) in deltas.items() if count < 0}
+    for user_id in emptied_users:
+        await db.monthly_rollups.delete_many({"user_id": user_id, "count": {"$lte": 0}})
+
+
+def _raw_rollup_pipeline(user_id: Optional[str]) -> List[dict]:
+    match_query = {"user_id": user_id} if user_id else {}
+    return [
+        {"$match": match_query},
+        {"$group": {
+            "_id": {field: f"${field}" for field in ROLLUP_KEY_FIELDS},
+            "total_cents": {"$sum": AMOUNT_CENTS},
+            "count": {"$sum": 1},
+        }},
+    ]
+
+
+def _to_rollup_doc(result: dict) -> dict:
+    doc = {field: result["_id"].get(field) for field in ROLLUP_KEY_FIELDS}
+    doc["total_cents"] = result["total_cents"]
+    doc["count"] = result["count"]
+    return doc
+
+
+async def replace_derived_documents(
+    collection: AsyncIOMotorCollection,
+    match_query: dict,
+    docs: AsyncIterable[dict],
+    key_fields: Sequence[str],
+    started_at: datetime,
+    batch_size: int = 1000,
+) -> int:
+    """
+    Writes recomputed derived documents (rollups, person ledgers) over the stored ones, one
+    ReplaceOne(upsert=True) per key, then deletes the stored documents under `match_query` that were
+    not rewritten. The collection is never emptied, so reads and concurrent incremental upserts keep
+    working on the unique key index while a rebuild runs. Every write sets `updated_at`, so the
+    documents to delete are the ones last written before the rebuild read the transactions
+    (`started_at`); documents that concurrent upserts touched meanwhile are kept.
+    """
+    written = 0
+    batch = []
+    async for doc in docs:
+        doc["updated_at"] = datetime.utcnow()
+        batch.append(ReplaceOne({field: doc.get(field) for field in key_fields}, doc, upsert=True))
+        if len(batch) >= batch_size:
+            await collection.bulk_write(batch, ordered=False)
+            written += len(batch)
+            batch = []
+    if batch:
+        await collection.bulk_write(batch, ordered=False)
+        written += len(batch)
+    # Documents written before updated_at existed have no timestamp and are stale as well
+    await collection.delete_many({**match_query, "updated_at": {"$not": {"$gte": started_at}}})
+    return written
+
+
+async def rebuild_rollups(db: AsyncIOMotorDatabase, user_id: Optional[str] = None, batch_size: int = 1000) -> int:
+    """Recomputes rollups from the raw transactions, for one user or for everyone."""
+    match_query = {"user_id": user_id} if user_id else {}
+    started_at = datetime.utcnow()
+    results = db.transactions.aggregate(_raw_rollup_pipeline(user_id), allowDiskUse=True)
+    docs = (_to_rollup_doc(result) async for result in results)
+    return await replace_derived_documents(db.monthly_rollups, match_query, docs, ROLLUP_KEY_FIELDS, started_at, batch_size)
+
+
+async def check_rollups(db: AsyncIOMotorDatabase, user_id: Optional[str] = None) -> List[dict]:
+    """Compares stored rollups against the raw transactions and returns every mismatching bucket."""
+    match_query = {"user_id": user_id} if user_id else {}
+    expected = {}
+    async for result in db.transactions.aggregate(_raw_rollup_pipeline(user_id), allowDiskUse=True):
+        doc = _to_rollup_doc(result)
+        expected[_rollup_key(doc)] = doc
+
+    mismatches = []
+    async for stored in db.monthly_rollups.find(match_query, {"_id": 0}):
+        key = _rollup_key(stored)
+        raw = expected.pop(key, None)
+        if raw is None:
+            if stored.get("count", 0) != 0:
+                mismatches.append({"key": key, "stored": stored, "expected": None})
+        elif raw["count"] != stored.get("count") or raw["total_cents"] != stored.get("total_cents"):
+            mismatches.append({"key": key, "stored": stored, "expected": raw})
+    mismatches.extend({"key": key, "stored": None, "expected": raw} for key, raw in expected.items())
+    return mismatches
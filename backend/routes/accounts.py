@@ -1,30 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
 from models.account import Account, AccountCreate, AccountUpdate
 from database import get_database
 from auth import get_current_user_id
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pymongo import ReturnDocument
+import balances
+import changes
+import deletions
+from migrations import applied_migrations
+from serialization import ModelList
+from cache import conditional_get
 
 router = APIRouter(prefix="/accounts", tags=["accounts"])
 
+account_list = ModelList(Account)
+
 @router.post("/", response_model=Account)
 async def create_account(
     account_data: AccountCreate,
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    account = Account(**account_data.dict(), user_id=user_id)
-    await db.accounts.insert_one(account.dict())
+    account = Account(**account_data.model_dump(), user_id=user_id)
+    await db.accounts.insert_one({**account.model_dump(exclude={"current_balance", "transaction_net"}), "transaction_net_cents": 0})
+    await changes.account_changed(db, user_id)
     return account
 
 @router.get("/", response_model=List[Account])
+@conditional_get("accounts")
 async def get_accounts(
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    cursor = db.accounts.find({"user_id": user_id})
-    return [Account(**doc) for doc in await cursor.to_list(length=None)]
+    # Balances are kept current by every transaction write, so this is one indexed read
+    cursor = db.accounts.find({"user_id": user_id, **deletions.NOT_DELETED}, account_list.projection)
+    accounts = await cursor.to_list(length=None)
+    if not await applied_migrations.contains(db, balances.BALANCES_MIGRATION):
+        accounts = await balances.with_computed_totals(db, user_id, accounts)
+    return account_list.response(accounts)
 
 @router.put("/{account_id}", response_model=Account)
 async def update_account(
@@ -33,41 +47,33 @@ async def update_account(
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    update_data = account_data.dict(exclude_unset=True)
+    update_data = account_data.model_dump(exclude_unset=True)
     if not update_data:
         raise HTTPException(status_code=400, detail="No update data provided")
 
     updated_account = await db.accounts.find_one_and_update(
-        {"id": account_id, "user_id": user_id},
+        {"id": account_id, "user_id": user_id, **deletions.NOT_DELETED},
         {"$set": update_data},
         return_document=ReturnDocument.AFTER
     )
     if not updated_account:
         raise HTTPException(status_code=404, detail="Account not found")
+    await changes.account_changed(db, user_id)
+    if not await applied_migrations.contains(db, balances.BALANCES_MIGRATION):
+        [updated_account] = await balances.with_computed_totals(db, user_id, [updated_account])
     return Account(**updated_account)
 
-@router.delete("/{account_id}")
+@router.delete("/{account_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_account(
     account_id: str,
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    # ✨ FIX: Simplified deletion logic to be more robust.
-    # We first ensure the account exists, then delete its transactions, then the account itself.
-    # This avoids the strict requirements and complexity of database transactions.
-    try:
-        # Step 1: Check if the account exists for this user
-        account_to_delete = await db.accounts.find_one({"id": account_id, "user_id": user_id})
-        if not account_to_delete:
-            raise HTTPException(status_code=404, detail="Account not found")
-
-        # Step 2: Delete all transactions associated with that account
-        await db.transactions.delete_many({"account_id": account_id, "user_id": user_id})
-
-        # Step 3: Delete the account itself
-        await db.accounts.delete_one({"id": account_id, "user_id": user_id})
-        
-        return {"message": "Account and all associated transactions deleted successfully"}
-    except Exception as e:
-        # Log the exception e for debugging if you have a logger setup
-        raise HTTPException(status_code=500, detail=f"An error occurred while deleting the account: {e}")
\ No newline at end of file
+    """
+    Hides the account immediately and deletes it with all of its transactions in a background job.
+    Poll `GET /api/jobs/{job_id}` for progress.
+    """
+    job = await deletions.start_account_deletion(db, user_id, account_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Account not found")
+    return {"message": "Account deletion started", "job_id": job["id"]}
@@ -6,6 +6,13 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 from models.transaction import Transaction, TransactionCreate, SettleUpPayload # ✨ MODIFIED
 from datetime import datetime
 import math
+import changes
+import change_feed
+from people_balances import HAS_PERSON, LEDGERS_MIGRATION, get_people_balances
+from deletions import NOT_DELETED, accounts_being_deleted
+import search as transaction_search
+from native_types import native_fields
+from migrations import applied_migrations
 
 router = APIRouter(prefix="/people", tags=["people"])
 
@@ -15,9 +22,15 @@ async def get_people(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get a unique, sorted list of all people associated with a user's transactions."""
-    people_list = await db.transactions.distinct("person", {"user_id": user_id, "person": {"$ne": None}})
-    people_list.sort()
-    return people_list
+    hidden_accounts = await accounts_being_deleted(db, user_id)
+    if hidden_accounts or not await applied_migrations.contains(db, LEDGERS_MIGRATION):
+        # The ledgers still count the transactions of an account being deleted, and are not built
+        # for existing users until migration 0006 has run
+        people = await db.transactions.distinct("person", {"user_id": user_id, **HAS_PERSON, "account_id": {"$nin": hidden_accounts}})
+        return sorted(people)
+    # Read from the person ledgers; people who only appear in splits are not listed
+    cursor = db.person_ledgers.find({"user_id": user_id, "direct_count": {"$gt": 0}}, {"_id": 0, "person": 1}).sort("person", 1)
+    return [ledger["person"] for ledger in await cursor.to_list(length=None)]
 
 # ✨ ADD THIS NEW ENDPOINT ✨
 @router.post("/{name}/settle", response_model=Transaction, status_code=status.HTTP_201_CREATED)
@@ -31,28 +44,21 @@ async def settle_up_with_person(
     Settles the balance with a specific person by creating a balancing transaction.
     """
     # 1. Verify the account exists and belongs to the user
-    account = await db.accounts.find_one({"id": payload.account_id, "user_id": user_id})
+    account = await db.accounts.find_one({"id": payload.account_id, "user_id": user_id, **NOT_DELETED})
     if not account:
         raise HTTPException(status_code=404, detail="Account not found for this user")
 
-    # 2. Calculate the current net balance for the person
-    pipeline = [
-        {"$match": {"user_id": user_id, "person": name}},
-        {"$group": {
-            "_id": "$person",
-            "total_received": {"$sum": {"$cond": [{"$eq": ["$type", "income"]}, "$amount", 0]}},
-            "total_given": {"$sum": {"$cond": [{"$eq": ["$type", "expense"]}, "$amount", 0]}},
-        }},
-        {"$project": {
-            "net_balance": {"$subtract": ["$total_received", "$total_given"]},
-        }}
-    ]
-    result = await db.transactions.aggregate(pipeline).to_list(length=1)
-    
-    if not result:
+    # 2. Calculate the current net balance for the person (direct and split transactions,
+    #    exactly as shown by /stats/people)
+    balances = await get_people_balances(
+        db, user_id, person=name,
+        hidden_accounts=await accounts_being_deleted(db, user_id),
+        ledgers=await applied_migrations.contains(db, LEDGERS_MIGRATION),
+    )
+    if not balances:
         raise HTTPException(status_code=404, detail=f"No transactions found for person '{name}'")
-        
-    net_balance = result[0]['net_balance']
+
+    net_balance = balances[0].net_balance
 
     # 3. Check if there is a balance to settle
     if math.isclose(net_balance, 0):
@@ -74,6 +80,11 @@ async def settle_up_with_person(
 
     # 5. Save the new transaction to the database
     transaction = Transaction.from_create(settlement_data, user_id)
-    await db.transactions.insert_one(transaction.dict())
+    transaction_doc = transaction.model_dump()
+    transaction_doc.update(transaction_search.search_fields(transaction_doc))
+    transaction_doc.update(native_fields(transaction_doc))
+    transaction_doc["seq"] = await change_feed.allocate_seqs(db, user_id)
+    await db.transactions.insert_one(transaction_doc)
+    await changes.transactions_changed(db, user_id, added=[transaction_doc])
     
     return transaction
\ No newline at end of file
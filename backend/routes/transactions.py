@@ -1,15 +1,96 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
-from typing import List, Optional, Literal
-from models.transaction import Transaction, TransactionCreate, TransactionUpdate
+from fastapi import APIRouter, HTTPException, Query, Depends, UploadFile, File, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Literal, Tuple, Any
+from models.transaction import Transaction, TransactionCreate, TransactionUpdate, TransactionChanges, ImportReport, iso_week
 from database import get_database
 from auth import get_current_user_id
-import re
+import json
+import base64
+import binascii
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime
 from pymongo import ReturnDocument
+import changes
+import change_feed
+import importer
+import exporter
+import search as transaction_search
+from native_types import native_fields
+from deletions import NOT_DELETED, accounts_being_deleted, hide_accounts
+from serialization import ModelList
+from cache import conditional_get
+from migrations import applied_migrations
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
+# Pages are validated and serialized in one pass (see serialization.py)
+transaction_list = ModelList(Transaction)
+
+# Maps each sort option to (field, direction). Every page is ordered by the field and then
+# by `id`, so (field, id) is a unique, stable key that the next page can resume from.
+SORT_OPTIONS = {
+    "date_desc": ("date", -1),
+    "date_asc": ("date", 1),
+    "amount_desc": ("amount", -1),
+    "amount_asc": ("amount", 1),
+    "category_asc": ("category", 1)
+}
+
+def encode_cursor(sort_value: Any, transaction_id: str) -> str:
+    """Builds an opaque pagination cursor from the last row's sort value and id."""
+    raw = json.dumps([sort_value, transaction_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, transaction_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    if not isinstance(transaction_id, str):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    return sort_value, transaction_id
+
+def build_transaction_filter(
+    user_id: str,
+    account_id: Optional[str] = None,
+    type: Optional[str] = None,
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    hidden_accounts: List[str] = (),
+    search_indexed: bool = True
+) -> Tuple[dict, List[str]]:
+    """
+    Builds the Mongo filter shared by the list and export endpoints; also returns the search tokens.
+    `hidden_accounts` are accounts being deleted, whose transactions are left out. `search_indexed`
+    is False until every transaction has its search fields (see search.build_search_query).
+    """
+    query_filter = {"user_id": user_id}
+
+    query_filter["account_id"] = {"$exists": True}
+
+    if account_id:
+        query_filter["account_id"] = account_id
+    if type:
+        query_filter["type"] = type
+    if category:
+        query_filter["category"] = category
+    search_tokens = []
+    if search:
+        search_filter, search_tokens = transaction_search.build_search_query(search, indexed=search_indexed)
+        query_filter.update(search_filter)
+    hide_accounts(query_filter, hidden_accounts)
+    return query_filter, search_tokens
+
+def keyset_condition(sort_field: str, sort_order: int, cursor: str) -> dict:
+    """Range condition selecting the rows strictly after the cursor in (sort_field, id) order."""
+    sort_value, transaction_id = decode_cursor(cursor)
+    op = "$lt" if sort_order == -1 else "$gt"
+    return {"$or": [
+        {sort_field: {op: sort_value}},
+        {sort_field: sort_value, "id": {op: transaction_id}}
+    ]}
+
 @router.post("/", response_model=Transaction)
 async def create_transaction(
     transaction_data: TransactionCreate,
@@ -17,14 +98,36 @@ async def create_transaction(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     # Verify that the account exists and belongs to the user
-    account = await db.accounts.find_one({"id": transaction_data.account_id, "user_id": user_id})
+    account = await db.accounts.find_one({"id": transaction_data.account_id, "user_id": user_id, **NOT_DELETED})
     if not account:
         raise HTTPException(status_code=404, detail="Account not found for this user")
 
     transaction = Transaction.from_create(transaction_data, user_id)
-    await db.transactions.insert_one(transaction.dict())
+    transaction_doc = transaction.model_dump()
+    transaction_doc.update(transaction_search.search_fields(transaction_doc))
+    transaction_doc.update(native_fields(transaction_doc))
+    transaction_doc["seq"] = await change_feed.allocate_seqs(db, user_id)
+    await db.transactions.insert_one(transaction_doc)
+    await changes.transactions_changed(db, user_id, added=[transaction_doc])
     return transaction
 
+@router.post("/import", response_model=ImportReport)
+async def import_transactions(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "ndjson"]] = Query(default=None, description="Defaults to the file extension"),
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """
+    Bulk-imports transactions from a CSV file (with a header row using the transaction field names,
+    `split_with` separated by ";") or from NDJSON (one transaction object per line).
+    Valid rows are inserted; invalid ones are reported by row number.
+    """
+    fmt = format or importer.detect_format(file.filename, file.content_type)
+    if not fmt:
+        raise HTTPException(status_code=400, detail="Could not detect the file format; pass format=csv or format=ndjson")
+    return await importer.import_transactions(db, user_id, file.file, fmt)
+
 @router.put("/{transaction_id}", response_model=Transaction)
 async def update_transaction(
     transaction_id: str,
@@ -32,32 +135,43 @@ async def update_transaction(
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    update_dict = update_data.dict(exclude_unset=True)
+    update_dict = update_data.model_dump(exclude_unset=True)
     if not update_dict:
         raise HTTPException(status_code=400, detail="No update data provided")
 
     # If account is being changed, verify the new account exists
     if "account_id" in update_dict:
-        account = await db.accounts.find_one({"id": update_dict["account_id"], "user_id": user_id})
+        account = await db.accounts.find_one({"id": update_dict["account_id"], "user_id": user_id, **NOT_DELETED})
         if not account:
             raise HTTPException(status_code=404, detail="New account not found for this user")
 
     if "date" in update_dict:
         update_dict["month"] = update_dict["date"][:7]
+        update_dict["week"] = iso_week(update_dict["date"])
+    update_dict.update(native_fields(update_dict))
 
     update_dict["updated_at"] = datetime.utcnow()
+    update_dict["seq"] = await change_feed.allocate_seqs(db, user_id)
 
-    updated_transaction = await db.transactions.find_one_and_update(
-        {"id": transaction_id, "user_id": user_id},
+    previous_transaction = await db.transactions.find_one_and_update(
+        hide_accounts({"id": transaction_id, "user_id": user_id}, await accounts_being_deleted(db, user_id)),
         {"$set": update_dict},
-        return_document=ReturnDocument.AFTER
+        return_document=ReturnDocument.BEFORE
     )
 
-    if updated_transaction:
+    if previous_transaction:
+        updated_transaction = {**previous_transaction, **update_dict}
+        if any(field in update_dict for field in transaction_search.SEARCH_FIELDS):
+            await db.transactions.update_one(
+                {"_id": previous_transaction["_id"]},
+                {"$set": transaction_search.search_fields(updated_transaction)}
+            )
+        await changes.transactions_changed(db, user_id, added=[updated_transaction], removed=[previous_transaction])
         return Transaction(**updated_transaction)
     raise HTTPException(status_code=404, detail="Transaction not found")
 
 @router.get("/", response_model=List[Transaction])
+@conditional_get("transactions")
 async def get_transactions(
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_database),
@@ -67,42 +181,115 @@ async def get_transactions(
     type: Optional[Literal["income", "expense", ""]] = Query(default=None),
     category: Optional[str] = None,
     # ✨ FIX: Expanded the Literal to include all frontend sort options
-    sort: Optional[Literal["date_desc", "date_asc", "amount_desc", "amount_asc", "category_asc"]] = Query(default="date_desc")
+    sort: Optional[Literal["date_desc", "date_asc", "amount_desc", "amount_asc", "category_asc"]] = Query(default="date_desc"),
+    cursor: Optional[str] = Query(default=None, description="Opaque `X-Next-Cursor` value returned by the previous page")
 ):
+    """
+    Returns one page of transactions. When more rows are available, the response carries an
+    `X-Next-Cursor` header; pass it back as `cursor` (with the same filters and sort) to get the next page.
+
+    `search` matches word prefixes in the description, category and person through an indexed
+    lookup. Search results are ranked by relevance (whole-word matches first, then `sort`) and are
+    returned as a single page.
+    """
+    sort_field, sort_order = SORT_OPTIONS.get(sort, ("date", -1)) # Default to newest first
+    page_condition = keyset_condition(sort_field, sort_order, cursor) if cursor else None
+
     try:
-        query_filter = {"user_id": user_id}
-
-        query_filter["account_id"] = {"$exists": True}
-
-        if account_id:
-            query_filter["account_id"] = account_id
-        if type:
-            query_filter["type"] = type
-        if category:
-            query_filter["category"] = category
-        if search:
-            regex = re.compile(search, re.IGNORECASE)
-            query_filter["$or"] = [
-                {"description": {"$regex": regex}},
-                {"category": {"$regex": regex}},
-                {"person": {"$regex": regex}}
+        hidden_accounts = await accounts_being_deleted(db, user_id)
+        search_indexed = not search or await applied_migrations.contains(db, transaction_search.SEARCH_MIGRATION)
+        query_filter, search_tokens = build_transaction_filter(user_id, account_id, type, category, search, hidden_accounts, search_indexed)
+
+        if search_tokens:
+            pipeline = [
+                {"$match": query_filter},
+                *transaction_search.relevance_stages(search_tokens),
+                {"$sort": {"_relevance": -1, sort_field: sort_order, "id": sort_order}},
+                {"$limit": limit},
+                {"$project": transaction_list.projection}
             ]
-        
-        # ✨ FIX: Replaced the incomplete if/elif block with a more robust dictionary lookup
-        sort_options = {
-            "date_desc": ("date", -1),
-            "date_asc": ("date", 1),
-            "amount_desc": ("amount", -1),
-            "amount_asc": ("amount", 1),
-            "category_asc": ("category", 1)
-        }
-        sort_field, sort_order = sort_options.get(sort, ("date", -1)) # Default to newest first
-            
-        cursor = db.transactions.find(query_filter).sort(sort_field, sort_order).limit(limit)
-        return [Transaction(**t) for t in await cursor.to_list(length=limit)]
+            return transaction_list.response(await db.transactions.aggregate(pipeline).to_list(length=limit))
+
+        if page_condition:
+            query_filter.setdefault("$and", []).append(page_condition)
+
+        # Fetch one extra row to know whether another page exists
+        db_cursor = db.transactions.find(query_filter, transaction_list.projection).sort([(sort_field, sort_order), ("id", sort_order)]).limit(limit + 1)
+        docs = await db_cursor.to_list(length=limit + 1)
+        headers = {}
+        if len(docs) > limit:
+            docs = docs[:limit]
+            headers["X-Next-Cursor"] = encode_cursor(docs[-1].get(sort_field), docs[-1]["id"])
+        return transaction_list.response(docs, headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch transactions: {e}")
 
+@router.get("/changes", response_model=TransactionChanges)
+async def get_transaction_changes(
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    since: Optional[str] = Query(default=None, description="The `next` token of the previous sync; omit for a full sync"),
+    limit: int = Query(default=500, ge=1, le=1000)
+):
+    """
+    Returns the transactions created, updated or deleted since `since`, in the order they were
+    written. Clients keep a local copy in step by applying `changes` (upsert by id) and `deleted`,
+    then calling again with `next`, right away while `has_more` is true. A change can be sent more
+    than once, so applying it must be idempotent. A token older than the tombstone retention gets a
+    410; the client then starts over without `since`.
+    """
+    if not await applied_migrations.contains(db, change_feed.SYNC_MIGRATION):
+        raise HTTPException(status_code=503, detail="Sync is not available until the transaction seq migration has run")
+    since_seq = 0
+    if since:
+        try:
+            since_seq, issued_at = change_feed.decode_sync_token(since)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if change_feed.token_expired(issued_at):
+            raise HTTPException(status_code=410, detail="Sync token expired; start a full sync")
+
+    written, deleted, next_seq, has_more = await change_feed.changes_since(db, user_id, since_seq, limit, transaction_list.projection)
+    page = TransactionChanges.model_validate({
+        "changes": written,
+        "deleted": [doc["id"] for doc in deleted],
+        # A token the client got just now stays good for the full tombstone retention
+        "next": change_feed.encode_sync_token(next_seq),
+        "has_more": has_more,
+    })
+    return Response(content=page.model_dump_json(), media_type="application/json")
+
+@router.get("/export")
+@conditional_get("transactions/export")
+async def export_transactions(
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    format: Literal["ndjson", "csv"] = Query(default="ndjson"),
+    account_id: Optional[str] = Query(default=None),
+    search: Optional[str] = None,
+    type: Optional[Literal["income", "expense", ""]] = Query(default=None),
+    category: Optional[str] = None,
+    sort: Optional[Literal["date_desc", "date_asc", "amount_desc", "amount_asc", "category_asc"]] = Query(default="date_desc")
+):
+    """
+    Streams every matching transaction as NDJSON or CSV. Takes the same filters as the list endpoint;
+    rows are read from the database cursor and written to the response as they arrive.
+    """
+    hidden_accounts = await accounts_being_deleted(db, user_id)
+    search_indexed = not search or await applied_migrations.contains(db, transaction_search.SEARCH_MIGRATION)
+    query_filter, _ = build_transaction_filter(user_id, account_id, type, category, search, hidden_accounts, search_indexed)
+    sort_field, sort_order = SORT_OPTIONS.get(sort, ("date", -1))
+    db_cursor = (
+        db.transactions.find(query_filter, exporter.EXPORT_PROJECTION)
+        .sort([(sort_field, sort_order), ("id", sort_order)])
+        .batch_size(exporter.EXPORT_BATCH_SIZE)
+    )
+    return StreamingResponse(
+        exporter.stream_transactions(db_cursor, format),
+        media_type=exporter.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="transactions.{format}"'}
+    )
+
 @router.delete("/{transaction_id}")
 async def delete_transaction(
     transaction_id: str,
@@ -110,23 +297,38 @@ async def delete_transaction(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     try:
-        result = await db.transactions.delete_one({"id": transaction_id, "user_id": user_id})
+        # Transactions of an account being deleted are left to the deletion job
+        transaction_filter = hide_accounts({"id": transaction_id, "user_id": user_id}, await accounts_being_deleted(db, user_id))
+        deleted_transaction = await db.transactions.find_one(transaction_filter)
+        if not deleted_transaction:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        # Tombstoned before the delete (as the account deletion job does), so a failure in between
+        # cannot leave a deletion that sync clients never hear about
+        await change_feed.record_deletions(db, user_id, [transaction_id])
+        result = await db.transactions.delete_one({"_id": deleted_transaction["_id"]})
         if result.deleted_count == 0:
+            # Deleted by a concurrent request, which also updated the derived data
             raise HTTPException(status_code=404, detail="Transaction not found")
+        await changes.transactions_changed(db, user_id, removed=[deleted_transaction])
         return {"message": "Transaction deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to delete transaction")
 
 @router.get("/{transaction_id}", response_model=Transaction)
+@conditional_get("transaction")
 async def get_transaction(
     transaction_id: str,
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     try:
-        transaction = await db.transactions.find_one({"id": transaction_id, "user_id": user_id})
+        transaction = await db.transactions.find_one(hide_accounts({"id": transaction_id, "user_id": user_id}, await accounts_being_deleted(db, user_id)))
         if not transaction:
             raise HTTPException(status_code=404, detail="Transaction not found")
         return Transaction(**transaction)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch transaction")
\ No newline at end of file
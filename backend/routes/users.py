@@ -1,13 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
 from database import get_database
 from auth import (
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    verify_password_async,
     create_access_token,
     create_refresh_token,
+    verify_refresh_token,
     get_current_user_id, # Ensure this is imported
+    forget_user,
 )
 from motor.motor_asyncio import AsyncIOMotorDatabase
 import logging
@@ -15,12 +17,10 @@ import uuid
 import secrets
 from datetime import datetime, timedelta
 import os
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-from jose import jwt, JWTError
 
-from fastapi_mail import FastMail, MessageSchema, MessageType
-from email_service import conf
+import deletions
+import google_auth
+import mailer
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -52,7 +52,7 @@ class ResendVerificationRequest(BaseModel):
 
 
 @router.post("/signup", status_code=status.HTTP_201_CREATED)
-async def create_user(user: UserCreate, background_tasks: BackgroundTasks, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def create_user(user: UserCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
     if len(user.password) < 8:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -66,7 +66,7 @@ async def create_user(user: UserCreate, background_tasks: BackgroundTasks, db: A
             detail="Email already registered",
         )
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     verification_token = str(uuid.uuid4())
     
     user_document = {
@@ -84,23 +84,21 @@ async def create_user(user: UserCreate, background_tasks: BackgroundTasks, db: A
     frontend_url = os.environ.get("FRONTEND_URL", "https://allocash.netlify.app")
     verification_url = f"{frontend_url}/verify-email?token={verification_token}"
 
-    message = MessageSchema(
+    # Queued in the outbox; the mail worker delivers it over its pooled SMTP connection
+    await mailer.enqueue_email(
+        db,
+        to=user.email,
         subject="Verify Your Email for Budget Planner",
-        recipients=[user.email],
-        template_body={"verification_url": verification_url},
-        subtype=MessageType.html
+        template_name="verification.html",
+        context={"verification_url": verification_url},
     )
     
-    fm = FastMail(conf)
-    # Use a background task to send the email without blocking the response
-    background_tasks.add_task(fm.send_message, message, template_name="verification.html")
-    
     return {"message": "Signup successful. Please check your email to verify your account."}
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncIOMotorDatabase = Depends(get_database)):
-    user = await db.users.find_one({"_id": form_data.username})
-    if not user or not user.get("hashed_password") or not verify_password(form_data.password, user["hashed_password"]):
+    user = await db.users.find_one({"_id": form_data.username, **deletions.NOT_DELETED})
+    if not user or not user.get("hashed_password") or not await verify_password_async(form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -120,16 +118,15 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 @router.post("/google-login", response_model=Token)
 async def google_login(request: GoogleLoginRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
     try:
-        id_info = id_token.verify_oauth2_token(
-            request.id_token, 
-            google_requests.Request(),
-            os.environ.get("GOOGLE_CLIENT_ID")
-        )
+        # Checked against the cached Google certs, off the event loop
+        id_info = await google_auth.verify_google_id_token(request.id_token)
         email = id_info['email']
     except ValueError:
         raise HTTPException(status_code=401, detail="Invalid Google token")
 
     user = await db.users.find_one({"_id": email})
+    if user and user.get("deleted_at"):
+        raise HTTPException(status_code=409, detail="This account is being deleted.")
     
     if not user:
         new_user_doc = {
@@ -158,19 +155,12 @@ async def refresh_access_token(request: RefreshTokenRequest, db: AsyncIOMotorDat
         detail="Invalid refresh token",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(request.refresh_token, os.environ.get("SECRET_KEY"), algorithms=["HS256"])
-        if payload.get("scope") != "refresh_token":
-            raise credentials_exception
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-            
-        user = await db.users.find_one({"_id": user_id})
-        if user is None:
-            raise credentials_exception
-
-    except JWTError:
+    user_id = verify_refresh_token(request.refresh_token)
+    if user_id is None:
+        raise credentials_exception
+
+    user = await db.users.find_one({"_id": user_id, **deletions.NOT_DELETED})
+    if user is None:
         raise credentials_exception
 
     new_access_token = create_access_token(data={"sub": user_id})
@@ -181,10 +171,9 @@ async def refresh_access_token(request: RefreshTokenRequest, db: AsyncIOMotorDat
 @router.post("/forgot-password", status_code=status.HTTP_200_OK)
 async def forgot_password(
     request: ForgotPasswordRequest,
-    background_tasks: BackgroundTasks,
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    user = await db.users.find_one({"_id": request.email})
+    user = await db.users.find_one({"_id": request.email, **deletions.NOT_DELETED})
     if user:
         token = secrets.token_urlsafe(32)
         expiry_date = datetime.utcnow() + timedelta(hours=1)
@@ -196,15 +185,13 @@ async def forgot_password(
 
         reset_url = f"https://allocash.netlify.app/reset-password?token={token}"
         
-        message = MessageSchema(
+        await mailer.enqueue_email(
+            db,
+            to=request.email,
             subject="Your Password Reset Link for Budget Planner",
-            recipients=[request.email],
-            template_body={"reset_url": reset_url},
-            subtype=MessageType.html
+            template_name="password_reset.html",
+            context={"reset_url": reset_url},
         )
-        
-        fm = FastMail(conf)
-        background_tasks.add_task(fm.send_message, message, template_name="password_reset.html")
 
     return {"message": "If an account with this email exists, a password reset link has been sent."}
 
@@ -225,7 +212,7 @@ async def reset_password(request: ResetPasswordRequest, db: AsyncIOMotorDatabase
     if not user:
         raise HTTPException(status_code=400, detail="Invalid or expired password reset token.")
     
-    new_hashed_password = get_password_hash(request.new_password)
+    new_hashed_password = await get_password_hash_async(request.new_password)
     
     await db.users.update_one(
         {"_id": user["_id"]},
@@ -252,7 +239,6 @@ async def verify_email(token: str, db: AsyncIOMotorDatabase = Depends(get_databa
 @router.post("/resend-verification", status_code=status.HTTP_200_OK)
 async def resend_verification_email(
     request: ResendVerificationRequest,
-    background_tasks: BackgroundTasks,
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     user = await db.users.find_one({"_id": request.email})
@@ -270,38 +256,31 @@ async def resend_verification_email(
         frontend_url = os.environ.get("FRONTEND_URL", "https://allocash.netlify.app")
         verification_url = f"{frontend_url}/verify-email?token={verification_token}"
 
-        message = MessageSchema(
+        await mailer.enqueue_email(
+            db,
+            to=request.email,
             subject="Verify Your Email for Budget Planner (New Link)",
-            recipients=[request.email],
-            template_body={"verification_url": verification_url},
-            subtype=MessageType.html
+            template_name="verification.html",
+            context={"verification_url": verification_url},
         )
-        
-        fm = FastMail(conf)
-        background_tasks.add_task(fm.send_message, message, template_name="verification.html")
 
     # Always return the same message to prevent email enumeration attacks
     return {"message": "If an unverified account with this email exists, a new verification link has been sent."}
 
 # ADD THIS to delete account completely
-@router.delete("/me", status_code=status.HTTP_200_OK)
+@router.delete("/me", status_code=status.HTTP_202_ACCEPTED)
 async def delete_current_user(
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Permanently deletes the current user and all their associated data.
-    This action is irreversible.
+    This action is irreversible. The user can no longer sign in once this returns; their data is
+    removed by a background job (see `GET /api/jobs/{job_id}`).
     """
-    # Delete all data associated with the user first
-    await db.transactions.delete_many({"user_id": user_id})
-    await db.accounts.delete_many({"user_id": user_id})
-    await db.groups.delete_many({"user_id": user_id})
-    
-    # Finally, delete the user document itself
-    result = await db.users.delete_one({"_id": user_id})
-    
-    if result.deleted_count == 0:
+    job = await deletions.start_user_deletion(db, user_id)
+    if not job:
         raise HTTPException(status_code=404, detail="User not found.")
+    forget_user(user_id)
 
-    return {"message": "User account and all data have been permanently deleted."}
\ No newline at end of file
+    return {"message": "User account deletion started.", "job_id": job["id"]}
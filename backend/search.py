@@ -0,0 +1,60 @@
+import re
+from typing import List, Optional
+
+# Transaction fields covered by the search box
+SEARCH_FIELDS = ("description", "category", "person")
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Longer words are only indexed (and matched) by their first MAX_PREFIX_LENGTH characters
+MAX_PREFIX_LENGTH = 20
+# Transactions written before the search fields existed get them from migration 0007. Until it has
+# run, searches also match those transactions by regex.
+SEARCH_MIGRATION = "0007"
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Splits text into lowercase word tokens; punctuation and regex metacharacters are dropped."""
+    if not text:
+        return []
+    return [token[:MAX_PREFIX_LENGTH] for token in TOKEN_PATTERN.findall(text.lower())]
+
+
+def search_fields(doc: dict) -> dict:
+    """
+    Computes the normalized search fields stored on each transaction:
+    - `search_words`: the distinct words of the searchable fields, used for ranking.
+    - `search_terms`: every prefix of those words, so a prefix search is a multikey index lookup.
+    """
+    words = set()
+    for field in SEARCH_FIELDS:
+        words.update(tokenize(doc.get(field)))
+    terms = {word[:length] for word in words for length in range(1, len(word) + 1)}
+    return {"search_words": sorted(words), "search_terms": sorted(terms)}
+
+
+def _word_prefix_match(token: str) -> dict:
+    pattern = re.compile(r"\b" + re.escape(token), re.IGNORECASE)
+    return {"$or": [{field: {"$regex": pattern}} for field in SEARCH_FIELDS]}
+
+
+def build_search_query(search: str, indexed: bool = True) -> tuple:
+    """
+    Returns (filter, tokens) for a search string. When the string has no word characters the
+    filter falls back to an escaped, literal substring match. Pass `indexed=False` until migration
+    0007 has run, so transactions without search fields are matched by word-prefix regexes instead.
+    """
+    tokens = list(dict.fromkeys(tokenize(search)))
+    if tokens:
+        query = {"search_terms": {"$all": tokens}}
+        if not indexed:
+            unindexed = {"search_terms": {"$exists": False}, "$and": [_word_prefix_match(token) for token in tokens]}
+            query = {"$or": [query, unindexed]}
+        return query, tokens
+    pattern = re.compile(re.escape(search.strip()), re.IGNORECASE)
+    return {"$or": [{field: {"$regex": pattern}} for field in SEARCH_FIELDS]}, tokens
+
+
+def relevance_stages(tokens: List[str]) -> List[dict]:
+    """Scores each match by how many search tokens are whole words of the transaction."""
+    return [
+        {"$addFields": {"_relevance": {"$size": {"$setIntersection": [{"$ifNull": ["$search_words", []]}, tokens]}}}},
+    ]
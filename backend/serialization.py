@@ -0,0 +1,24 @@
+from typing import Iterable, List, Optional, Type
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+
+class ModelList:
+    """
+    Fast path for list endpoints. Validates a whole batch of Mongo documents as `List[model]` in one
+    pydantic-core call and serializes it straight to JSON bytes, instead of building every model in
+    Python and then having FastAPI validate and encode the list again through `response_model`.
+    The output is the same JSON the response_model would produce (computed fields included).
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.adapter = TypeAdapter(List[model])
+        # Only the fields the model returns: leaves out `_id` and internal fields such as the search terms
+        self.projection = {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+    def dump_json(self, docs: Iterable[dict]) -> bytes:
+        return self.adapter.dump_json(self.adapter.validate_python(docs))
+
+    def response(self, docs: Iterable[dict], headers: Optional[dict] = None) -> Response:
+        return Response(content=self.dump_json(docs), media_type="application/json", headers=headers)
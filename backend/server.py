@@ -1,11 +1,20 @@
+import asyncio
 from fastapi import FastAPI, APIRouter
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
 import logging
 from pathlib import Path
 from contextlib import asynccontextmanager
-from database import connect_to_database, close_database_connection, get_database
+from database import connect_to_database, close_database_connection, get_database, db_manager, command_latency_ms
+from auth import shutdown_password_hasher
+from metrics import registry as metrics_registry
+from people_balances import HAS_PERSON, HAS_SPLIT
+from jobs import job_runner
+from mailer import MAIL_OUTBOX_TTL_SECONDS, mail_worker
+from change_feed import TRANSACTION_TOMBSTONE_TTL_SECONDS
+import migrations
 
 # Import route modules
 from routes.transactions import router as transactions_router
@@ -14,6 +23,7 @@ from routes.users import router as users_router
 from routes.people import router as people_router
 from routes.accounts import router as accounts_router # ✨ ADDED
 from routes.accounts import router as accounts_router
+from routes.jobs import router as jobs_router
 # REMOVED: from routes.groups import router as groups_router
 
 ROOT_DIR = Path(__file__).parent
@@ -26,6 +36,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Apply pending schema migrations in the background on startup (see migrations/__init__.py)
+MIGRATE_ON_STARTUP = os.environ.get("MIGRATE_ON_STARTUP", "true").lower() == "true"
+
+# (user_id, date -1) and (user_id, account_id) are prefixes of the keyset pagination indexes
+OBSOLETE_TRANSACTION_INDEXES = ("user_id_1_date_-1", "user_id_1_account_id_1")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Code to run on startup
@@ -33,9 +49,36 @@ async def lifespan(app: FastAPI):
     await connect_to_database()
     db = get_database()
     try:
-        # Indexes for transactions
-        await db.transactions.create_index([("user_id", 1), ("account_id", 1)])
-        await db.transactions.create_index([("user_id", 1), ("date", -1)])
+        # Indexes for transactions. Every query filters on user_id first. Indexes that a longer one
+        # below now serves through its prefix are dropped from existing databases.
+        for name in OBSOLETE_TRANSACTION_INDEXES:
+            try:
+                await db.transactions.drop_index(name)
+            except OperationFailure:
+                pass  # Not there: a new database, or dropped by an earlier start
+        # Point reads and writes of a single transaction (GET/PUT/DELETE /transactions/{id})
+        await db.transactions.create_index([("user_id", 1), ("id", 1)])
+        # Date-range match of the trend pipelines (on `date` until the native types migration has run)
+        await db.transactions.create_index([("user_id", 1), ("date_at", 1)])
+        # Keyset pagination, one per sort field, with `id` as the tie-breaker; both directions of a
+        # sort walk the same index. (user_id, date, id) also serves the user-wide stats and export
+        # scans and the newest-first splits list, and the account_id variants serve every
+        # per-account query, including the account deletion job.
+        for sort_field in ("date", "amount", "category"):
+            await db.transactions.create_index([("user_id", 1), (sort_field, 1), ("id", 1)])
+            await db.transactions.create_index([("user_id", 1), ("account_id", 1), (sort_field, 1), ("id", 1)])
+        # Partial indexes covering only transactions that involve a person, for the people list and
+        # for the raw people balances and ledger rebuilds
+        await db.transactions.create_index([("user_id", 1), ("person", 1)], partialFilterExpression=HAS_PERSON)
+        await db.transactions.create_index([("user_id", 1), ("split_with", 1)], partialFilterExpression=HAS_SPLIT)
+        # Multikey index for search: `search_terms` holds every word prefix, so each search token is
+        # an exact key lookup ($all) instead of a regex over the whole collection
+        await db.transactions.create_index([("user_id", 1), ("search_terms", 1)])
+        # Change feed: writes in seq order per user, and the tombstones of deleted transactions,
+        # which expire after the sync token lifetime
+        await db.transactions.create_index([("user_id", 1), ("seq", 1)])
+        await db.transaction_tombstones.create_index([("user_id", 1), ("seq", 1)])
+        await db.transaction_tombstones.create_index([("deleted_at", 1)], expireAfterSeconds=TRANSACTION_TOMBSTONE_TTL_SECONDS)
         # REMOVED: group_id index
         
         # Index for users
@@ -43,18 +86,54 @@ async def lifespan(app: FastAPI):
 
         # Index for accounts
         await db.accounts.create_index([("user_id", 1)])
+        # Point lookups by (id, user_id), e.g. the per-account balance $inc on every transaction write
+        await db.accounts.create_index([("user_id", 1), ("id", 1)])
+
+        # One ledger per (user, person)
+        await db.person_ledgers.create_index([("user_id", 1), ("person", 1)], unique=True)
+
+        # Index for the materialized monthly rollups
+        await db.monthly_rollups.create_index(
+            [("user_id", 1), ("account_id", 1), ("month", 1), ("type", 1), ("category", 1)],
+            unique=True
+        )
         
+        # Background jobs: claiming scans by status, status polling reads by id
+        await db.jobs.create_index([("status", 1), ("available_at", 1), ("created_at", 1)])
+        await db.jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+        await db.jobs.create_index([("id", 1)], unique=True)
+
+        # Mail outbox: the worker claims due messages in order; sent ones expire (unsent ones have
+        # no sent_at date, so the TTL monitor leaves them alone)
+        await db.mail_outbox.create_index([("status", 1), ("available_at", 1)])
+        await db.mail_outbox.create_index([("sent_at", 1)], expireAfterSeconds=MAIL_OUTBOX_TTL_SECONDS)
+
         # REMOVED: Index for groups
 
         logger.info("Database indexes created successfully")
     except Exception as e:
         logger.warning(f"Could not create indexes: {e}")
+
+    # Starts the background job workers; jobs left unfinished by a previous run are resumed
+    job_runner.start(db)
+    # Delivers queued emails, including any left unsent by a previous run
+    mail_worker.start(db)
+    migrations_task = None
+    if MIGRATE_ON_STARTUP:
+        migrations_task = asyncio.create_task(migrations.run_migrations_on_startup(db, migrations.MIGRATIONS), name="migrations")
     
     yield  # The application runs here
 
     # Code to run on shutdown
     logger.info("Shutting down Budget Planner API...")
+    if migrations_task is not None:
+        # An interrupted migration resumes from its checkpoint on the next start
+        migrations_task.cancel()
+        await asyncio.gather(migrations_task, return_exceptions=True)
+    await job_runner.stop()
+    await mail_worker.stop()
     await close_database_connection()
+    shutdown_password_hasher()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -74,6 +153,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 # --- End of CORS Configuration Update ---
 
@@ -81,12 +161,32 @@ api_router = APIRouter(prefix="/api")
 
 @api_router.api_route("/health", methods=["GET", "HEAD"])
 async def health_check():
-    db = get_database()
-    try:
-        await db.command('ping')
-        return {"status": "healthy", "database": "connected"}
-    except Exception as e:
-        return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
+    """
+    Reports database reachability from the driver's own heartbeats (pinging only when there has been
+    no recent heartbeat), plus connection pool utilisation and command latency percentiles.
+    """
+    details = {
+        "pool": db_manager.pool_stats(),
+        "command_latency_ms": {
+            "p50": round(command_latency_ms.percentile(50), 3),
+            "p99": round(command_latency_ms.percentile(99), 3),
+        },
+    }
+    reachable = db_manager.is_reachable()
+    if reachable is None:
+        try:
+            await get_database().command('ping')
+            reachable = True
+        except Exception as e:
+            return {"status": "unhealthy", "database": "disconnected", "error": str(e), **details}
+    if not reachable:
+        return {"status": "unhealthy", "database": "disconnected", "error": db_manager.heartbeats.last_error, **details}
+    return {"status": "healthy", "database": "connected", **details}
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Reports the in-process metrics (queue depths, latencies, counters)."""
+    return metrics_registry.snapshot()
 
 # Include all routers
 api_router.include_router(accounts_router) # ✨ ADDED
@@ -95,5 +195,6 @@ api_router.include_router(people_router)
 # REMOVED: api_router.include_router(groups_router)
 api_router.include_router(transactions_router)
 api_router.include_router(stats_router)
+api_router.include_router(jobs_router)
 
 app.include_router(api_router)
\ No newline at end of file
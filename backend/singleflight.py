@@ -0,0 +1,52 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+import cache
+from metrics import registry
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers that arrive while a call with the same key
+    is in flight await that call's result instead of starting their own.
+    """
+
+    def __init__(self, name: str):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.executed = registry.counter(f"{name}.executed")
+        self.coalesced = registry.counter(f"{name}.coalesced")
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            self.executed.inc()
+            call = asyncio.ensure_future(func())
+            self._calls[key] = call
+            call.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.coalesced.inc()
+        # Shielded so one caller going away (e.g. a closed browser tab) does not cancel the shared call
+        return await asyncio.shield(call)
+
+    def _forget(self, key: Hashable, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+stats_queries = SingleFlight("stats.singleflight")
+
+
+async def aggregate(collection, pipeline: List[dict], user_id: str, length: Optional[int] = None) -> List[dict]:
+    """
+    Runs an aggregation, sharing the result with identical concurrent aggregations. The key includes
+    the user's data version, so a request made after a write never joins a query started before it.
+    Results are shared between callers and must not be mutated.
+    """
+    key = (
+        collection.full_name,
+        user_id,
+        await cache.get_user_version(collection.database, user_id),
+        json.dumps(pipeline, default=str),
+        length,
+    )
+    return await stats_queries.do(key, lambda: collection.aggregate(pipeline).to_list(length=length))
@@ -0,0 +1,93 @@
+"""
+A minimal in-process SMTP server for local development and tests. It accepts any login and stores
+every received message instead of delivering it. With `fail_first`, the first messages are refused
+with a temporary error, so retries can be exercised (see benchmarks/bench_mail_queue.py).
+
+    python manage.py smtp-stub --port 1025
+    MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_STARTTLS=false uvicorn server:app
+"""
+import asyncio
+from email import message_from_bytes
+from email.message import Message
+from typing import List, Optional
+
+
+class StubSMTPServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 1025, verbose: bool = False, fail_first: int = 0):
+        self.host = host
+        self.port = port
+        self.verbose = verbose
+        self.fail_first = fail_first
+        self.refused = 0
+        self.messages: List[Message] = []
+        self.sessions = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Stub SMTP server listening on {self.host}:{self.port}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.sessions += 1
+
+        async def reply(line: str):
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        await reply("220 stub ESMTP ready")
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                command = raw.decode(errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    await reply("250-stub")
+                    await reply("250-AUTH PLAIN LOGIN")
+                    await reply("250 8BITMIME")
+                elif verb == "HELO":
+                    await reply("250 stub")
+                elif verb == "AUTH":
+                    if command.upper().startswith("AUTH LOGIN"):
+                        await reply("334 VXNlcm5hbWU6")
+                        await reader.readline()
+                        await reply("334 UGFzc3dvcmQ6")
+                        await reader.readline()
+                    await reply("235 Authentication successful")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while True:
+                        line = await reader.readline()
+                        if line in (b".\r\n", b".\n", b""):
+                            break
+                        lines.append(line[1:] if line.startswith(b"..") else line)
+                    message = message_from_bytes(b"".join(lines))
+                    self.messages.append(message)
+                    if self.verbose:
+                        print(f"Received message for {message['To']}: {message['Subject']}")
+                    await reply("250 OK")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                elif verb == "MAIL" and self.refused < self.fail_first:
+                    self.refused += 1
+                    await reply("451 Temporary failure, try again later")
+                elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                    await reply("250 OK")
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
@@ -0,0 +1,15 @@
+from native_types import DATE_AT
+
+# Transactions written before the `week` field existed get it from migration 0005
+WEEK_MIGRATION = "0005"
+
+# Server-side equivalent of models.transaction.iso_week, only used for documents that do not have
+# the `week` field yet, or that migration 0005 skipped
+WEEK_FALLBACK = {"$dateToString": {"format": "%G-W%V", "date": DATE_AT}}
+
+# Trend buckets come straight from stored fields: the date string itself, or the precomputed week/month
+PERIOD_GROUP_KEYS = {
+    "daily": "$date",
+    "weekly": {"$ifNull": ["$week", WEEK_FALLBACK]},
+    "monthly": "$month",
+}
@@ -87,19 +87,21 @@ export const useBudgetData = () => {
                 account_id: selectedAccountId !== 'all' ? selectedAccountId : undefined,
             };
 
-            const [
-                accountsData, dashboardStats, incomeStats, expenseStats, 
-                trendStats, peopleData, peopleStatsData, splitGroupsData
-            ] = await Promise.all([
-                api.accounts.getAll(),
-                api.stats.getDashboardStats(selectedAccountId),
-                api.stats.getCategoryStats('income', selectedAccountId),
-                api.stats.getCategoryStats('expense', selectedAccountId),
-                api.stats.getGranularTrendStats(trendParams),
-                api.people.getAll(),
-                api.stats.getPeopleStats(selectedAccountId),
+            // The overview lists only the latest splits, so the Splits tab loads all of them separately
+            const [accountsData, overview, peopleData, splitGroupsData] = await Promise.all([
+                api.accounts.getAll(),
+                api.stats.getOverview(
+                    ['dashboard', 'income_categories', 'expense_categories', 'trends', 'people'],
+                    trendParams
+                ),
+                api.people.getAll(),
                 api.stats.getSplits(selectedAccountId)
-            ]);
+            ]);
+            const dashboardStats = overview.dashboard;
+            const incomeStats = overview.income_categories;
+            const expenseStats = overview.expense_categories;
+            const trendStats = overview.trends;
+            const peopleStatsData = overview.people;
 
             setAccounts(accountsData);
             setPeople(peopleData);
@@ -221,6 +221,12 @@ export const statsAPI = {
         return apiClient.get('/stats/groups', { params }).then(res => res.data);
     },
     getDateRange: () => apiClient.get('/stats/date-range').then(res => res.data),
+    // Fetches several dashboard sections in one request; see GET /stats/overview
+    getOverview: (sections, params = {}) => {
+        const query = { ...params, sections: sections.join(',') };
+        if (!query.account_id || query.account_id === 'all') delete query.account_id;
+        return apiClient.get('/stats/overview', { params: query }).then(res => res.data);
+    },
     getSplits: (accountId) => {
         const params = accountId && accountId !== 'all' ? { account_id: accountId } : {};
         return apiClient.get('/stats/splits', { params }).then(res => res.data);
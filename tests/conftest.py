@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+# The backend modules import each other by top-level name, as when run from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    """An empty in-memory database (mongomock-motor)."""
+    return AsyncMongoMockClient()["budget_planner_test"]
+
+
+@pytest.fixture
+def user_id():
+    return "user@example.com"
+
+
+@pytest.fixture
+async def api(db, user_id, monkeypatch):
+    """An HTTP client for the app, signed in as `user_id`, over the `db` fixture with all migrations applied."""
+    import httpx
+
+    import auth
+    import migrations
+    from cache import stats_cache
+    from database import db_manager
+    import server
+
+    monkeypatch.setattr(db_manager, "db", db)
+    # Cached entries are keyed by user and data version, which restart with every database
+    stats_cache.clear()
+    auth.clear_token_cache()
+    await db.users.insert_one({"_id": user_id, "email": user_id, "deleted_at": None})
+    await migrations.run_migrations(db, migrations.MIGRATIONS, pause_seconds=0)
+
+    token = auth.create_access_token({"sub": user_id})
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test/api",
+                                 headers={"Authorization": f"Bearer {token}"}) as client:
+        yield client
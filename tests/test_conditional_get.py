@@ -0,0 +1,42 @@
+import pytest
+
+from cache import etag_matches
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["/accounts/", "/transactions/", "/stats/dashboard"])
+async def test_current_etag_gets_a_304(api, path):
+    response = await api.get(path)
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    revalidated = await api.get(path, headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["ETag"] == etag
+
+
+@pytest.mark.anyio
+async def test_write_changes_the_etag(api):
+    etag = (await api.get("/accounts/")).headers["ETag"]
+    await api.post("/accounts/", json={"name": "Checking", "balance": 0})
+
+    response = await api.get("/accounts/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert [account["name"] for account in response.json()] == ["Checking"]
+
+
+@pytest.mark.anyio
+async def test_etag_depends_on_the_query_parameters(api):
+    etag = (await api.get("/transactions/", params={"sort": "date_desc"})).headers["ETag"]
+    response = await api.get("/transactions/", params={"sort": "amount_asc"}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_if_none_match_uses_the_weak_comparison():
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"xyz", "abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
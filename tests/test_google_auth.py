@@ -0,0 +1,182 @@
+import asyncio
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt
+
+import google_auth
+
+AUDIENCE = "test-client-id.apps.googleusercontent.com"
+
+
+def make_key(kid):
+    """An RSA signer for `kid` and its self-signed certificate, as Google publishes them."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, kid)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    return crypt.RSASigner.from_string(key_pem, key_id=kid), cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def make_token(signer, email, audience=AUDIENCE):
+    now = int(time.time())
+    payload = {
+        "iss": "https://accounts.google.com", "aud": audience, "sub": email, "email": email,
+        "email_verified": True, "iat": now, "exp": now + 3600,
+    }
+    return jwt.encode(signer, payload).decode()
+
+
+class CertsServer:
+    """Stand-in for Google's certs endpoint; answers 503 while `down` is set."""
+
+    def __init__(self, certs, max_age=3600):
+        self.certs = dict(certs)
+        self.max_age = max_age
+        self.down = False
+        self.requests = 0
+        outer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                outer.requests += 1
+                if outer.down:
+                    self.send_error(503)
+                    return
+                body = json.dumps(outer.certs).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", f"public, max-age={outer.max_age}, must-revalidate")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/oauth2/v1/certs"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(scope="module")
+def key():
+    return make_key("key-1")
+
+
+@pytest.fixture
+def certs_server(key, monkeypatch):
+    """Serves `key`'s cert and points a fresh certs cache at it."""
+    server = CertsServer({"key-1": key[1]})
+    monkeypatch.setattr(google_auth, "google_certs", google_auth.GoogleCertsCache(server.url))
+    yield server
+    server.stop()
+
+
+async def verify(token):
+    return await google_auth.verify_google_id_token(token, AUDIENCE)
+
+
+@pytest.mark.anyio
+async def test_logins_share_one_certs_fetch(key, certs_server):
+    for i in range(5):
+        assert (await verify(make_token(key[0], f"user{i}@example.com")))["email"] == f"user{i}@example.com"
+    assert certs_server.requests == 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("token", [
+    lambda signer: make_token(make_key("key-1")[0], "forged@example.com"),
+    lambda signer: make_token(signer, "other@example.com", audience="someone-else"),
+    lambda signer: "not-a-token",
+], ids=["forged signature", "other audience", "malformed"])
+async def test_bad_token_is_rejected(key, certs_server, token):
+    with pytest.raises(ValueError):
+        await verify(token(key[0]))
+
+
+@pytest.mark.anyio
+async def test_rotated_key_is_picked_up_by_one_refetch(key, certs_server, monkeypatch):
+    await verify(make_token(key[0], "user@example.com"))
+    rotated_signer, rotated_cert = make_key("key-2")
+    certs_server.certs["key-2"] = rotated_cert
+    monkeypatch.setattr(google_auth, "GOOGLE_CERTS_MIN_REFETCH_SECONDS", 0)
+
+    assert (await verify(make_token(rotated_signer, "rotated@example.com")))["email"] == "rotated@example.com"
+    assert certs_server.requests == 2
+
+
+@pytest.mark.anyio
+async def test_unknown_key_refetches_at_most_once_per_interval(key, certs_server):
+    await verify(make_token(key[0], "user@example.com"))
+    unknown_signer, _ = make_key("key-3")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            await verify(make_token(unknown_signer, "user@example.com"))
+    # The certs were fetched moments ago, so tokens with unknown keys cannot make us refetch
+    assert certs_server.requests == 1
+
+
+@pytest.mark.anyio
+async def test_expired_certs_are_used_when_the_refresh_fails(key, certs_server):
+    certs_server.max_age = 0
+    await verify(make_token(key[0], "user@example.com"))
+    certs_server.down = True
+
+    assert (await verify(make_token(key[0], "later@example.com")))["email"] == "later@example.com"
+    assert certs_server.requests == 2
+
+
+@pytest.mark.anyio
+async def test_login_fails_when_no_certs_were_ever_fetched(key, certs_server):
+    certs_server.down = True
+    with pytest.raises(requests.HTTPError):
+        await verify(make_token(key[0], "user@example.com"))
+
+
+@pytest.mark.anyio
+async def test_certs_near_expiry_are_refreshed_in_the_background(key, certs_server, monkeypatch):
+    monkeypatch.setattr(google_auth, "GOOGLE_CERTS_REFRESH_MARGIN_SECONDS", 3600)
+    await verify(make_token(key[0], "user@example.com"))
+    # Served from the cache without waiting, while the refresh runs
+    await verify(make_token(key[0], "user@example.com"))
+    for _ in range(100):
+        if google_auth.google_certs._fetch_task is None:
+            break
+        await asyncio.sleep(0.01)
+    assert certs_server.requests == 2
+
+
+@pytest.mark.parametrize("cache_control, age, seconds", [
+    ("public, max-age=21600, must-revalidate", None, 21600),
+    ("public, max-age=21600", "600", 21000),
+    ("public, max-age=100", "600", 0),
+    ("public, max-age=100", "soon", 100),
+    ("no-store", None, google_auth.GOOGLE_CERTS_DEFAULT_MAX_AGE_SECONDS),
+    (None, None, google_auth.GOOGLE_CERTS_DEFAULT_MAX_AGE_SECONDS),
+])
+def test_max_age_seconds(cache_control, age, seconds):
+    assert google_auth.max_age_seconds(cache_control, age) == seconds
@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import deletions
+import jobs
+from cache import COUNTERS_COLLECTION
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    """A job runner that is not started; `run_jobs` runs it until the queue is empty."""
+    runner = jobs.JobRunner(workers=1)
+    # enqueue_job wakes the module's runner
+    monkeypatch.setattr(jobs, "job_runner", runner)
+    monkeypatch.setattr(jobs, "JOB_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(jobs, "JOB_RETRY_DELAY_SECONDS", 0)
+    monkeypatch.setattr(deletions, "DELETE_BATCH_SIZE", 2)
+    monkeypatch.setattr(deletions, "DELETE_BATCH_PAUSE_SECONDS", 0)
+    return runner
+
+
+async def run_jobs(db, runner, timeout=10):
+    """Runs the runner until no job is pending or running."""
+    runner.start(db)
+    try:
+        async def all_finished():
+            while await db.jobs.count_documents({"status": {"$in": ["pending", "running"]}}):
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(all_finished(), timeout)
+    finally:
+        await runner.stop()
+
+
+async def create_account(api, name, transactions):
+    account = (await api.post("/accounts/", json={"name": name, "balance": 0})).json()
+    for i in range(transactions):
+        await api.post("/transactions/", json={
+            "type": "expense", "category": "Food", "amount": 10, "date": f"2024-01-0{i + 1}",
+            "account_id": account["id"], "person": "Bob",
+        })
+    return account
+
+
+@pytest.mark.anyio
+async def test_failed_attempt_is_retried(db, runner, monkeypatch, user_id):
+    attempts = []
+
+    async def flaky(db, job, progress):
+        attempts.append(job["attempts"])
+        if len(attempts) == 1:
+            raise RuntimeError("temporary failure")
+        await progress({"items": 3})
+
+    monkeypatch.setitem(jobs._handlers, "flaky", flaky)
+    job = await jobs.enqueue_job(db, "flaky", user_id)
+    await run_jobs(db, runner)
+
+    stored = await db.jobs.find_one({"id": job["id"]})
+    assert attempts == [1, 2]
+    assert (stored["status"], stored["attempts"], stored["progress"]) == ("completed", 2, {"items": 3})
+
+
+@pytest.mark.anyio
+async def test_job_fails_after_the_last_attempt(db, runner, monkeypatch, user_id):
+    async def broken(db, job, progress):
+        raise RuntimeError("always fails")
+
+    monkeypatch.setitem(jobs._handlers, "broken", broken)
+    job = await jobs.enqueue_job(db, "broken", user_id)
+    unknown = await jobs.enqueue_job(db, "no_such_type", user_id)
+    await run_jobs(db, runner)
+
+    stored = await db.jobs.find_one({"id": job["id"]})
+    assert (stored["status"], stored["attempts"], stored["error"]) == ("failed", jobs.JOB_MAX_ATTEMPTS, "always fails")
+    assert (await db.jobs.find_one({"id": unknown["id"]}))["error"] == "Unknown job type 'no_such_type'"
+
+
+@pytest.mark.anyio
+async def test_job_with_an_expired_lease_is_taken_over(db, runner, monkeypatch, user_id):
+    ran = []
+
+    async def handler(db, job, progress):
+        ran.append(job["id"])
+
+    monkeypatch.setitem(jobs._handlers, "resumable", handler)
+    job = await jobs.enqueue_job(db, "resumable", user_id)
+    # Claimed by a worker that went away
+    await db.jobs.update_one({"id": job["id"]}, {"$set": {
+        "status": "running", "attempts": 1, "lease_expires_at": datetime.utcnow() - timedelta(seconds=1),
+    }})
+    await run_jobs(db, runner)
+
+    assert ran == [job["id"]]
+    assert (await db.jobs.find_one({"id": job["id"]}))["status"] == "completed"
+
+
+@pytest.mark.anyio
+async def test_account_deletion_hides_the_account_then_removes_its_data(api, db, runner, user_id):
+    kept = await create_account(api, "Checking", 1)
+    deleted = await create_account(api, "Savings", 3)
+    response = await api.delete(f"/accounts/{deleted['id']}")
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    # Hidden before the job has run
+    assert [account["id"] for account in (await api.get("/accounts/")).json()] == [kept["id"]]
+    assert {row["account_id"] for row in (await api.get("/transactions/")).json()} == {kept["id"]}
+    assert (await db[COUNTERS_COLLECTION].find_one({"_id": user_id}))["hidden_accounts"] == [deleted["id"]]
+    assert (await api.get("/stats/dashboard")).json()["total_expenses"] == 10
+
+    await run_jobs(db, runner)
+
+    job = (await api.get(f"/jobs/{job_id}")).json()
+    assert (job["status"], job["progress"]) == ("completed", {"transactions": 3})
+    assert await db.transactions.count_documents({"account_id": deleted["id"]}) == 0
+    assert await db.accounts.count_documents({"id": deleted["id"]}) == 0
+    assert await db.transaction_tombstones.count_documents({}) == 3
+    assert (await db[COUNTERS_COLLECTION].find_one({"_id": user_id}))["hidden_accounts"] == []
+    ledger = await db.person_ledgers.find_one({"user_id": user_id, "person": "Bob"})
+    assert (ledger["given_cents"], ledger["direct_count"]) == (1000, 1)
+
+
+@pytest.mark.anyio
+async def test_user_deletion_removes_all_their_data(api, db, runner, user_id):
+    await create_account(api, "Checking", 2)
+    await db.mail_outbox.insert_many([{"to": user_id}, {"to": "someone@example.com"}])
+    response = await api.delete("/users/me")
+    assert response.status_code == 202
+    # Signed out right away
+    assert (await api.get("/accounts/")).status_code == 401
+
+    await run_jobs(db, runner)
+
+    assert await db.users.count_documents({"_id": user_id}) == 0
+    for collection in ("accounts", "transactions", "monthly_rollups", "person_ledgers", "transaction_tombstones"):
+        assert await db[collection].count_documents({"user_id": user_id}) == 0, collection
+    assert [mail["to"] for mail in await db.mail_outbox.find({}).to_list(length=None)] == ["someone@example.com"]
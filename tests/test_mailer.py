@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+import email_service
+import mailer
+from smtp_stub import StubSMTPServer
+
+
+@pytest.fixture
+async def smtp_stub_factory(monkeypatch):
+    """Starts a StubSMTPServer on a free port and points the mailer at it."""
+    monkeypatch.setattr(email_service, "MAIL_STARTTLS", False)
+    monkeypatch.setattr(email_service, "MAIL_SSL_TLS", False)
+    monkeypatch.setattr(email_service, "MAIL_USERNAME", None)
+    monkeypatch.setattr(email_service, "MAIL_FROM", "test@example.com")
+    # Retry right away instead of after the production backoff
+    monkeypatch.setattr(mailer, "MAIL_RETRY_BASE_SECONDS", 0)
+    servers = []
+
+    async def start(fail_first=0):
+        stub = StubSMTPServer(port=0, fail_first=fail_first)
+        await stub.start()
+        monkeypatch.setattr(email_service, "MAIL_SERVER", stub.host)
+        monkeypatch.setattr(email_service, "MAIL_PORT", stub.port)
+        servers.append(stub)
+        return stub
+
+    yield start
+    for stub in servers:
+        await stub.stop()
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    worker = mailer.MailWorker()
+    # enqueue_email wakes the module's worker
+    monkeypatch.setattr(mailer, "mail_worker", worker)
+    return worker
+
+
+async def enqueue(db, count):
+    for i in range(count):
+        await mailer.enqueue_email(db, f"user{i}@example.com", f"Verify your email ({i})", "verification.html",
+                                   {"verification_url": f"https://example.com/verify/{i}"})
+
+
+async def drain(db, worker, count, timeout=10):
+    """Runs the worker until `count` emails were sent."""
+    worker.start(db)
+    try:
+        async def all_sent():
+            while await db.mail_outbox.count_documents({"status": "sent"}) < count:
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(all_sent(), timeout)
+    finally:
+        await worker.stop()
+
+
+@pytest.mark.anyio
+async def test_batch_is_sent_over_one_session(db, worker, smtp_stub_factory):
+    stub = await smtp_stub_factory()
+    await enqueue(db, 5)
+    await drain(db, worker, 5)
+
+    assert sorted(message["To"] for message in stub.messages) == [f"user{i}@example.com" for i in range(5)]
+    assert stub.sessions == 1
+    outbox = await db.mail_outbox.find({}).to_list(length=None)
+    assert all(mail["attempts"] == 1 and mail["sent_at"] is not None for mail in outbox)
+
+
+@pytest.mark.anyio
+async def test_temporary_failure_is_retried_on_a_new_session(db, worker, smtp_stub_factory):
+    stub = await smtp_stub_factory(fail_first=1)
+    await enqueue(db, 1)
+    await drain(db, worker, 1)
+
+    assert stub.refused == 1
+    assert len(stub.messages) == 1
+    # The failed session is closed, so the retry reconnects
+    assert stub.sessions == 2
+    mail = await db.mail_outbox.find_one({})
+    assert mail["attempts"] == 2
+    assert mail["error"] is None
+
+
+def test_retry_delay_grows_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(mailer, "MAIL_RETRY_BASE_SECONDS", 30)
+    monkeypatch.setattr(mailer, "MAIL_RETRY_MAX_SECONDS", 100)
+    assert [mailer.retry_delay(attempts) for attempts in (1, 2, 3, 4)] == [30, 60, 100, 100]
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import migrations
+from migrations import DocumentMigration, MigrationLocked, PerUserMigration, run_migrations
+from migrations.base import STATE_COLLECTION, AppliedMigrations
+
+
+class DoubleValue(DocumentMigration):
+    version = "9001"
+    name = "double_value"
+    collection = "items"
+    query = {"doubled": {"$exists": False}}
+    source_fields = ("value",)
+
+    def migrate_document(self, doc):
+        if not isinstance(doc["value"], int):
+            raise TypeError(f"value is a {type(doc['value']).__name__}")
+        return {"value": doc["value"] * 2, "doubled": True}
+
+
+class CountItems(PerUserMigration):
+    version = "9002"
+    name = "count_items"
+
+    def __init__(self):
+        self.users = []
+
+    async def migrate_user(self, db, user_id):
+        self.users.append(user_id)
+        count = await db.items.count_documents({"user_id": user_id})
+        await db.item_counts.insert_one({"_id": user_id, "count": count})
+        return 1
+
+
+async def state(db, version):
+    return await db[STATE_COLLECTION].find_one({"_id": version})
+
+
+@pytest.mark.anyio
+async def test_document_migration_converts_every_batch_and_skips_bad_rows(db):
+    await db.items.insert_many([{"_id": i, "value": i} for i in range(7)] + [{"_id": 7, "value": "seven"}])
+    ran = await run_migrations(db, [DoubleValue()], batch_size=3, pause_seconds=0)
+
+    assert [(migration.version, migrated) for migration, migrated in ran] == [("9001", 7)]
+    assert [doc["value"] for doc in await db.items.find({}).sort("_id", 1).to_list(length=None)] == [0, 2, 4, 6, 8, 10, 12, "seven"]
+    recorded = await state(db, "9001")
+    assert recorded["status"] == "applied"
+    assert recorded["skipped"] == 1
+    assert recorded["skipped_docs"] == [{"_id": 7, "reason": "value is a str"}]
+
+
+@pytest.mark.anyio
+async def test_applied_migration_does_not_run_again(db):
+    await db.items.insert_one({"_id": 1, "value": 1})
+    await run_migrations(db, [DoubleValue()], pause_seconds=0)
+    await db.items.insert_one({"_id": 2, "value": 2})
+
+    assert await run_migrations(db, [DoubleValue()], pause_seconds=0) == []
+    assert (await db.items.find_one({"_id": 2}))["value"] == 2
+
+
+@pytest.mark.anyio
+async def test_interrupted_run_resumes_after_its_checkpoint(db):
+    await db.items.insert_many([{"_id": i, "value": i} for i in range(4)])
+    # A run that died after the batch ending with _id 1, without marking the documents it converted
+    await db[STATE_COLLECTION].insert_one({
+        "_id": "9001", "name": "double_value", "status": "running", "checkpoint": 1, "migrated": 2,
+        "skipped": 0, "skipped_docs": [], "heartbeat_at": datetime.utcnow() - timedelta(hours=1),
+    })
+    ran = await run_migrations(db, [DoubleValue()], pause_seconds=0)
+
+    assert ran[0][1] == 4
+    assert [doc["value"] for doc in await db.items.find({}).sort("_id", 1).to_list(length=None)] == [0, 1, 4, 6]
+
+
+@pytest.mark.anyio
+async def test_run_held_by_a_live_process_is_left_alone(db):
+    await db[STATE_COLLECTION].insert_one({"_id": "9001", "status": "running", "checkpoint": None, "heartbeat_at": datetime.utcnow()})
+    with pytest.raises(MigrationLocked):
+        await run_migrations(db, [DoubleValue()], pause_seconds=0)
+
+
+@pytest.mark.anyio
+async def test_document_changed_since_it_was_read_is_not_overwritten(db):
+    await db.items.insert_many([{"_id": 1, "value": 1}, {"_id": 2, "value": 2}])
+
+    class ConcurrentWrite(DoubleValue):
+        async def migrate_batch(self, db, docs, state):
+            changed = await super().migrate_batch(db, docs, state)
+            await db.items.update_one({"_id": 2}, {"$set": {"value": 20}})
+            return changed
+
+    await run_migrations(db, [ConcurrentWrite()], pause_seconds=0)
+    assert [doc["value"] for doc in await db.items.find({}).sort("_id", 1).to_list(length=None)] == [2, 20]
+
+
+@pytest.mark.anyio
+async def test_per_user_migration_visits_every_user_once_in_order(db):
+    await db.users.insert_many([{"_id": user} for user in ("c@x", "a@x", "b@x")])
+    await db.items.insert_many([{"user_id": "a@x"}, {"user_id": "a@x"}, {"user_id": "c@x"}])
+    migration = CountItems()
+    ran = await run_migrations(db, [migration], batch_size=2, pause_seconds=0)
+
+    assert migration.users == ["a@x", "b@x", "c@x"]
+    assert ran[0][1] == 3
+    assert {doc["_id"]: doc["count"] for doc in await db.item_counts.find({}).to_list(length=None)} == {"a@x": 2, "b@x": 0, "c@x": 1}
+
+
+@pytest.mark.anyio
+async def test_run_stops_at_the_target_version(db):
+    await db.users.insert_one({"_id": "a@x"})
+    await run_migrations(db, [CountItems(), DoubleValue()], target="9001", pause_seconds=0)
+    assert await state(db, "9001") is not None
+    assert await state(db, "9002") is None
+
+
+@pytest.mark.anyio
+async def test_applied_migrations_rechecks_negative_answers_after_the_ttl(db):
+    applied = AppliedMigrations(ttl_seconds=60)
+    assert not await applied.contains(db, "9001")
+    await run_migrations(db, [DoubleValue()], pause_seconds=0)
+    # Still within the TTL of the negative answer, in another process that did not run it
+    assert not await applied.contains(db, "9001")
+    applied.forget()
+    assert await applied.contains(db, "9001")
+
+    await db[STATE_COLLECTION].delete_many({})
+    assert await applied.contains(db, "9001")
+
+
+@pytest.mark.anyio
+async def test_native_types_migration_pads_legacy_dates(db):
+    await db.transactions.insert_one({"id": "t1", "user_id": "a@x", "amount": 12.5, "date": "2024-1-5", "month": "2024-1"})
+    await run_migrations(db, migrations.MIGRATIONS, target="0001", pause_seconds=0)
+
+    doc = await db.transactions.find_one({"id": "t1"})
+    assert (doc["date"], doc["month"], doc["amount_cents"]) == ("2024-01-05", "2024-01", 1250)
+    assert doc["date_at"] == datetime(2024, 1, 5)
@@ -0,0 +1,85 @@
+import pytest
+
+from people_balances import rebuild_person_ledgers, split_share_cents
+
+LEDGER_FIELDS = {"_id": 0, "updated_at": 0}
+
+
+async def ledgers(db):
+    return sorted(await db.person_ledgers.find({}, LEDGER_FIELDS).to_list(length=None), key=lambda ledger: ledger["person"])
+
+
+async def people(api):
+    return {person["name"]: person for person in (await api.get("/stats/people")).json()}
+
+
+async def add(api, account_id, **fields):
+    response = await api.post("/transactions/", json={
+        "type": "expense", "category": "Food", "date": "2024-01-01", "account_id": account_id, **fields,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+async def account(api):
+    return (await api.post("/accounts/", json={"name": "Checking", "balance": 0})).json()
+
+
+@pytest.mark.parametrize("amount_cents, participants, share", [
+    (900, 2, 300),
+    (1000, 2, 333),
+    (1001, 1, 501),  # 500.5 rounds half up
+    (5, 3, 1),
+    (0, 2, 0),
+])
+def test_split_share_cents(amount_cents, participants, share):
+    assert split_share_cents(amount_cents, participants) == share
+
+
+@pytest.mark.anyio
+async def test_direct_and_split_amounts_add_up_per_person(api, account):
+    await add(api, account["id"], amount=20, person="Bob")
+    await add(api, account["id"], type="income", category="Pay", amount=5.5, person="Bob")
+    await add(api, account["id"], amount=10, split_with=["Ann", "Bob"])
+
+    balances = await people(api)
+    assert balances["Bob"] == {"name": "Bob", "total_given": 20.0, "total_received": 8.83, "net_balance": -11.17, "transaction_count": 3}
+    assert balances["Ann"] == {"name": "Ann", "total_given": 0.0, "total_received": 3.33, "net_balance": 3.33, "transaction_count": 1}
+
+
+@pytest.mark.anyio
+async def test_incremental_updates_match_a_rebuild(api, db, account, user_id):
+    first = await add(api, account["id"], amount=3.33, person="Bob", split_with=["Ann"])
+    second = await add(api, account["id"], type="income", category="Pay", amount=1.01, person="Cy", split_with=["Ann", "Bob"])
+    await add(api, account["id"], amount=6.01, split_with=["Dee"])
+    updated = await api.put(f"/transactions/{first['id']}", json={**first, "person": "Cy", "split_with": ["Bob", "Dee"], "amount": 7.5})
+    assert updated.status_code == 200, updated.text
+    assert (await api.delete(f"/transactions/{second['id']}")).status_code == 200
+    incremental = await ledgers(db)
+
+    await rebuild_person_ledgers(db, user_id=user_id)
+    assert await ledgers(db) == incremental
+
+
+@pytest.mark.anyio
+async def test_rebuild_removes_ledgers_without_transactions(api, db, account, user_id):
+    await add(api, account["id"], amount=1, person="Bob")
+    await db.person_ledgers.insert_one({"user_id": user_id, "person": "Stale", "given_cents": 5, "direct_count": 1})
+
+    await rebuild_person_ledgers(db, user_id=user_id)
+    assert [ledger["person"] for ledger in await ledgers(db)] == ["Bob"]
+
+
+@pytest.mark.anyio
+async def test_settling_up_zeroes_the_balance(api, account):
+    await add(api, account["id"], amount=12, person="Bob")
+    await add(api, account["id"], amount=9, split_with=["Bob", "Ann"])
+
+    response = await api.post("/people/Bob/settle", json={"account_id": account["id"]})
+    assert response.status_code == 201, response.text
+    assert (response.json()["type"], response.json()["amount"]) == ("income", 9)
+    assert (await people(api))["Bob"]["net_balance"] == 0
+
+    again = await api.post("/people/Bob/settle", json={"account_id": account["id"]})
+    assert again.status_code == 400
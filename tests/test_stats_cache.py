@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from cache import TTLLRUCache, _MISSING, stats_cache
+
+
+async def add_expense(api, account_id, amount):
+    response = await api.post("/transactions/", json={
+        "type": "expense", "category": "Food", "amount": amount, "date": "2024-01-01", "account_id": account_id,
+    })
+    assert response.status_code == 200, response.text
+
+
+@pytest.mark.anyio
+async def test_repeated_stats_read_is_served_from_the_cache(api):
+    account = (await api.post("/accounts/", json={"name": "Checking", "balance": 0})).json()
+    await add_expense(api, account["id"], 5)
+    first = await api.get("/stats/dashboard")
+    hits = stats_cache.hits.value
+    second = await api.get("/stats/dashboard")
+
+    assert stats_cache.hits.value == hits + 1
+    assert second.json() == first.json()
+
+
+@pytest.mark.anyio
+async def test_write_invalidates_the_users_cached_stats(api):
+    account = (await api.post("/accounts/", json={"name": "Checking", "balance": 0})).json()
+    await add_expense(api, account["id"], 5)
+    before = (await api.get("/stats/dashboard")).json()
+    await add_expense(api, account["id"], 7)
+    after = (await api.get("/stats/dashboard")).json()
+
+    assert before["total_expenses"] == 5
+    assert after["total_expenses"] == 12
+
+
+@pytest.mark.anyio
+async def test_cache_key_includes_the_query_parameters(api):
+    first = (await api.post("/accounts/", json={"name": "Checking", "balance": 0})).json()
+    second = (await api.post("/accounts/", json={"name": "Savings", "balance": 0})).json()
+    await add_expense(api, first["id"], 5)
+    await add_expense(api, second["id"], 7)
+
+    totals = [(await api.get("/stats/dashboard", params={"account_id": account["id"]})).json()["total_expenses"]
+              for account in (first, second)]
+    assert totals == [5, 7]
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = TTLLRUCache("test_cache", max_entries=2, max_bytes=1000, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is _MISSING
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_entries_are_bounded_by_size():
+    cache = TTLLRUCache("test_cache", max_entries=10, max_bytes=10, ttl_seconds=60)
+    cache.set("big", b"x" * 11)
+    cache.set("a", b"x" * 6)
+    cache.set("b", b"x" * 6)
+
+    assert cache.get("big") is _MISSING
+    assert cache.get("a") is _MISSING
+    assert cache.get("b") == b"x" * 6
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    cache = TTLLRUCache("test_cache", max_entries=10, max_bytes=1000, ttl_seconds=60)
+    cache.set("a", 1)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+
+    assert cache.get("a") is _MISSING
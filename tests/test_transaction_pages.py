@@ -0,0 +1,61 @@
+import pytest
+
+from routes.transactions import SORT_OPTIONS
+
+
+async def create_transactions(api, count):
+    account = (await api.post("/accounts/", json={"name": "Checking", "balance": 0})).json()
+    for i in range(count):
+        # Few distinct dates, amounts and categories, so most pages end inside a run of equal sort values
+        response = await api.post("/transactions/", json={
+            "type": "expense",
+            "category": ["Food", "Rent", "Travel"][i % 3],
+            "amount": float(i % 4 + 1),
+            "date": f"2024-01-0{i % 2 + 1}",
+            "account_id": account["id"],
+        })
+        assert response.status_code == 200, response.text
+
+
+async def read_pages(api, sort, limit):
+    pages, cursor = [], None
+    while True:
+        params = {"sort": sort, "limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = await api.get("/transactions/", params=params)
+        assert response.status_code == 200, response.text
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("sort", sorted(SORT_OPTIONS))
+async def test_pages_cover_every_transaction_once_in_order(api, sort):
+    await create_transactions(api, 17)
+    unpaged = (await api.get("/transactions/", params={"sort": sort, "limit": 1000})).json()
+    pages = await read_pages(api, sort, limit=5)
+
+    assert [len(page) for page in pages] == [5, 5, 5, 2]
+    assert [row["id"] for page in pages for row in page] == [row["id"] for row in unpaged]
+    field, order = SORT_OPTIONS[sort]
+    keys = [(row[field], row["id"]) for row in unpaged]
+    assert keys == sorted(keys, reverse=order == -1)
+
+
+@pytest.mark.anyio
+async def test_last_full_page_has_no_cursor(api):
+    await create_transactions(api, 4)
+    response = await api.get("/transactions/", params={"limit": 4})
+    assert len(response.json()) == 4
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24", "WzEsMl0"])
+async def test_invalid_cursor_is_rejected(api, cursor):
+    response = await api.get("/transactions/", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid pagination cursor"